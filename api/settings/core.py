@@ -75,6 +75,7 @@ INSTALLED_APPS = [
     'countries',
     'payouts',
     'groups',
+    'shared',
 
     # Third party
     'polymorphic',
@@ -228,3 +229,84 @@ TRENCH_AUTH = {
         }
     }
 }
+
+# Theme rendering
+# Parsed Liquid templates are kept per worker and revalidated against S3 once the TTL (seconds) has passed.
+
+THEME_TEMPLATE_CACHE_SIZE = 256
+THEME_TEMPLATE_CACHE_TTL = 30
+
+# Theme template sources are mirrored to local disk so fragments can be read without a round trip to S3.
+
+THEME_MIRROR_DIR = os.environ.get('THEME_MIRROR_DIR', os.path.join('/tmp', 'enfront', 'themes'))
+THEME_MIRROR_TTL = 30
+
+# Rendered storefront pages, catalog snapshots and other derived data are kept in a cache shared by every worker so
+# that invalidating it from one request is seen by all of them. Set CACHE_REDIS_URL wherever more than one host
+# serves the API: the file based fallback is only shared by the workers of a single host, and a version bump made on
+# one host would leave the others serving stale pages.
+
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join('/tmp', 'enfront', 'cache')),
+            # room for the pages, catalog and theme config of every shop, the default of 300 entries culls them
+            # long before they expire
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
+STOREFRONT_PAGE_CACHE_TTL = 300
+CATALOG_SNAPSHOT_TTL = 3600
+THEME_CONFIG_CACHE_TTL = 300
+STOREFRONT_COLLECTION_PAGE_SIZE = 48
+
+# Longest time (seconds) checkout waits on the recaptcha and geolocation providers.
+
+CHECKOUT_CHECK_TIMEOUT = 5
+
+# Local IP range table used to locate buyers at checkout, built with `manage.py import_geoip`.
+
+GEOIP_DATABASE_PATH = os.environ.get('GEOIP_DATABASE_PATH', os.path.join(BASE_DIR, 'geoip.bin'))
+
+# Outgoing email is queued in the outbox and delivered by `manage.py send_emails`. Without an API URL (any
+# environment but live, unless one is given) the worker only logs the subjects. A worker holds the emails it claimed
+# for EMAIL_OUTBOX_CLAIM_TIMEOUT seconds while it sends them.
+
+MAILGUN_API_URL = os.environ.get(
+    'MAILGUN_API_URL',
+    'https://api.mailgun.net/v3/' if os.environ.get('PAYPAL_ENVIRONMENT') == 'LiveEnvironment' else None
+)
+MAILGUN_TIMEOUT = 10
+MAILGUN_BATCH_SIZE = 1000
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 300
+
+# Seconds an unpaid order keeps its items' stock reserved before `manage.py expire_orders` cancels it.
+
+STOCK_RESERVATION_TTL = 24 * 60 * 60
+
+# BTCPay invoices are mirrored locally for checkout polling. Open invoices whose webhooks did not arrive are
+# refreshed by `manage.py refresh_crypto_invoices` once their copy is older than this many seconds.
+
+CRYPTO_INVOICE_REFRESH_TTL = 30
+
+# The `best_sellers` storefront global lists this many listed products, ranked by units sold over the last this many
+# UTC days (None ranks over all time).
+
+STOREFRONT_BEST_SELLERS_COUNT = 8
+STOREFRONT_BEST_SELLERS_WINDOW = 30
+
+# Dashboard searches of orders and customers look at no more than this many matches of each kind (email, ref id,
+# product name) before ranking them.
+
+SEARCH_MAX_MATCHES = 1000
@@ -1,3 +1,40 @@
-from django.test import TestCase
+from rest_framework.test import APITestCase
+from rest_framework import status
 
-# Create your tests here.
+from uuid import uuid4
+
+from carts.models import Cart, CartItem
+from carts.views import get_cart_details
+from file_uploads.models import ItemImage
+from products.models import Product
+from shared.testing import create_test_shop
+
+
+class TestCartView(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = create_test_shop()
+
+        cls.cart = Cart.objects.create(shop=shop, user=uuid4())
+
+        for i in range(3):
+            product = Product.objects.create(shop=shop, name='Sword ' + str(i), price=500, stock=10, status=1)
+            ItemImage.objects.create(name='sword.png', original_name='sword.png', path='/media/items/sword.png',
+                                     size=1, item=product)
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=i + 1)
+
+    def test_cart_details_use_fixed_number_of_queries(self):
+        with self.assertNumQueries(2):
+            cart_details = get_cart_details(self.cart)
+
+        self.assertEqual(cart_details['items_amount'], 6)
+        self.assertEqual(cart_details['total'], 3000)
+        self.assertEqual(cart_details['items'][0]['images'][0]['path'], '/media/items/sword.png')
+
+    def test_get_cart(self):
+        self.client.cookies['_enfront_cid'] = str(self.cart.ref_id)
+        response = self.client.get('/api/v1/cart', secure=True)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['data']['cart_items']), 3)
+        self.assertEqual(response.data['data']['total'], 3000)
@@ -15,7 +15,7 @@ from .serializers import CartItemSerializer
 
 from shared.exceptions import CustomException
 from shared.services import get_url
-from products.serializers import PublicProductCartSerializer
+from products.serializers import PublicProductCartSerializer, get_images_prefetch
 from products.models import Product
 from shops.models import Shop
 
@@ -27,27 +27,42 @@ def get_users_cart(cart_ref):
         return None
 
 
-def get_users_cart_items(cart):
-    detailed_cart_items = []
-    cart_items = CartItem.objects.filter(cart=cart, quantity__gt=0, expires_at__gt=timezone.now())
+def has_cart_items(cart_ref):
+    if cart_ref is None:
+        return False
 
-    for cart_item in cart_items:
-        product = Product.objects.get(id=cart_item.product_id)
-        setattr(product, 'quantity', cart_item.quantity)
-        setattr(product, 'cart_ref_id', cart.ref_id)
+    return CartItem.objects.filter(cart__ref_id=cart_ref, quantity__gt=0, expires_at__gt=timezone.now()).exists()
 
-        product_data = PublicProductCartSerializer(product).data
-        detailed_cart_items.append(product_data)
 
-    return detailed_cart_items
+def get_cart_details(cart):
+    """
+    Loads the live items of a cart with their products and images in a fixed number of queries and returns the
+    serialized items together with the item count and total.
+    """
+    cart_details = {'items': [], 'items_amount': 0, 'total': 0}
 
+    if cart is None:
+        return cart_details
 
-def get_cart_total(cart_items):
-    total = 0
+    cart_items = CartItem.objects.filter(
+        cart=cart,
+        quantity__gt=0,
+        expires_at__gt=timezone.now()
+    ).select_related('product').prefetch_related(get_images_prefetch('product__itemimage_set'))
+
+    products = []
     for cart_item in cart_items:
-        total += cart_item['price'] * cart_item['quantity']
+        product = cart_item.product
+        setattr(product, 'quantity', cart_item.quantity)
+        setattr(product, 'cart_ref_id', cart.ref_id)
 
-    return total
+        cart_details['items_amount'] += cart_item.quantity
+        cart_details['total'] += product.price * cart_item.quantity
+        products.append(product)
+
+    cart_details['items'] = PublicProductCartSerializer(products, many=True).data
+
+    return cart_details
 
 
 def delete_cart_item(cart_id, item_id):
@@ -69,21 +84,27 @@ def delete_cart_item(cart_id, item_id):
     item.save()
 
 
+def retire_cart_items(cart_id, item_ids):
+    # same as delete_cart_item for many products at once, used when a cart is turned into an order
+    CartItem.objects.filter(
+        cart_id=cart_id,
+        product__ref_id__in=item_ids,
+        quantity__gt=0,
+        expires_at__gt=timezone.now()
+    ).update(quantity=0, expires_at=timezone.now())
+
+
 class CartView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
         cart_cookie = request.COOKIES.get('_enfront_cid')
 
-        cart = get_users_cart(cart_cookie)
-        cart_items = get_users_cart_items(cart)
-        total = get_cart_total(cart_items)
-
-        products = PublicProductCartSerializer(instance=cart_items, many=True).data
+        cart_details = get_cart_details(get_users_cart(cart_cookie))
 
         cart_info = {
-            'cart_items': products,
-            'total': total,
+            'cart_items': cart_details['items'],
+            'total': cart_details['total'],
         }
 
         data = {
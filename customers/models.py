@@ -12,6 +12,14 @@ class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
 
+    # lifetime order metrics, kept current as orders are linked to the customer and change status
+    order_count = models.IntegerField(default=0)
+    paid_order_count = models.IntegerField(default=0)
+    completed_order_count = models.IntegerField(default=0)
+    total_spent = models.BigIntegerField(default=0)
+    first_order_at = models.DateTimeField(blank=True, null=True)
+    last_order_at = models.DateTimeField(blank=True, null=True)
+
     class Meta:
         db_table = 'customer'
 
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchRank
+
+from shared.search import get_search_document, get_search_query
+
+from users.models import User
+
+# the fields of the search index on users
+USER_SEARCH_FIELDS = ('email', 'first_name', 'last_name')
+
+
+def search_customers(customers, text):
+    """
+    Narrows `customers` to the ones whose email or name has a word starting with each word of `text`, best matches
+    first and newest first among equals.
+    """
+    query = get_search_query(text)
+
+    if query is None:
+        return customers.none()
+
+    # the limit keeps postgres from folding the user match into the customer join, so it goes through the index
+    # instead of filtering every customer of the shop
+    users = (
+        User.objects.annotate(search=get_search_document(*USER_SEARCH_FIELDS))
+        .filter(search=query, customer__in=customers.values('id'))
+        .values('id')[:settings.SEARCH_MAX_MATCHES]
+    )
+    document = get_search_document(*['user__' + field for field in USER_SEARCH_FIELDS])
+
+    return (
+        customers.filter(user__in=users)
+        .alias(rank=SearchRank(document, query))
+        .order_by('-rank', '-user__created_at')
+    )
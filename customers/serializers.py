@@ -5,10 +5,7 @@ import decimal
 
 from .models import Customer, CustomerNote
 
-from orders.models import Order
-from orders.serializers import PublicOrderCheckoutSerializer
 from shared.exceptions import CustomException
-from shared.pagination import PaginationMixin
 from users.models import User
 from users.serializers import PublicUserInfoSerializer
 
@@ -79,60 +76,25 @@ class CustomerNoteSerializer(serializers.ModelSerializer):
 
 
 class PublicCustomerInfoSerializer(serializers.ModelSerializer):
-    completed_order_count = serializers.SerializerMethodField()
     user = PublicUserInfoSerializer()
 
-    def get_completed_order_count(self, customer):
-        try:
-            orders = Order.objects.filter(customer=customer, current_status__gte=3)
-            return orders.count()
-        except Customer.DoesNotExist:
-            return 0
-
     class Meta:
         model = Customer
         fields = ['user', 'completed_order_count']
 
 
-class PublicCustomerExpandedSerializer(PublicCustomerInfoSerializer, PaginationMixin):
-    all_order_count = serializers.SerializerMethodField()
+class PublicCustomerExpandedSerializer(PublicCustomerInfoSerializer):
+    all_order_count = serializers.IntegerField(source='order_count')
     total_spent = serializers.SerializerMethodField()
-    orders = serializers.SerializerMethodField()
     user = PublicUserInfoSerializer()
 
-    def get_all_order_count(self, customer):
-        try:
-            orders = Order.objects.filter(customer=customer)
-
-            return orders.count()
-        except Customer.DoesNotExist:
-            return 0
-
     def get_total_spent(self, customer):
-        try:
-            orders = Order.objects.filter(customer=customer)
-
-            total_spent = decimal.Decimal(0.00)
-            for order in orders:
-                if order.current_status == 3:
-                    total_spent += decimal.Decimal(order.total)
-
-            return total_spent
-        except Customer.DoesNotExist:
-            return 0
-
-    def get_orders(self, customer):
-        try:
-            orders = Order.objects.filter(customer=customer)
-            orders_data = PublicOrderCheckoutSerializer(orders, many=True).data
-
-            return orders_data
-        except Customer.DoesNotExist:
-            return []
+        return decimal.Decimal(customer.total_spent)
 
     class Meta:
         model = Customer
-        fields = ['completed_order_count', 'all_order_count', 'total_spent', 'orders', 'user']
+        fields = ['completed_order_count', 'paid_order_count', 'all_order_count', 'total_spent', 'first_order_at',
+                  'last_order_at', 'user']
 
 
 class PublicCustomerNoteSerializer(serializers.ModelSerializer):
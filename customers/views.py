@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
 from .models import Customer, CustomerNote
+from .search import search_customers
 from .serializers import (
     CustomerSerializer,
     CustomerNoteSerializer,
@@ -12,6 +13,8 @@ from .serializers import (
     PublicCustomerNoteSerializer
 )
 
+from orders.models import Order
+from orders.serializers import PublicOrderCheckoutSerializer
 from shared.pagination import PaginationMixin, CustomPagination
 from shared.exceptions import CustomException
 from users.models import User
@@ -32,13 +35,12 @@ class CustomerView(APIView, PaginationMixin):
             seach_query = request.query_params.get('q')
 
             if seach_query:
-                customers = (
-                    Customer.objects.filter(
-                        shop__owner=request.user, shop__ref_id=shop_ref,user__email__contains=seach_query
-                    ).order_by('-user__created_at')
+                customers = search_customers(
+                    Customer.objects.filter(shop__owner=request.user, shop__ref_id=shop_ref).select_related('user'),
+                    seach_query
                 )
 
-                if not customers:
+                if not customers.exists():
                     data = {
                         'success': False,
                         'message': 'Customer(s) that match your criteria were not found.',
@@ -51,7 +53,7 @@ class CustomerView(APIView, PaginationMixin):
             else:
                 customers = Customer.objects.filter(
                     shop__owner=request.user, shop__ref_id=shop_ref
-                ).order_by("-user__created_at")
+                ).select_related('user').order_by("-user__created_at")
 
             page = self.paginate_queryset(customers)
             if page is not None:
@@ -68,12 +70,17 @@ class CustomerView(APIView, PaginationMixin):
 
         if shop_ref is not None and customer_ref is not None:
             try:
-                customer = Customer.objects.get(shop__owner=request.user, user__ref_id=customer_ref)
+                customer = Customer.objects.select_related('user').get(
+                    shop__owner=request.user, user__ref_id=customer_ref
+                )
                 customer_data = PublicCustomerExpandedSerializer(customer).data
 
-                page = self.paginate_queryset(customer_data['orders'])
+                # only the requested page of the customer's history is loaded
+                orders = Order.objects.filter(customer=customer).select_related('shop').order_by('-created_at')
+                page = self.paginate_queryset(orders)
                 if page is not None:
-                    customer_data['orders'] = self.get_paginated_response(page).data
+                    orders_page = PublicOrderCheckoutSerializer(page, many=True).data
+                    customer_data['orders'] = self.get_paginated_response(orders_page).data
 
             except Customer.DoesNotExist:
                 data = {
@@ -8,5 +8,29 @@ python3 manage.py makemigrations
 echo "Apply database migrations"
 python3 manage.py migrate
 
+# Background workers are restarted whenever they exit. They claim their rows with SKIP LOCKED, so every container
+# can run them; set RUN_WORKERS=0 where they run in a container of their own instead.
+run_worker() {
+    while true; do
+        python3 manage.py "$@"
+        echo "Worker $1 exited, restarting"
+        sleep 5
+    done
+}
+
+if [ "${RUN_WORKERS:-1}" = "1" ]; then
+    # Send queued emails
+    echo "Start email worker"
+    run_worker send_emails --interval 5 &
+
+    # Cancel unpaid orders once they expire and give their reserved stock back
+    echo "Start order expiry worker"
+    run_worker expire_orders --interval 60 &
+
+    # Refresh open BTCPay invoices whose webhooks did not arrive
+    echo "Start crypto invoice worker"
+    run_worker refresh_crypto_invoices --interval 30 &
+fi
+
 # Run Gunicorn start command
-exec "$@"
\ No newline at end of file
+exec "$@"
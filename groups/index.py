@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Collection
+from .serializers import CollectionIndexSerializer
+
+
+def build_collection_index(shop_id):
+    """
+    Collection metadata of a shop with the ref ids of their products in the order they were added. Products are
+    resolved against the catalog when a page needs them.
+    """
+    product_refs = {}
+    collection_products = Collection.products.through.objects.filter(collection__shop_id=shop_id).order_by('id')
+
+    for collection_id, product_ref in collection_products.values_list('collection_id', 'product__ref_id'):
+        product_refs.setdefault(collection_id, []).append(str(product_ref))
+
+    collection_index = {'collections': [], 'slugs': {}}
+
+    for collection in Collection.objects.filter(shop_id=shop_id).order_by('id'):
+        collection_data = dict(CollectionIndexSerializer(collection).data)
+        collection_data['products'] = product_refs.get(collection.id, [])
+
+        collection_index['slugs'].setdefault(collection.slug, len(collection_index['collections']))
+        collection_index['collections'].append(collection_data)
+
+    return collection_index
+
+
+def get_collection_index(shop_id, version):
+    # keyed by the shop's storefront version, which every collection, product and theme change bumps
+    index_key = ':'.join(['collections', str(shop_id), version])
+    collection_index = cache.get(index_key)
+
+    if collection_index is None:
+        collection_index = build_collection_index(shop_id)
+        cache.set(index_key, collection_index, settings.STOREFRONT_PAGE_CACHE_TTL)
+
+    return collection_index
+
+
+def get_indexed_collection(shop_id, version, slug):
+    collection_index = get_collection_index(shop_id, version)
+    position = collection_index['slugs'].get(slug)
+
+    return None if position is None else collection_index['collections'][position]
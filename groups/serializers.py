@@ -1,9 +1,10 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 from .models import Collection
 
 from products.models import Product
-from products.serializers import PublicProductSerializer
+from products.serializers import PublicProductSerializer, get_images_prefetch
 from shops.models import Shop
 
 
@@ -46,6 +47,10 @@ class CollectionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+def get_collection_products_prefetch():
+    return Prefetch('products', queryset=Product.objects.prefetch_related(get_images_prefetch()))
+
+
 class PublicCollectionSerializer(serializers.ModelSerializer):
     products = serializers.SerializerMethodField()
 
@@ -55,3 +60,9 @@ class PublicCollectionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Collection
         fields = ['ref_id', 'title', 'slug', 'products', 'created_at', 'updated_at', 'products']
+
+
+class CollectionIndexSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Collection
+        fields = ['ref_id', 'title', 'slug', 'created_at', 'updated_at']
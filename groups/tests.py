@@ -1,12 +1,17 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 
 from countries.models import Country
+from groups.index import get_indexed_collection
 from groups.models import Collection
 from products.models import Product
+from shared.testing import create_test_shop
 from shops.models import Shop
 from users.models import User
 from themes.models import Theme, ThemeConfiguration
+from themes.views import ThemeTemplateView
 
 
 class TestShopView(APITestCase):
@@ -211,3 +216,40 @@ class TestShopView(APITestCase):
 
         delete_response = self.client.delete('/api/v1/collections/84e8c5d7-5b05-4532-a9b8-3eb7f5f7b6cc', secure=True)
         self.assertEqual(delete_response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    STOREFRONT_COLLECTION_PAGE_SIZE=2,
+)
+class TestCollectionIndex(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop(name='castleblack', domain='https://castleblack.com')
+        other_shop = create_test_shop(name='winterfell', domain='https://winterfell.com', owner=cls.shop.owner,
+                                      country=cls.shop.country)
+
+        collection = Collection.objects.create(title='Swords', slug='swords', shop=cls.shop)
+        Collection.objects.create(title='Wolves', slug='wolves', shop=other_shop)
+
+        for name in ('Longclaw', 'Ice', 'Needle'):
+            product = Product.objects.create(shop=cls.shop, name=name, slug=name.lower(), price=500, status=1)
+            collection.products.add(product)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_collection_slug_is_scoped_to_shop(self):
+        self.assertEqual(get_indexed_collection(self.shop.id, 'v1', 'swords')['title'], 'Swords')
+        self.assertIsNone(get_indexed_collection(self.shop.id, 'v1', 'wolves'))
+
+    def test_collection_products_are_paginated(self):
+        view = ThemeTemplateView()
+
+        first_page = view.get_products(self.shop, 'v1', 'swords')
+        second_page = view.get_products(self.shop, 'v1', 'swords', '2')
+
+        self.assertEqual([product['name'] for product in first_page['products']], ['Longclaw', 'Ice'])
+        self.assertEqual(first_page['pagination']['next_page'], 2)
+        self.assertEqual([product['name'] for product in second_page['products']], ['Needle'])
+        self.assertIsNone(second_page['pagination']['next_page'])
@@ -3,7 +3,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 
 from .models import Collection
-from .serializers import CollectionSerializer, PublicCollectionSerializer
+from .serializers import CollectionSerializer, PublicCollectionSerializer, get_collection_products_prefetch
 
 from shared.exceptions import CustomException
 
@@ -21,7 +21,11 @@ class CollectionView(APIView):
             )
 
     def get(self, request):
-        collection = Collection.objects.filter(shop__owner=request.user).order_by('title')
+        collection = (
+            Collection.objects.filter(shop__owner=request.user)
+            .prefetch_related(get_collection_products_prefetch())
+            .order_by('title')
+        )
 
         if collection.exists():
             collection_data = PublicCollectionSerializer(collection, many=True).data
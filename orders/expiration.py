@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Order, OrderItem, OrderStatus, OrderItemStatus
+
+from products.stock import release_stock
+
+
+def expire_order_batch(batch_size):
+    """
+    Cancels up to `batch_size` orders that are still waiting for payment (or were denied) after their expiry date,
+    along with their items, and records the status change of each. Stock reserved for the items is given back.
+    Returns the number of orders expired.
+
+    Rows are claimed with SKIP LOCKED so several sweepers, or a payment webhook holding an order, never block on
+    each other.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        order_ids = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(Q(current_status=-2) | Q(current_status=0), expires_at__lt=now)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+
+        if not order_ids:
+            return 0
+
+        items = list(
+            OrderItem.objects.filter(order__id__in=order_ids)
+            .values_list('id', 'product_id', 'quantity', 'current_status')
+        )
+        item_ids = [item_id for item_id, _, _, _ in items]
+
+        # only pending items hold a reservation, the others were created out of stock
+        reserved_quantities = {}
+        for _, product_id, quantity, current_status in items:
+            if current_status == OrderItem.PENDING:
+                reserved_quantities[product_id] = reserved_quantities.get(product_id, 0) + quantity
+
+        Order.objects.filter(id__in=order_ids).update(current_status=-1, updated_at=now)
+        OrderItem.objects.filter(id__in=item_ids).update(current_status=-1)
+
+        OrderStatus.objects.bulk_create([OrderStatus(order_id=order_id, status=-1) for order_id in order_ids])
+        OrderItemStatus.objects.bulk_create([OrderItemStatus(item_id=item_id, status=-1) for item_id in item_ids])
+
+        release_stock(reserved_quantities)
+
+    return len(order_ids)
+
+
+def expire_orders(batch_size):
+    expired = 0
+
+    while True:
+        batch_expired = expire_order_batch(batch_size)
+        expired += batch_expired
+
+        if batch_expired < batch_size:
+            return expired
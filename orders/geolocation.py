@@ -0,0 +1,200 @@
+from django.conf import settings
+
+import os
+import csv
+import mmap
+import struct
+import logging
+import ipaddress
+import threading
+
+
+# File layout: header, records sorted by range start, then the string table the records point into. Addresses are
+# stored as IPv6 integers (IPv4 mapped) so both families share one table.
+MAGIC = b'ENGEO001'
+HEADER = struct.Struct('>8sII')
+RECORD = struct.Struct('>QQQQIIIffB3x')
+NO_STRING = 0xFFFFFFFF
+
+
+def ip_to_int(ip_address):
+    address = ipaddress.ip_address(ip_address)
+
+    if address.version == 4:
+        address = ipaddress.IPv6Address('::ffff:' + str(address))
+
+    return int(address)
+
+
+def split_int(value):
+    return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+class GeoDatabaseWriter:
+    def __init__(self):
+        self.records = []
+        self.strings = bytearray()
+        self.string_offsets = {}
+
+    def add_string(self, value):
+        if not value:
+            return NO_STRING
+
+        if value not in self.string_offsets:
+            encoded = value.encode()
+            self.string_offsets[value] = len(self.strings)
+            self.strings += struct.pack('>H', len(encoded)) + encoded
+
+        return self.string_offsets[value]
+
+    def add_range(self, ip_start, ip_end, country, region, city, latitude, longitude, is_vpn):
+        self.records.append((
+            ip_to_int(ip_start),
+            ip_to_int(ip_end),
+            self.add_string(country),
+            self.add_string(region),
+            self.add_string(city),
+            float(latitude or 'nan'),
+            float(longitude or 'nan'),
+            1 if is_vpn else 0,
+        ))
+
+    def write(self, path):
+        self.records.sort()
+
+        temp_path = path + '.tmp' + str(os.getpid())
+        with open(temp_path, 'wb') as database_file:
+            database_file.write(HEADER.pack(MAGIC, len(self.records), HEADER.size + len(self.records) * RECORD.size))
+
+            for start, end, country, region, city, latitude, longitude, is_vpn in self.records:
+                database_file.write(RECORD.pack(
+                    *split_int(start), *split_int(end), country, region, city, latitude, longitude, is_vpn
+                ))
+
+            database_file.write(self.strings)
+
+        # workers keep reading the old mapping until they notice the new file
+        os.replace(temp_path, path)
+
+
+def import_csv(csv_file, path):
+    """
+    Builds a database from a CSV range dump with the columns ip_start, ip_end, country, region, city, latitude,
+    longitude and is_vpn. Returns the number of ranges written.
+    """
+    writer = GeoDatabaseWriter()
+
+    for row in csv.DictReader(csv_file):
+        writer.add_range(
+            row['ip_start'],
+            row['ip_end'],
+            row.get('country'),
+            row.get('region'),
+            row.get('city'),
+            row.get('latitude'),
+            row.get('longitude'),
+            row.get('is_vpn', '').strip().lower() in ('1', 'true', 'yes'),
+        )
+
+    writer.write(path)
+    return len(writer.records)
+
+
+class GeoDatabase:
+    """
+    Read-only view of a range table. The file is memory mapped, so every worker on the host shares the same pages,
+    and lookups are a binary search over the fixed size records.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as database_file:
+            self.mtime = os.fstat(database_file.fileno()).st_mtime
+            self.data = mmap.mmap(database_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count, self.strings_offset = HEADER.unpack_from(self.data, 0)
+
+        if magic != MAGIC:
+            raise ValueError(path + ' is not a geolocation database.')
+
+    def get_record(self, index):
+        return RECORD.unpack_from(self.data, HEADER.size + index * RECORD.size)
+
+    def get_string(self, offset):
+        if offset == NO_STRING:
+            return None
+
+        position = self.strings_offset + offset
+        length = struct.unpack_from('>H', self.data, position)[0]
+
+        return self.data[position + 2:position + 2 + length].decode()
+
+    def find(self, ip_address):
+        try:
+            key = split_int(ip_to_int(ip_address))
+        except ValueError:
+            return None
+
+        # last range starting at or before the address
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+
+            if self.get_record(middle)[:2] <= key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == 0:
+            return None
+
+        record = self.get_record(low - 1)
+        if record[2:4] < key:
+            return None
+
+        country, region, city, latitude, longitude, is_vpn = record[4:]
+
+        return {
+            'ip_address': ip_address,
+            'security': {'is_vpn': bool(is_vpn)},
+            'longitude': None if longitude != longitude else round(longitude, 4),
+            'latitude': None if latitude != latitude else round(latitude, 4),
+            'city': self.get_string(city),
+            'region': self.get_string(region),
+            'postal_code': None,
+            'country': self.get_string(country),
+        }
+
+
+geo_database = None
+geo_database_lock = threading.Lock()
+
+
+def get_geo_database():
+    global geo_database
+
+    path = settings.GEOIP_DATABASE_PATH
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    if geo_database is None or geo_database.mtime != mtime:
+        with geo_database_lock:
+            if geo_database is None or geo_database.mtime != mtime:
+                try:
+                    geo_database = GeoDatabase(path)
+                except (OSError, ValueError) as error:
+                    logging.warning('Could not load geolocation database: %s', error)
+                    return None
+
+    return geo_database
+
+
+def find_location(ip_address):
+    database = get_geo_database()
+
+    if database is None or ip_address is None:
+        return None
+
+    return database.find(ip_address)
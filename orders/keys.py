@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.utils import timezone
+
+import logging
+
+from .models import OrderItem
+
+from products.models import DigitalProduct
+
+
+def claim_keys(product_id, quantity, email_address, now):
+    """
+    Marks up to `quantity` listed keys of a product as purchased by `email_address` and returns their (id, key)
+    pairs. Keys another checkout has locked are skipped rather than waited on, so two orders never get the same key.
+    """
+    keys = list(
+        DigitalProduct.objects.select_for_update(skip_locked=True)
+        .filter(product_id=product_id, status=DigitalProduct.LISTED)
+        .order_by('id')
+        .values_list('id', 'key')[:quantity]
+    )
+
+    DigitalProduct.objects.filter(id__in=[key_id for key_id, _ in keys]).update(
+        status=DigitalProduct.PURCHASED,
+        recipient_email=email_address,
+        updated_at=now,
+    )
+
+    return keys
+
+
+def allocate_keys(order_items, email_address):
+    """
+    Claims the keys for every item of an order and links them to the items. Returns the claimed keys per item id.
+    """
+    now = timezone.now()
+    allocated_keys = {}
+    purchased_keys = []
+
+    with transaction.atomic():
+        for order_item in order_items:
+            keys = claim_keys(order_item.product_id, order_item.quantity, email_address, now)
+
+            if len(keys) < order_item.quantity:
+                logging.warning('Order item %s got %s of %s keys.', order_item.id, len(keys), order_item.quantity)
+
+            allocated_keys[order_item.id] = [key for _, key in keys]
+            purchased_keys += [
+                OrderItem.purchased_keys.through(orderitem_id=order_item.id, digitalproduct_id=key_id)
+                for key_id, _ in keys
+            ]
+
+        OrderItem.purchased_keys.through.objects.bulk_create(purchased_keys)
+
+    return allocated_keys
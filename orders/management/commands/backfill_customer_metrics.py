@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from customers.models import Customer
+from orders.stats import rebuild_customer_metrics
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the lifetime order metrics of customers from their orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop-id', type=int, default=None, help='Only rebuild the customers of this shop.')
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.all()
+
+        if options['shop_id'] is not None:
+            customers = customers.filter(shop_id=options['shop_id'])
+
+        updated = rebuild_customer_metrics(customers)
+        self.stdout.write('Updated ' + str(updated) + ' customers.')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders.stats import backfill_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily shop stats from the raw orders, payments and customers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop-id', type=int, default=None, help='Only rebuild the stats of this shop.')
+
+    def handle(self, *args, **options):
+        days = backfill_daily_stats(options['shop_id'])
+        self.stdout.write('Wrote ' + str(days) + ' days of stats.')
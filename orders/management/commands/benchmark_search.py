@@ -0,0 +1,148 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from uuid import uuid4
+
+import random
+import statistics
+import time
+
+from countries.models import Country
+from customers.models import Customer
+from customers.search import search_customers
+from orders.models import Order
+from orders.search import search_orders
+from products.models import Product
+from shops.models import Shop
+from users.models import User
+
+# latency a dashboard search has to stay under, counted like the API does: the total for the paginator plus a page
+TARGET_MS = 50
+PAGE_SIZE = 50
+
+FIRST_NAMES = ['Jon', 'Arya', 'Sansa', 'Bran', 'Samwell', 'Gilly', 'Davos', 'Brienne', 'Tormund', 'Podrick']
+PRODUCT_NAMES = ['Longclaw', 'Needle', 'Oathkeeper', 'Hearteater', 'Widowswail', 'Dawn', 'Ice', 'Lightbringer']
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills a throwaway shop with orders, customers and products and times the dashboard searches against it. '
+        'Everything is rolled back when it is done.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--customers', type=int, default=50000)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--runs', type=int, default=20, help='Times every search is repeated.')
+
+    def seed(self, options):
+        owner = User.objects.create(email='owner@benchmark.test')
+        country = Country.objects.create(num_code=0, iso_2='ZZ', iso_3='ZZZ', name='Benchmark', continent='None')
+        shop = Shop.objects.create(name='Benchmark', email='owner@benchmark.test', owner=owner, country=country,
+                                   domain='https://' + uuid4().hex + '.benchmark.test')
+
+        products = Product.objects.bulk_create([
+            Product(shop=shop, name=PRODUCT_NAMES[n % len(PRODUCT_NAMES)] + ' ' + str(n), price=500, status=1)
+            for n in range(options['products'])
+        ])
+
+        # rows are generated by postgres, building a million model instances would take longer than the searches
+        with connection.cursor() as cursor:
+            cursor.execute(
+                '''
+                WITH new_users AS (
+                    INSERT INTO "user" (password, is_superuser, created_at, updated_at, email, first_name, last_name,
+                                        subscription_tier, is_active, last_login, ref_id)
+                    SELECT '', false, now(), now(), 'buyer' || n || '@mail' || (n %% 100) || '.com',
+                           (%s::text[])[1 + n %% %s], 'Buyer' || n, 0, false, now(), gen_random_uuid()
+                    FROM generate_series(1, %s) n
+                    RETURNING id
+                )
+                INSERT INTO customer (user_id, shop_id, order_count, paid_order_count, completed_order_count,
+                                      total_spent)
+                SELECT id, %s, 0, 0, 0, 0 FROM new_users
+                ''',
+                [FIRST_NAMES, len(FIRST_NAMES), options['customers'], shop.id]
+            )
+            cursor.execute(
+                '''
+                INSERT INTO "order" (created_at, updated_at, email, shop_id, currency, email_sent, ref_id, expires_at,
+                                     total, current_status)
+                SELECT now() - n * interval '1 minute', now(), 'buyer' || (n %% %s) || '@mail' || (n %% %s %% 100)
+                       || '.com', %s, 'USD', true, gen_random_uuid(), now(), 500 + n %% 1000, 3
+                FROM generate_series(1, %s) n
+                ''',
+                [options['customers'], options['customers'], shop.id, options['orders']]
+            )
+            cursor.execute(
+                '''
+                WITH shop_orders AS (
+                    SELECT id, row_number() OVER (ORDER BY id) AS n FROM "order" WHERE shop_id = %s
+                ),
+                new_items AS (
+                    INSERT INTO order_item (quantity, product_id, current_status, price)
+                    SELECT 1, (%s::bigint[])[1 + n %% %s], 2, 500 FROM shop_orders
+                    RETURNING id
+                )
+                INSERT INTO order_items_map (order_id, orderitem_id)
+                SELECT shop_orders.id, numbered_items.id
+                FROM shop_orders
+                JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n FROM new_items) numbered_items USING (n)
+                ''',
+                [shop.id, [product.id for product in products], len(products)]
+            )
+            cursor.execute('ANALYZE "user", customer, "order", order_item, order_items_map, product')
+
+        return shop, owner
+
+    def time_search(self, name, get_results, runs):
+        timings = []
+
+        for _ in range(runs):
+            started_at = time.perf_counter()
+            results = get_results()
+            total = results.count()
+            list(results[:PAGE_SIZE])
+            timings.append((time.perf_counter() - started_at) * 1000)
+
+        median = statistics.median(timings)
+        slowest = max(timings)
+
+        self.stdout.write('{:<16} {:>8} matches  median {:>7.1f} ms  slowest {:>7.1f} ms  {}'.format(
+            name, total, median, slowest, 'ok' if median < TARGET_MS else 'SLOW'
+        ))
+
+    def handle(self, *args, **options):
+        random.seed(0)
+
+        with transaction.atomic():
+            started_at = time.perf_counter()
+            shop, owner = self.seed(options)
+            self.stdout.write('Seeded ' + str(options['orders']) + ' orders in ' +
+                              str(round(time.perf_counter() - started_at)) + ' s.')
+
+            # the same lookups the dashboard views search with
+            shop_filters = {'shop__owner': owner, 'shop__ref_id': shop.ref_id}
+            orders = Order.objects.filter(shop=shop)
+            customers = Customer.objects.filter(shop__owner=owner, shop__ref_id=shop.ref_id).select_related('user')
+            buyer = random.randrange(options['customers'])
+            order = orders.order_by('id')[random.randrange(options['orders'])]
+
+            searches = {
+                'email word': lambda: search_orders('buyer' + str(buyer), **shop_filters),
+                'full email': lambda: search_orders(
+                    'buyer' + str(buyer) + '@mail' + str(buyer % 100) + '.com', **shop_filters
+                ),
+                'ref id prefix': lambda: search_orders(str(order.ref_id)[:8], **shop_filters),
+                'product name': lambda: search_orders(PRODUCT_NAMES[2], **shop_filters),
+                'customer name': lambda: search_customers(
+                    customers, FIRST_NAMES[buyer % len(FIRST_NAMES)] + ' buyer' + str(buyer)
+                ),
+                'customer email': lambda: search_customers(customers, 'buyer' + str(buyer) + '@'),
+            }
+
+            for name, get_results in searches.items():
+                self.time_search(name, get_results, options['runs'])
+
+            transaction.set_rollback(True)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+import time
+
+from orders.expiration import expire_orders
+
+
+class Command(BaseCommand):
+    help = 'Cancels orders that were not paid before they expired.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Keep running and sweep again every given number of seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_orders(options['batch_size'])
+            self.stdout.write('Expired ' + str(expired) + ' orders.')
+
+            if options['interval'] is None:
+                return
+
+            time.sleep(options['interval'])
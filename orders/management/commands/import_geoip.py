@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from orders.geolocation import import_csv
+
+
+class Command(BaseCommand):
+    help = 'Builds the local IP geolocation database from a CSV range dump.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV with ip_start, ip_end, country, region, city, latitude, longitude '
+                                             'and is_vpn columns.')
+        parser.add_argument('--output', default=settings.GEOIP_DATABASE_PATH)
+
+    def handle(self, *args, **options):
+        with open(options['csv_path'], 'r', encoding='utf_8', newline='') as csv_file:
+            count = import_csv(csv_file, options['output'])
+
+        self.stdout.write(self.style.SUCCESS('Imported ' + str(count) + ' ranges into ' + options['output'] + '.'))
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.1 on 2026-10-18 04:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0011_shop_description'),
+        ('orders', '0023_alter_order_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('fees', models.BigIntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('new_customers', models.IntegerField(default=0)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shops.shop')),
+            ],
+            options={
+                'db_table': 'shop_daily_stats',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shopdailystats',
+            constraint=models.UniqueConstraint(fields=('shop', 'day'), name='shop_daily_stats_unique_day'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.1.1 on 2026-10-18 04:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_alter_product_price'),
+        ('shops', '0011_shop_description'),
+        ('orders', '0024_shopdailystats_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shops.shop')),
+            ],
+            options={
+                'db_table': 'product_sales_total',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shops.shop')),
+            ],
+            options={
+                'db_table': 'product_daily_sales',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productsalestotal',
+            index=models.Index(fields=['shop', '-units'], name='product_sales_units_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsalestotal',
+            index=models.Index(fields=['shop', '-revenue'], name='product_sales_revenue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productdailysales',
+            index=models.Index(fields=['shop', 'day'], name='product_daily_sales_shop_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productdailysales',
+            constraint=models.UniqueConstraint(fields=('product', 'day'), name='product_daily_sales_unique_day'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.1 on 2026-10-18 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0026_order_order_search_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='current_status',
+            field=models.SmallIntegerField(blank=True, choices=[(-7, 'needs refund'), (-6, 'chargeback won'), (-5, 'chargeback lost'), (-4, 'chargeback pending'), (-3, 'refunded'), (-2, 'denied'), (-1, 'cancelled'), (0, 'waiting for payment'), (1, 'payment confirmed'), (2, 'pending'), (3, 'complete')], default=0),
+        ),
+        migrations.AlterField(
+            model_name='orderstatus',
+            name='status',
+            field=models.SmallIntegerField(choices=[(-7, 'needs refund'), (-6, 'chargeback won'), (-5, 'chargeback lost'), (-4, 'chargeback pending'), (-3, 'refunded'), (-2, 'denied'), (-1, 'cancelled'), (0, 'waiting for payment'), (1, 'payment confirmed'), (2, 'pending'), (3, 'complete')], default=0),
+        ),
+    ]
@@ -1,11 +1,15 @@
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.db import models, transaction
 from django.utils import timezone
+from django.db.models.functions import Greatest, Least
 from django.core.validators import MinValueValidator, MaxValueValidator
 
-from datetime import timedelta
+from datetime import timedelta, timezone as dt_timezone
 from uuid import uuid4
 
 from shared.models import TimestampedModel
+from shared.search import get_search_document
 from products.models import Product, DigitalProduct
 from shops.models import Shop
 from users.models import User
@@ -13,7 +17,64 @@ from customers.models import Customer
 
 
 def get_order_expire_date():
-    return timezone.now() + timedelta(days=1)
+    # unpaid orders hold their stock reservations until they expire
+    return timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+
+
+def is_paid_status(status):
+    # paid orders count as sales until they are refunded or charged back, and again once the shop wins a chargeback
+    return status >= Order.PAYMENT_CONFIRMED or status == Order.CHARGEBACK_WON
+
+
+def is_complete_status(status):
+    return status in (Order.COMPLETE, Order.CHARGEBACK_WON)
+
+
+def get_paid_filter(field='current_status'):
+    # the queryset form of is_paid_status
+    return models.Q(**{field + '__gte': Order.PAYMENT_CONFIRMED}) | models.Q(**{field: Order.CHARGEBACK_WON})
+
+
+def get_complete_filter(field='current_status'):
+    return models.Q(**{field + '__in': (Order.COMPLETE, Order.CHARGEBACK_WON)})
+
+
+def get_status_metrics(status):
+    return int(is_paid_status(status)), int(is_complete_status(status))
+
+
+def check_transition_path(transitions, statuses):
+    for current_status, next_status in zip(statuses, statuses[1:]):
+        if next_status not in transitions.get(current_status, ()):
+            raise ValueError('Status ' + str(current_status) + ' cannot move to ' + str(next_status) + '.')
+
+
+def get_transition_sources(transitions, status):
+    return [current_status for current_status, next_statuses in transitions.items() if status in next_statuses]
+
+
+class OrderItemQuerySet(models.QuerySet):
+    def transition(self, *statuses):
+        """
+        Moves every item whose current status allows it through `statuses`, recording a status row for each step,
+        and returns the ids of the items that were moved. Items are locked while they are moved, so a concurrent
+        call sees the new status and skips them.
+        """
+        check_transition_path(OrderItem.TRANSITIONS, statuses)
+        sources = get_transition_sources(OrderItem.TRANSITIONS, statuses[0])
+
+        with transaction.atomic():
+            item_ids = list(
+                self.select_for_update().filter(current_status__in=sources).values_list('id', flat=True)
+            )
+
+            if item_ids:
+                OrderItem.objects.filter(id__in=item_ids).update(current_status=statuses[-1])
+                OrderItemStatus.objects.bulk_create([
+                    OrderItemStatus(item_id=item_id, status=status) for item_id in item_ids for status in statuses
+                ])
+
+        return item_ids
 
 
 class OrderItem(models.Model):
@@ -29,17 +90,29 @@ class OrderItem(models.Model):
         (DELIVERED, 'delivered'),
     )
 
+    # items created without enough stock start at -2, and the items of an expired order are still delivered when a
+    # slow payment settles afterwards
+    TRANSITIONS = {
+        -2: (CANCELLED, SHIPPED),
+        CANCELLED: (SHIPPED,),
+        PENDING: (CANCELLED, SHIPPED),
+        SHIPPED: (DELIVERED,),
+    }
+
     quantity = models.PositiveIntegerField(default=0)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     purchased_keys = models.ManyToManyField(DigitalProduct, db_table='order_digital_items_map', blank=True)
     current_status = models.SmallIntegerField(choices=STATUS_CHOICES, default=PENDING)
     price = models.BigIntegerField(validators=[MinValueValidator(0.49), MaxValueValidator(99999.99)])
 
+    objects = OrderItemQuerySet.as_manager()
+
     class Meta:
         db_table = 'order_item'
 
 
 class Order(TimestampedModel):
+    NEEDS_REFUND = -7
     CHARGEBACK_WON = -6
     CHARGEBACK_LOST = -5
     CHARGEBACK_PENDING = -4
@@ -52,6 +125,7 @@ class Order(TimestampedModel):
     COMPLETE = 3
 
     STATUS_CHOICES = (
+        (NEEDS_REFUND, 'needs refund'),
         (CHARGEBACK_WON, 'chargeback won'),
         (CHARGEBACK_LOST, 'chargeback lost'),
         (CHARGEBACK_PENDING, 'chargeback pending'),
@@ -64,6 +138,19 @@ class Order(TimestampedModel):
         (COMPLETE, 'complete'),
     )
 
+    # an order that expired can still be paid when a slow payment settles afterwards, and needs a refund when its
+    # stock ran out in the meantime
+    TRANSITIONS = {
+        WAITING_FOR_PAYMENT: (DENIED, CANCELLED, PAYMENT_CONFIRMED),
+        DENIED: (CANCELLED, PAYMENT_CONFIRMED),
+        CANCELLED: (PAYMENT_CONFIRMED,),
+        PAYMENT_CONFIRMED: (PENDING, REFUNDED),
+        PENDING: (COMPLETE, REFUNDED, NEEDS_REFUND),
+        NEEDS_REFUND: (REFUNDED,),
+        COMPLETE: (REFUNDED, CHARGEBACK_PENDING),
+        CHARGEBACK_PENDING: (CHARGEBACK_WON, CHARGEBACK_LOST),
+    }
+
     email = models.EmailField(unique=False, blank=True, null=True)
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, blank=True, null=True)
@@ -80,11 +167,60 @@ class Order(TimestampedModel):
         null=False
     )
 
+    def transition(self, *statuses):
+        """
+        Moves the order through `statuses` with a conditional UPDATE and records a status row for each step. Returns
+        False without changing anything when the order's current status does not allow the first step, e.g. when a
+        payment webhook is delivered twice.
+        """
+        check_transition_path(self.TRANSITIONS, statuses)
+        sources = get_transition_sources(self.TRANSITIONS, statuses[0])
+
+        # sources that count the same in the stats are tried with one UPDATE each, so the one that matched tells
+        # what changed, most steps only have one such group
+        source_groups = {}
+        for source in sources:
+            source_groups.setdefault(get_status_metrics(source), []).append(source)
+
+        is_moved = False
+        with transaction.atomic():
+            for metrics, group in source_groups.items():
+                is_moved = Order.objects.filter(id=self.id, current_status__in=group).update(
+                    current_status=statuses[-1],
+                    updated_at=timezone.now(),
+                )
+
+                if is_moved:
+                    break
+
+            if is_moved:
+                OrderStatus.objects.bulk_create([OrderStatus(order_id=self.id, status=status) for status in statuses])
+
+                paid_sign, complete_sign = (
+                    next_metric - metric for next_metric, metric in zip(get_status_metrics(statuses[-1]), metrics)
+                )
+                if paid_sign:
+                    # payments depends on orders, so the fee ledger is only imported once an order needs it
+                    from payments.fees import add_order_fees
+
+                    add_order_to_daily_stats(self, paid_sign)
+                    add_order_fees(self, paid_sign)
+
+                if paid_sign or complete_sign:
+                    add_to_customer_metrics(self, paid_sign, complete_sign)
+
+        if is_moved:
+            self.current_status = statuses[-1]
+
+        return bool(is_moved)
+
     class Meta:
         db_table = 'order'
+        indexes = [GinIndex(get_search_document('email'), name='order_search_idx')]
 
 
 class OrderStatus(models.Model):
+    NEEDS_REFUND = -7
     CHARGEBACK_WON = -6
     CHARGEBACK_LOST = -5
     CHARGEBACK_PENDING = -4
@@ -97,6 +233,7 @@ class OrderStatus(models.Model):
     COMPLETE = 3
 
     STATUS_CHOICES = (
+        (NEEDS_REFUND, 'needs refund'),
         (CHARGEBACK_WON, 'chargeback won'),
         (CHARGEBACK_LOST, 'chargeback lost'),
         (CHARGEBACK_PENDING, 'chargeback pending'),
@@ -173,3 +310,122 @@ class OrderComment(TimestampedModel):
 
     class Meta:
         db_table = 'order_comment'
+
+
+class ShopDailyStats(models.Model):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    day = models.DateField()
+    orders = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    fees = models.BigIntegerField(default=0)
+    units = models.IntegerField(default=0)
+    new_customers = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'shop_daily_stats'
+        constraints = [models.UniqueConstraint(fields=['shop', 'day'], name='shop_daily_stats_unique_day')]
+
+
+class ProductDailySales(models.Model):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    day = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'product_daily_sales'
+        constraints = [models.UniqueConstraint(fields=['product', 'day'], name='product_daily_sales_unique_day')]
+        indexes = [models.Index(fields=['shop', 'day'], name='product_daily_sales_shop_idx')]
+
+
+class ProductSalesTotal(models.Model):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    product = models.OneToOneField(Product, on_delete=models.CASCADE)
+    units = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'product_sales_total'
+        indexes = [
+            models.Index(fields=['shop', '-units'], name='product_sales_units_idx'),
+            models.Index(fields=['shop', '-revenue'], name='product_sales_revenue_idx'),
+        ]
+
+
+def get_stats_day(date_time):
+    return date_time.astimezone(dt_timezone.utc).date()
+
+
+def add_to_counters(model, amounts, **lookup):
+    """
+    Adds `amounts` to the counters of the `model` row matching `lookup` with a single UPDATE, the row is created on
+    its first use.
+    """
+    updates = {field: models.F(field) + amount for field, amount in amounts.items()}
+
+    if not model.objects.filter(**lookup).update(**updates):
+        model.objects.get_or_create(**lookup)
+        model.objects.filter(**lookup).update(**updates)
+
+
+def add_to_daily_stats(shop_id, day, **amounts):
+    add_to_counters(ShopDailyStats, amounts, shop_id=shop_id, day=day)
+
+
+def add_order_to_daily_stats(order, sign):
+    """
+    Counts a paid order and the products it sold on the day it was placed, or takes them out again with a `sign` of
+    -1.
+    """
+    day = get_stats_day(order.created_at)
+    fees = order.payment_set.filter(canceled_at=None).aggregate(fees=models.Sum('fee'))['fees'] or 0
+
+    product_sales = {}
+    for product_id, quantity, price in order.items.values_list('product_id', 'quantity', 'price'):
+        units, revenue = product_sales.get(product_id, (0, 0))
+        product_sales[product_id] = (units + quantity, revenue + quantity * price)
+
+    add_to_daily_stats(
+        order.shop_id,
+        day,
+        orders=sign,
+        revenue=sign * order.total,
+        fees=sign * fees,
+        units=sign * sum(units for units, _ in product_sales.values()),
+    )
+
+    # products are always updated in id order so two orders of the same products never deadlock
+    for product_id, (units, revenue) in sorted(product_sales.items()):
+        amounts = {'units': sign * units, 'revenue': sign * revenue}
+
+        add_to_counters(ProductDailySales, amounts, shop_id=order.shop_id, product_id=product_id, day=day)
+        add_to_counters(ProductSalesTotal, amounts, shop_id=order.shop_id, product_id=product_id)
+
+
+def count_customer_order(customer_id, order):
+    """
+    Adds an order that was just linked to a customer to the customer's metrics with a single UPDATE.
+    """
+    is_paid, is_complete = get_status_metrics(order.current_status)
+
+    Customer.objects.filter(id=customer_id).update(
+        order_count=models.F('order_count') + 1,
+        paid_order_count=models.F('paid_order_count') + is_paid,
+        completed_order_count=models.F('completed_order_count') + is_complete,
+        total_spent=models.F('total_spent') + is_complete * order.total,
+        # postgres skips the NULL of a customer's first order
+        first_order_at=Least('first_order_at', models.Value(order.created_at)),
+        last_order_at=Greatest('last_order_at', models.Value(order.created_at)),
+    )
+
+
+def add_to_customer_metrics(order, paid_sign, complete_sign):
+    """
+    Moves an order between the paid and completed metrics of whichever customer it is linked to.
+    """
+    Customer.objects.filter(order=order.id).update(
+        paid_order_count=models.F('paid_order_count') + paid_sign,
+        completed_order_count=models.F('completed_order_count') + complete_sign,
+        total_spent=models.F('total_spent') + complete_sign * order.total,
+    )
@@ -0,0 +1,33 @@
+from django.db import transaction
+
+import logging
+
+from .models import Order, OrderItem, OrderComment
+
+from products.stock import reserve_stock
+
+
+def commit_reservations(order):
+    """
+    Called once an order is paid. Pending items already hold their stock, items that were added out of stock or
+    released when the order expired before its payment settled take it now. When there is not enough left for all
+    of them, no stock is taken, the order moves to needs refund with a comment saying why, and False is returned.
+    """
+    with transaction.atomic():
+        for order_item in order.items.exclude(current_status=OrderItem.PENDING).order_by('product_id'):
+            if not reserve_stock(order_item.product_id, order_item.quantity):
+                transaction.set_rollback(True)
+                break
+        else:
+            return True
+
+    logging.warning('Order %s was paid but product %s is out of stock.', order.ref_id, order_item.product_id)
+
+    with transaction.atomic():
+        if order.transition(Order.NEEDS_REFUND):
+            OrderComment.objects.create(
+                order=order,
+                comment='Paid after product ' + str(order_item.product_id) + ' ran out of stock, refund the payment.',
+            )
+
+    return False
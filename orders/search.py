@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchRank
+from django.db.models import Case, When, Value, FloatField, IntegerField
+
+from .models import Order
+
+from products.models import Product
+from shared.search import get_search_document, get_search_query, get_uuid_range
+
+
+def search_orders(text, **shop_filters):
+    """
+    Returns the orders of the shop matching `shop_filters` whose email, ref id or products match `text`. Orders
+    whose ref id starts with `text` come first, then the best email matches, newest first. Every kind of match is
+    looked up through an index and capped at SEARCH_MAX_MATCHES, which bounds the work of a query that matches most
+    of a shop's orders.
+    """
+    query = get_search_query(text)
+    ref_id_range = get_uuid_range(text)
+    orders = Order.objects.filter(**shop_filters)
+
+    matches = []
+    rank = Value(0.0, output_field=FloatField())
+    ref_id_match = Value(0, output_field=IntegerField())
+
+    if query is not None:
+        document = get_search_document('email')
+        # items of the shop's products can only belong to the shop's orders
+        products = Product.objects.filter(**shop_filters).annotate(search=get_search_document('name')).filter(
+            search=query
+        )
+
+        matches.append(orders.annotate(search=document).filter(search=query).values('id'))
+        matches.append(Order.items.through.objects.filter(orderitem__product__in=products).values('order_id'))
+        rank = SearchRank(document, query)
+
+    if ref_id_range is not None:
+        matches.append(orders.filter(ref_id__range=ref_id_range).values('id'))
+        ref_id_match = Case(When(ref_id__range=ref_id_range, then=Value(1)), default=Value(0))
+
+    if not matches:
+        return orders.none()
+
+    matches = [match[:settings.SEARCH_MAX_MATCHES] for match in matches]
+
+    return (
+        orders.filter(id__in=matches[0].union(*matches[1:]))
+        .alias(ref_id_match=ref_id_match, rank=rank)
+        .order_by('-ref_id_match', '-rank', '-created_at')
+    )
@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
 from rest_framework import serializers, status
 
 from paypalcheckoutsdk.orders import OrdersGetRequest
@@ -5,20 +7,22 @@ from paypalhttp.http_error import HttpError
 from itertools import chain
 
 import decimal
-import btcpay
 
-from .models import Order, OrderItem, OrderStatus, OrderItemStatus, OrderUserData, OrderComment
+from .models import Order, OrderItem, OrderStatus, OrderItemStatus, OrderUserData, OrderComment, count_customer_order
+from .stats import rebuild_customer_metrics
 
 from products.models import Product, DigitalProduct
-from products.serializers import PublicProductSerializer, PublicDigitalProductSerializer
+from products.serializers import PublicProductSerializer, PublicDigitalProductSerializer, get_images_prefetch
+from products.stock import reserve_stocks
 from shops.models import Shop
 from shops.serializers import PublicShopOrderSerializer
 from users.models import User
 from users.serializers import PublicUserInfoSerializer
 from shared.exceptions import CustomException
-from carts.views import delete_cart_item
+from carts.views import retire_cart_items
 from customers.models import Customer
 from payments.models import PaymentSession, Payment
+from payments.btcpay.invoices import get_invoice_state
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -27,31 +31,45 @@ class OrderItemSerializer(serializers.ModelSerializer):
     def get_product(self, product_ref):
         return Product.objects.get(ref_id=product_ref)
 
-    def check_item_stock(self, buy_quantity, sell_quantity):
-        if buy_quantity > sell_quantity:
-            return False
-
-        return True
+    def get_products(self, product_refs):
+        products = Product.objects.in_bulk(product_refs, field_name='ref_id')
+        return {str(ref_id): product for ref_id, product in products.items()}
 
     def create(self, order, **kwargs):
-        for cart_item in kwargs.get('cart_items'):
-            is_available = self.check_item_stock(cart_item['quantity'], cart_item['stock'])
-            
-            order_item = OrderItem.objects.create(
-                order=order,
+        """
+        Adds every cart item to the order with bulk inserts and reserves their stock with one UPDATE, items that could
+        not be reserved are added as out of stock. Expected to run inside the transaction that created the order, so the reservations
+        are undone if the order is not saved.
+        """
+        cart_items = kwargs.get('cart_items')
+        product_refs = [cart_item['ref_id'] for cart_item in cart_items]
+        products = self.get_products(product_refs)
+
+        quantities = {}
+        for cart_item in cart_items:
+            product_id = products[cart_item['ref_id']].id
+            quantities[product_id] = quantities.get(product_id, 0) + cart_item['quantity']
+
+        reserved_ids = reserve_stocks(quantities)
+
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
                 quantity=cart_item['quantity'],
-                product=self.get_product(cart_item['ref_id']),
+                product=products[cart_item['ref_id']],
                 price=cart_item['price'],
-                current_status=(-2 if not is_available else 0)
+                current_status=(0 if products[cart_item['ref_id']].id in reserved_ids else -2)
             )
+            for cart_item in cart_items
+        ])
 
-            order.items.add(order_item)
-            delete_cart_item(kwargs.get('cart').id, cart_item['ref_id'])
+        Order.items.through.objects.bulk_create([
+            Order.items.through(order_id=order.id, orderitem_id=order_item.id) for order_item in order_items
+        ])
 
-        instance = OrderStatusSerializer()
-        OrderStatusSerializer.create(instance, {'order': order, 'status': 0})
+        retire_cart_items(kwargs.get('cart').id, product_refs)
+        OrderStatus.objects.create(order=order, status=0)
 
-        return kwargs.get('cart_items')
+        return cart_items
 
     class Meta:
         model = OrderItem
@@ -82,54 +100,43 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data['shop'] = self.get_shop()
-        order = Order.objects.create(**validated_data)
 
-        instance = OrderItemSerializer()
-        OrderItemSerializer.create(instance, order, cart=self.context['cart'], cart_items=self.context['cart_items'])
+        # the order, its items and the retired cart items are saved together or not at all
+        with transaction.atomic():
+            order = Order.objects.create(**validated_data)
+
+            instance = OrderItemSerializer()
+            OrderItemSerializer.create(
+                instance, order, cart=self.context['cart'], cart_items=self.context['cart_items']
+            )
 
         return order
 
     def partial_update(self, instance, validated_data, customer):
-        instance.email = validated_data['email']
-        instance.customer = customer
-        instance.email_sent = True
-        instance.save()
-
-        return instance
-
-    class Meta:
-        model = Order
-        fields = ['email', 'customer', 'total', 'ref_id', 'expires_at', 'current_status']
-
-
-class OrderStatusSerializer(serializers.ModelSerializer):
-    def create(self, validated_data):
-        order_status = OrderStatus.objects.create(**validated_data)
-
-        current_order_status = Order.objects.get(id=validated_data.get('order').id)
-        current_order_status.current_status = validated_data.get('status')
-        current_order_status.save()
-
-        return order_status
-
-    class Meta:
-        model = OrderStatus
-        fields = '__all__'
+        with transaction.atomic():
+            # the order is locked so a payment cannot change its status while it moves between customers
+            current_status, previous_customer_id = (
+                Order.objects.select_for_update().filter(id=instance.id).values_list('current_status', 'customer_id')
+                .get()
+            )
 
+            instance.email = validated_data['email']
+            instance.customer = customer
+            instance.email_sent = True
+            instance.current_status = current_status
+            instance.save(update_fields=['email', 'customer', 'email_sent', 'updated_at'])
 
-class OrderItemStatusSerializer(serializers.ModelSerializer):
-    def create(self, validated_data):
-        order_item_status = OrderItemStatus.objects.create(**validated_data)
+            if previous_customer_id != customer.id:
+                count_customer_order(customer.id, instance)
 
-        current_order_item_status = OrderItem.objects.get(id=validated_data.get('item').id)
-        current_order_item_status.current_status = validated_data.get('status')
-        current_order_item_status.save()
+                if previous_customer_id is not None:
+                    rebuild_customer_metrics(Customer.objects.filter(id=previous_customer_id))
 
-        return order_item_status
+        return instance
 
     class Meta:
-        model = OrderItemStatus
-        fields = '__all__'
+        model = Order
+        fields = ['email', 'customer', 'total', 'ref_id', 'expires_at', 'current_status']
 
 
 class OrderUserDataSerializer(serializers.ModelSerializer):
@@ -228,17 +235,15 @@ class PublicOrderCheckoutSerializer(serializers.ModelSerializer):
         if not existing_session:
             return None
 
-        session_id = existing_session.provider_data['invoiceId']
-        invoice = btcpay.Invoices.get_invoice(session_id)
-
-        payment_methods = btcpay.Invoices.get_invoice_payment_methods(session_id)
-        payment_methods[0]['status'] = invoice.get('status')
-
-        return payment_methods[0]
+        return get_invoice_state(existing_session.provider_data['invoiceId'], request)
 
     def get_items(self, request):
         order_items = []
-        for item in request.items.all():
+        items = request.items.select_related('product').prefetch_related(
+            get_images_prefetch('product__itemimage_set')
+        )
+
+        for item in items:
             items = PublicProductSerializer(item.product).data
             items['quantity'] = item.quantity
             items['current_status'] = item.current_status
@@ -294,7 +299,11 @@ class PublicOrderOwnerSerializer(PublicOrderCheckoutSerializer):
 
     def get_items(self, request):
         order_items = []
-        for item in request.items.all():
+        items = request.items.select_related('product').prefetch_related(
+            get_images_prefetch('product__itemimage_set')
+        )
+
+        for item in items:
             items = PublicProductSerializer(item.product).data
             items['quantity'] = item.quantity
             items['current_status'] = item.current_status
@@ -346,17 +355,85 @@ class PublicOrderOwnerSerializer(PublicOrderCheckoutSerializer):
                   'current_status', 'ref_id', 'created_at', 'updated_at', 'gateway']
 
 
-class PublicOrderCustomerSerializer(serializers.ModelSerializer):
-    completed_order_count = serializers.SerializerMethodField()
-    user = PublicUserInfoSerializer()
+def get_order_list_queryset(orders):
+    """
+    Loads everything `PublicOrderListSerializer` shows for a page of orders in a fixed number of queries.
+    """
+    last_payment = Payment.objects.filter(order=OuterRef('id'), canceled_at=None).order_by('-id')
 
-    def get_completed_order_count(self, customer):
-        try:
-            orders = Order.objects.filter(customer=customer, current_status__gte=3)
+    return orders.select_related('shop', 'customer__user').prefetch_related(
+        Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related('product').prefetch_related(
+                get_images_prefetch('product__itemimage_set')
+            ),
+        ),
+        Prefetch('orderuserdata_set', to_attr='listed_user_data'),
+    ).annotate(
+        gateway_provider=Subquery(last_payment.values('provider')[:1]),
+    )
 
-            return orders.count()
-        except Customer.DoesNotExist:
-            return 0
+
+class PublicOrderListSerializer(serializers.ModelSerializer):
+    """
+    Order table rows for the dashboard. Expects a queryset from `get_order_list_queryset` and never calls a payment
+    provider, the full timeline is left to `PublicOrderOwnerSerializer`.
+    """
+
+    customer = serializers.SerializerMethodField()
+    geo_data = serializers.SerializerMethodField()
+    items = serializers.SerializerMethodField()
+    gateway = serializers.SerializerMethodField()
+    shop = PublicShopOrderSerializer()
+
+    def get_customer(self, request):
+        if request.customer is None:
+            return None
+
+        return {
+            'user': PublicUserInfoSerializer(request.customer.user).data,
+            'completed_order_count': request.customer.completed_order_count,
+        }
+
+    def get_geo_data(self, request):
+        if not request.listed_user_data:
+            return None
+
+        return PublicOrderUserDataSerializer(request.listed_user_data[0]).data
+
+    def get_items(self, request):
+        order_items = []
+
+        for item in request.items.all():
+            items = PublicProductSerializer(item.product).data
+            items['quantity'] = item.quantity
+            items['current_status'] = item.current_status
+
+            order_items.append(items)
+
+        return order_items
+
+    def get_gateway(self, request):
+        match request.gateway_provider:
+            case None:
+                return None
+            case 0:
+                return 'paypal'
+            case 1:
+                return 'stripe'
+            case 2:
+                return 'bitcoin'
+            case _:
+                return 'unknown'
+
+    class Meta:
+        model = Order
+        fields = ['email', 'customer', 'geo_data', 'currency', 'total', 'shop', 'items', 'current_status', 'ref_id',
+                  'created_at', 'updated_at', 'gateway']
+
+
+class PublicOrderCustomerSerializer(serializers.ModelSerializer):
+    user = PublicUserInfoSerializer()
 
     class Meta:
         model = Customer
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import add_to_daily_stats, get_stats_day
+
+from customers.models import Customer
+
+
+@receiver(post_save, sender=Customer)
+def count_new_customer(sender, instance, created, **kwargs):
+    if created:
+        add_to_daily_stats(instance.shop_id, get_stats_day(timezone.now()), new_customers=1)
@@ -0,0 +1,160 @@
+from django.db import transaction
+from django.db.models import Count, Sum, Min, Max, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from datetime import timedelta, timezone as dt_timezone
+
+from .models import (
+    Order, OrderItem, ShopDailyStats, ProductDailySales, ProductSalesTotal, get_complete_filter, get_paid_filter,
+    get_stats_day,
+)
+
+from customers.models import Customer
+from payments.models import Payment
+
+
+# rolling windows in UTC days the best sellers are ranked over, besides all time
+BEST_SELLER_WINDOWS = (7, 30, 90)
+
+
+def get_daily_totals(queryset, shop_field, date_field, *fields, **aggregates):
+    return (
+        queryset.order_by()
+        .values(*fields, stats_shop=F(shop_field), stats_day=TruncDate(date_field, tzinfo=dt_timezone.utc))
+        .annotate(**aggregates)
+    )
+
+
+def backfill_daily_stats(shop_id=None):
+    """
+    Rebuilds the daily stats and product sales of one shop, or of every shop, from the raw orders, payments and
+    customers. Returns the number of days written.
+    """
+    orders = Order.objects.filter(get_paid_filter())
+    items = OrderItem.objects.filter(get_paid_filter('order__current_status'))
+    payments = Payment.objects.filter(get_paid_filter('order__current_status'), canceled_at=None)
+    customers = Customer.objects.all()
+    stats = ShopDailyStats.objects.all()
+    product_daily_sales = ProductDailySales.objects.all()
+    product_sales_totals = ProductSalesTotal.objects.all()
+
+    if shop_id is not None:
+        orders = orders.filter(shop_id=shop_id)
+        items = items.filter(order__shop_id=shop_id)
+        payments = payments.filter(order__shop_id=shop_id)
+        customers = customers.filter(shop_id=shop_id)
+        stats = stats.filter(shop_id=shop_id)
+        product_daily_sales = product_daily_sales.filter(shop_id=shop_id)
+        product_sales_totals = product_sales_totals.filter(shop_id=shop_id)
+
+    daily_totals = [
+        get_daily_totals(orders, 'shop_id', 'created_at', orders=Count('id'), revenue=Sum('total')),
+        get_daily_totals(items, 'order__shop_id', 'order__created_at', units=Sum('quantity')),
+        get_daily_totals(payments, 'order__shop_id', 'order__created_at', fees=Sum('fee')),
+        # customers are created along with their user
+        get_daily_totals(customers, 'shop_id', 'user__created_at', new_customers=Count('id')),
+    ]
+
+    days = {}
+    for rows in daily_totals:
+        for row in rows:
+            days.setdefault((row.pop('stats_shop'), row.pop('stats_day')), {}).update(row)
+
+    product_days = list(
+        get_daily_totals(items, 'order__shop_id', 'order__created_at', 'product_id', units=Sum('quantity'),
+                         revenue=Sum(F('quantity') * F('price')))
+        .values_list('stats_shop', 'product_id', 'stats_day', 'units', 'revenue')
+    )
+
+    product_totals = {}
+    for shop, product, _, units, revenue in product_days:
+        total = product_totals.setdefault(product, ProductSalesTotal(shop_id=shop, product_id=product))
+        total.units += units
+        total.revenue += revenue
+
+    with transaction.atomic():
+        stats.delete()
+        ShopDailyStats.objects.bulk_create([
+            ShopDailyStats(shop_id=shop, day=day, **totals) for (shop, day), totals in days.items()
+        ], batch_size=1000)
+
+        product_daily_sales.delete()
+        product_sales_totals.delete()
+        ProductDailySales.objects.bulk_create([
+            ProductDailySales(shop_id=shop, product_id=product, day=day, units=units, revenue=revenue)
+            for shop, product, day, units, revenue in product_days
+        ], batch_size=1000)
+        ProductSalesTotal.objects.bulk_create(product_totals.values(), batch_size=1000)
+
+    return len(days)
+
+
+def get_shop_stats(shop):
+    """
+    Returns the totals the dashboard shows from the daily stats: paid orders and revenue of all time, and paid orders
+    per day and revenue of the last seven UTC days with today last.
+    """
+    today = get_stats_day(timezone.now())
+    first_day = today - timedelta(days=6)
+
+    all_time = ShopDailyStats.objects.filter(shop=shop).aggregate(orders=Sum('orders'), revenue=Sum('revenue'))
+    past_days = list(
+        ShopDailyStats.objects.filter(shop=shop, day__gte=first_day, day__lte=today)
+        .values_list('day', 'orders', 'revenue')
+    )
+    past_orders = {day: orders for day, orders, _ in past_days}
+
+    return {
+        'all_orders': all_time['orders'] or 0,
+        'total_profit': all_time['revenue'] or 0,
+        'past_orders': [past_orders.get(first_day + timedelta(days=n), 0) for n in range(7)],
+        'past_profit': sum(revenue for _, _, revenue in past_days),
+    }
+
+
+def get_customer_order_total(orders, aggregate):
+    return Subquery(orders.order_by().values('customer').annotate(total=aggregate).values('total'))
+
+
+def rebuild_customer_metrics(customers):
+    """
+    Recomputes the order metrics of `customers` from their orders with a single UPDATE. Returns the number of
+    customers updated.
+    """
+    orders = Order.objects.filter(customer=OuterRef('id'))
+    completed_orders = orders.filter(get_complete_filter())
+
+    return customers.update(
+        order_count=Coalesce(get_customer_order_total(orders, Count('id')), 0),
+        paid_order_count=Coalesce(get_customer_order_total(orders.filter(get_paid_filter()), Count('id')), 0),
+        completed_order_count=Coalesce(get_customer_order_total(completed_orders, Count('id')), 0),
+        total_spent=Coalesce(get_customer_order_total(completed_orders, Sum('total')), 0),
+        first_order_at=get_customer_order_total(orders, Min('created_at')),
+        last_order_at=get_customer_order_total(orders, Max('created_at')),
+    )
+
+
+def get_best_sellers(shop_id, window=None, rank_by='units', limit=5, **filters):
+    """
+    Returns the (product id, product ref id, units, revenue) of a shop's best-selling products over the last
+    `window` UTC days with today last, or of all time, ranked by `rank_by`. The all-time ranking reads one row per
+    product and a window at most one row per product and day.
+    """
+    if window is None:
+        sales = ProductSalesTotal.objects.filter(shop_id=shop_id, **filters).annotate(
+            sold_units=F('units'), sold_revenue=F('revenue')
+        )
+    else:
+        first_day = get_stats_day(timezone.now()) - timedelta(days=window - 1)
+        sales = (
+            ProductDailySales.objects.filter(shop_id=shop_id, day__gte=first_day, **filters)
+            .values('product_id', 'product__ref_id')
+            .annotate(sold_units=Sum('units'), sold_revenue=Sum('revenue'))
+        )
+
+    return list(
+        sales.filter(**{'sold_' + rank_by + '__gt': 0})
+        .order_by('-sold_' + rank_by, 'product_id')
+        .values_list('product_id', 'product__ref_id', 'sold_units', 'sold_revenue')[:limit]
+    )
@@ -1,3 +1,556 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
 
-# Create your tests here.
+from unittest.mock import patch
+
+import io
+import os
+import tempfile
+import requests
+
+from datetime import timedelta
+
+from uuid import uuid4
+
+from carts.models import Cart, CartItem
+from carts.views import get_cart_details
+from orders.expiration import expire_orders
+from orders.geolocation import import_csv, find_location
+from orders.keys import allocate_keys
+from orders.reservations import commit_reservations
+from customers.models import Customer
+from customers.search import search_customers
+from orders.models import (
+    Order, OrderItem, OrderStatus, OrderItemStatus, OrderUserData, OrderComment,
+    ShopDailyStats, ProductDailySales, ProductSalesTotal
+)
+from orders.search import search_orders
+from orders.serializers import OrderSerializer, PublicOrderListSerializer, get_order_list_queryset
+from orders.stats import backfill_daily_stats, get_best_sellers, get_shop_stats, rebuild_customer_metrics
+from payments.models import Payment
+from payments.views import save_payment
+from products.models import Product, DigitalProduct
+from users.models import User
+from shared.recaptcha_validation import RecaptchaValidation
+from shared.testing import create_test_shop
+
+
+GEO_CSV = """ip_start,ip_end,country,region,city,latitude,longitude,is_vpn
+1.0.0.0,1.0.0.255,AU,Queensland,Brisbane,-27.4679,153.0281,0
+8.8.4.0,8.8.8.255,US,California,Mountain View,37.4056,-122.0775,1
+2001:db8::,2001:db8::ffff,NL,,,,,0
+"""
+
+
+class TestGeolocation(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'geoip.bin')
+
+        import_csv(io.StringIO(GEO_CSV), self.path)
+
+        settings_override = override_settings(GEOIP_DATABASE_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_address_inside_range_is_found(self):
+        location = find_location('8.8.8.8')
+
+        self.assertEqual(location['country'], 'US')
+        self.assertEqual(location['city'], 'Mountain View')
+        self.assertEqual(location['latitude'], 37.4056)
+        self.assertTrue(location['security']['is_vpn'])
+
+    def test_ipv6_range_without_details(self):
+        location = find_location('2001:db8::1')
+
+        self.assertEqual(location['country'], 'NL')
+        self.assertIsNone(location['city'])
+        self.assertIsNone(location['latitude'])
+
+    def test_addresses_outside_ranges_are_not_found(self):
+        self.assertIsNone(find_location('1.0.1.0'))
+        self.assertIsNone(find_location('0.0.0.1'))
+        self.assertIsNone(find_location('not an ip'))
+
+    def test_missing_database_is_not_found(self):
+        with override_settings(GEOIP_DATABASE_PATH=os.path.join(self.directory.name, 'missing.bin')):
+            self.assertIsNone(find_location('8.8.8.8'))
+
+
+class TestRecaptchaValidation(SimpleTestCase):
+    def test_unverified_token_is_invalid(self):
+        with patch('shared.recaptcha_validation.requests.post', side_effect=requests.Timeout):
+            self.assertFalse(RecaptchaValidation('token', 1).is_valid)
+
+
+class TestOrderExpiration(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+        cls.product = Product.objects.create(shop=cls.shop, name='Longclaw', price=500, stock=10, status=1)
+
+    def create_order(self, current_status, expires_in):
+        order = Order.objects.create(shop=self.shop, total=500, current_status=current_status,
+                                     expires_at=timezone.now() + timedelta(days=expires_in))
+        order.items.add(OrderItem.objects.create(product=self.product, quantity=1, price=500))
+
+        return order
+
+    def test_only_unpaid_expired_orders_are_cancelled(self):
+        waiting = [self.create_order(0, -1) for _ in range(2)]
+        denied = self.create_order(-2, -1)
+        paid = self.create_order(1, -1)
+        open_order = self.create_order(0, 1)
+
+        self.assertEqual(expire_orders(batch_size=2), 3)
+
+        for order in waiting + [denied]:
+            order.refresh_from_db()
+            self.assertEqual(order.current_status, -1)
+            self.assertEqual(order.items.get().current_status, -1)
+            self.assertTrue(OrderStatus.objects.filter(order=order, status=-1).exists())
+            self.assertTrue(OrderItemStatus.objects.filter(item=order.items.get(), status=-1).exists())
+
+        for order in (paid, open_order):
+            order.refresh_from_db()
+            self.assertNotEqual(order.current_status, -1)
+
+    def test_batch_queries_do_not_grow_with_orders(self):
+        for _ in range(5):
+            self.create_order(0, -1)
+
+        # stock is given back with one UPDATE per product
+        with self.assertNumQueries(9):
+            self.assertEqual(expire_orders(batch_size=10), 5)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 15)
+
+
+class TestOrderCreation(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+
+    def test_order_is_created_from_cart_with_one_reservation_query(self):
+        cart = Cart.objects.create(shop=self.shop, user=uuid4())
+        products = []
+
+        for i in range(3):
+            product = Product.objects.create(shop=self.shop, name='Sword ' + str(i), price=500, stock=2, status=1)
+            CartItem.objects.create(cart=cart, product=product, quantity=i + 1)
+            products.append(product)
+
+        context = {'cart': cart, 'cart_items': get_cart_details(cart)['items'], 'shop_ref': self.shop.ref_id}
+        serialized_data = OrderSerializer(data={'email': 'snow@castleblack.com'}, context=context)
+        serialized_data.is_valid(raise_exception=True)
+
+        with self.assertNumQueries(10):
+            order = serialized_data.create(serialized_data.data)
+
+        self.assertEqual(order.total, 3000)
+        self.assertEqual(sorted(order.items.values_list('quantity', 'current_status')), [(1, 0), (2, 0), (3, -2)])
+        self.assertTrue(OrderStatus.objects.filter(order=order, status=0).exists())
+        self.assertEqual(get_cart_details(cart)['items'], [])
+
+        for product in products:
+            product.refresh_from_db()
+
+        # the second product sold out, the third could not be reserved
+        self.assertEqual([(product.stock, product.status) for product in products], [(1, 1), (0, -2), (2, 1)])
+
+
+class TestOrderTransitions(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+        cls.product = Product.objects.create(shop=cls.shop, name='Longclaw', price=500, stock=10, status=1)
+
+    def setUp(self):
+        self.order = Order.objects.create(shop=self.shop, total=500)
+        self.order.items.add(*[OrderItem.objects.create(product=self.product, quantity=1, price=500) for _ in range(2)])
+
+    def test_steps_are_applied_with_one_update(self):
+        self.assertTrue(self.order.transition(1))
+
+        # the order UPDATE, the status INSERT and the customer metrics UPDATE, wrapped in a savepoint inside the test
+        # transaction
+        with self.assertNumQueries(5):
+            self.assertTrue(self.order.transition(2, 3))
+
+        self.assertEqual(self.order.current_status, 3)
+        self.assertEqual(Order.objects.get(id=self.order.id).current_status, 3)
+        self.assertEqual(
+            list(OrderStatus.objects.filter(order=self.order).values_list('status', flat=True)), [1, 2, 3]
+        )
+
+    def test_repeated_transition_does_nothing(self):
+        self.assertTrue(self.order.transition(1, 2))
+
+        stale_order = Order.objects.get(id=self.order.id)
+        stale_order.current_status = 0
+
+        self.assertFalse(stale_order.transition(1, 2))
+        self.assertEqual(OrderStatus.objects.filter(order=self.order).count(), 2)
+
+    def test_illegal_path_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.order.transition(3, 1)
+
+        self.assertEqual(Order.objects.get(id=self.order.id).current_status, 0)
+
+    def test_items_are_moved_together(self):
+        item_ids = self.order.items.transition(1, 2)
+
+        self.assertEqual(len(item_ids), 2)
+        self.assertEqual(list(self.order.items.values_list('current_status', flat=True)), [2, 2])
+        self.assertEqual(OrderItemStatus.objects.filter(item_id__in=item_ids).count(), 4)
+        self.assertEqual(self.order.items.transition(1, 2), [])
+
+    def test_status_without_sources_does_nothing(self):
+        self.assertFalse(self.order.transition(0))
+        self.assertFalse(OrderStatus.objects.filter(order=self.order).exists())
+
+    def test_late_payment_takes_all_or_no_stock(self):
+        self.order.items.transition(-1)
+        Product.objects.filter(id=self.product.id).update(stock=1)
+
+        self.assertFalse(commit_reservations(self.order))
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 1)
+
+        Product.objects.filter(id=self.product.id).update(stock=2)
+
+        self.assertTrue(commit_reservations(self.order))
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 0)
+
+    def test_late_payment_without_stock_needs_refund(self):
+        self.order.transition(1, 2)
+        self.order.items.transition(-1)
+        Product.objects.filter(id=self.product.id).update(stock=1)
+
+        self.assertFalse(commit_reservations(self.order))
+        self.assertEqual(Order.objects.get(id=self.order.id).current_status, Order.NEEDS_REFUND)
+        self.assertTrue(OrderComment.objects.filter(order=self.order, comment__contains='refund').exists())
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 1)
+
+        self.assertTrue(self.order.transition(Order.REFUNDED))
+
+
+class TestKeyAllocation(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+        cls.products = [
+            Product.objects.create(shop=cls.shop, name='Sword ' + str(i), price=500, stock=10, status=1)
+            for i in range(2)
+        ]
+
+        for product in cls.products:
+            DigitalProduct.objects.bulk_create([
+                DigitalProduct(key=product.name + ' ' + str(i), product=product) for i in range(6)
+            ])
+
+    def create_items(self, quantities):
+        return [
+            OrderItem.objects.create(product=product, quantity=quantity, price=500)
+            for product, quantity in zip(self.products, quantities)
+        ]
+
+    def test_keys_are_claimed_with_queries_per_item_not_per_key(self):
+        items = self.create_items([4, 2])
+
+        # two per item and one bulk insert, wrapped in a savepoint inside the test transaction
+        with self.assertNumQueries(7):
+            allocated_keys = allocate_keys(items, 'snow@castleblack.com')
+
+        self.assertEqual([len(allocated_keys[item.id]) for item in items], [4, 2])
+        self.assertEqual(items[0].purchased_keys.count(), 4)
+        self.assertEqual(
+            DigitalProduct.objects.filter(status=1, recipient_email='snow@castleblack.com').count(), 6
+        )
+
+    def test_orders_never_share_keys(self):
+        first_keys = allocate_keys(self.create_items([4]), 'snow@castleblack.com')
+        second_keys = allocate_keys(self.create_items([4]), 'sam@castleblack.com')
+
+        first_keys, second_keys = list(first_keys.values())[0], list(second_keys.values())[0]
+
+        self.assertEqual(len(first_keys), 4)
+        self.assertEqual(len(second_keys), 2)
+        self.assertFalse(set(first_keys) & set(second_keys))
+
+
+class TestOrderList(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+        cls.customer = Customer.objects.create(user=cls.shop.owner, shop=cls.shop)
+
+        for i in range(3):
+            product = Product.objects.create(shop=cls.shop, name='Sword ' + str(i), price=500, stock=10, status=1)
+            order = Order.objects.create(shop=cls.shop, customer=cls.customer, email='snow@castleblack.com',
+                                         total=500, current_status=3 - i)
+            order.items.add(OrderItem.objects.create(product=product, quantity=1, price=500))
+
+            OrderUserData.objects.create(order=order, using_vpn=False, country='US')
+            Payment.objects.create(order=order, provider=1, canceled_at=timezone.now())
+            Payment.objects.create(order=order, provider=i)
+
+        rebuild_customer_metrics(Customer.objects.filter(id=cls.customer.id))
+
+    def test_page_is_serialized_with_fixed_number_of_queries(self):
+        with self.assertNumQueries(4):
+            orders = PublicOrderListSerializer(
+                get_order_list_queryset(Order.objects.filter(shop=self.shop).order_by('id')), many=True
+            ).data
+
+        self.assertEqual([order['gateway'] for order in orders], ['paypal', 'stripe', 'bitcoin'])
+        self.assertEqual(orders[0]['customer']['completed_order_count'], 1)
+        self.assertEqual(orders[0]['geo_data']['country'], 'US')
+        self.assertEqual(orders[2]['items'][0]['name'], 'Sword 2')
+        self.assertNotIn('statuses', orders[0])
+
+
+class TestShopDailyStats(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+        cls.user = cls.shop.owner
+        cls.product = Product.objects.create(shop=cls.shop, name='Longclaw', price=500, stock=10, status=1)
+
+    def create_order(self, days_ago=0, quantity=1):
+        order = Order.objects.create(shop=self.shop, total=500 * quantity)
+        order.items.add(OrderItem.objects.create(product=self.product, quantity=quantity, price=500))
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+        order.refresh_from_db()
+
+        return order
+
+    def get_stats(self):
+        return list(ShopDailyStats.objects.filter(shop=self.shop).order_by('day').values_list(
+            'day', 'orders', 'revenue', 'fees', 'units', 'new_customers'
+        ))
+
+    def test_paid_orders_are_counted_and_refunds_taken_out(self):
+        order = self.create_order(quantity=2)
+        self.create_order().transition(1, 2)
+
+        # confirmed the way the payment webhooks do it
+        self.assertTrue(order.transition(1, 2))
+        save_payment(1, {'id': 'pi_longclaw'}, order, False)
+
+        self.assertGreater(self.get_stats()[0][3], 0)
+        self.assertTrue(order.transition(-3))
+
+        self.assertEqual([day[1:] for day in self.get_stats()], [(1, 500, 0, 1, 0)])
+
+    def test_won_chargeback_counts_the_sale_again(self):
+        order = self.create_order(quantity=2)
+        order.transition(1, 2, 3)
+        paid_stats = self.get_stats()
+
+        order.transition(-4)
+        self.assertEqual([day[1:] for day in self.get_stats()], [(0, 0, 0, 0, 0)])
+        self.assertEqual(get_best_sellers(self.shop.id), [])
+
+        order.transition(-6)
+        self.assertEqual(self.get_stats(), paid_stats)
+        self.assertEqual(get_best_sellers(self.shop.id), [(self.product.id, self.product.ref_id, 2, 1000)])
+
+    def test_backfill_matches_incremental_stats(self):
+        for days_ago in (0, 3, 8):
+            order = self.create_order(days_ago, quantity=2)
+            order.transition(1, 2)
+
+        self.create_order(1)
+        Customer.objects.create(user=self.user, shop=self.shop)
+
+        incremental_stats = self.get_stats()
+
+        self.assertEqual(backfill_daily_stats(self.shop.id), 3)
+        self.assertEqual(self.get_stats(), incremental_stats)
+
+    def test_dashboard_reads_seven_utc_days(self):
+        for days_ago in (0, 0, 3, 6, 7):
+            self.create_order(days_ago).transition(1, 2)
+
+        with self.assertNumQueries(2):
+            shop_stats = get_shop_stats(self.shop)
+
+        self.assertEqual(shop_stats['past_orders'], [1, 0, 0, 1, 0, 0, 2])
+        self.assertEqual(shop_stats['past_profit'], 2000)
+        self.assertEqual((shop_stats['all_orders'], shop_stats['total_profit']), (5, 2500))
+
+    def test_best_sellers_rank_units_of_paid_orders(self):
+        dagger = Product.objects.create(shop=self.shop, name='Dagger', price=100, stock=10, status=1)
+
+        self.create_order(days_ago=10, quantity=5).transition(1, 2)
+        self.create_order(quantity=2).transition(1, 2)
+
+        for _ in range(3):
+            order = self.create_order()
+            order.items.add(OrderItem.objects.create(product=dagger, quantity=1, price=100))
+            order.transition(1, 2)
+
+        self.create_order(quantity=9)
+        refunded_order = self.create_order(quantity=4)
+        refunded_order.transition(1, 2)
+        refunded_order.transition(-3)
+
+        self.assertEqual(get_best_sellers(self.shop.id), [
+            (self.product.id, self.product.ref_id, 10, 5000),
+            (dagger.id, dagger.ref_id, 3, 300),
+        ])
+        self.assertEqual(get_best_sellers(self.shop.id, 7), [
+            (self.product.id, self.product.ref_id, 5, 2500),
+            (dagger.id, dagger.ref_id, 3, 300),
+        ])
+        self.assertEqual(get_best_sellers(self.shop.id, 7, rank_by='revenue', limit=1)[0][0], self.product.id)
+
+    def test_backfill_matches_incremental_best_sellers(self):
+        for days_ago in (0, 3, 8):
+            self.create_order(days_ago, quantity=2).transition(1, 2)
+
+        def get_sales():
+            return (
+                list(ProductDailySales.objects.order_by('day').values_list('product_id', 'day', 'units', 'revenue')),
+                list(ProductSalesTotal.objects.values_list('product_id', 'units', 'revenue')),
+            )
+
+        incremental_sales = get_sales()
+        backfill_daily_stats(self.shop.id)
+
+        self.assertEqual(get_sales(), incremental_sales)
+
+
+class TestCustomerMetrics(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+        cls.customers = [
+            Customer.objects.create(user=User.objects.create(email=email, username=email), shop=cls.shop)
+            for email in ('sam@castleblack.com', 'gilly@castleblack.com')
+        ]
+
+    def link_order(self, order, customer):
+        return OrderSerializer().partial_update(order, {'email': customer.user.email}, customer)
+
+    def get_metrics(self, customer):
+        return Customer.objects.filter(id=customer.id).values_list(
+            'order_count', 'paid_order_count', 'completed_order_count', 'total_spent'
+        ).get()
+
+    def test_metrics_follow_transitions(self):
+        first_order = self.link_order(Order.objects.create(shop=self.shop, total=500), self.customers[0])
+        second_order = self.link_order(Order.objects.create(shop=self.shop, total=700), self.customers[0])
+
+        first_order.transition(1, 2, 3)
+        second_order.transition(1, 2, 3)
+        second_order.transition(-3)
+
+        self.assertEqual(self.get_metrics(self.customers[0]), (2, 1, 1, 500))
+
+        customer = Customer.objects.get(id=self.customers[0].id)
+        self.assertEqual((customer.first_order_at, customer.last_order_at),
+                         (first_order.created_at, second_order.created_at))
+
+    def test_relinked_order_moves_between_customers(self):
+        order = self.link_order(Order.objects.create(shop=self.shop, total=500), self.customers[0])
+        order.transition(1, 2, 3)
+        self.link_order(order, self.customers[1])
+
+        self.assertEqual(self.get_metrics(self.customers[0]), (0, 0, 0, 0))
+        self.assertEqual(self.get_metrics(self.customers[1]), (1, 1, 1, 500))
+        self.assertIsNone(Customer.objects.get(id=self.customers[0].id).first_order_at)
+
+    def test_won_chargeback_restores_customer_spend(self):
+        order = self.link_order(Order.objects.create(shop=self.shop, total=500), self.customers[0])
+        order.transition(1, 2, 3)
+
+        order.transition(-4)
+        self.assertEqual(self.get_metrics(self.customers[0]), (1, 0, 0, 0))
+
+        order.transition(-6)
+        self.assertEqual(self.get_metrics(self.customers[0]), (1, 1, 1, 500))
+
+        rebuild_customer_metrics(Customer.objects.filter(id=self.customers[0].id))
+        self.assertEqual(self.get_metrics(self.customers[0]), (1, 1, 1, 500))
+
+    def test_rebuild_matches_incremental_metrics(self):
+        for total in (500, 700, 900):
+            order = self.link_order(Order.objects.create(shop=self.shop, total=total), self.customers[0])
+            order.transition(1, 2)
+
+        order.transition(3)
+        incremental_metrics = self.get_metrics(self.customers[0])
+
+        rebuild_customer_metrics(Customer.objects.filter(id=self.customers[0].id))
+
+        self.assertEqual(self.get_metrics(self.customers[0]), incremental_metrics)
+
+
+class TestSearch(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+        cls.other_shop = create_test_shop(name='The Eyrie', domain='https://eyrie.com', owner=cls.shop.owner,
+                                          country=cls.shop.country)
+        cls.product = Product.objects.create(shop=cls.shop, name='Longclaw', price=500, stock=10, status=1)
+
+        cls.orders = [
+            Order.objects.create(shop=cls.shop, total=500, email=email)
+            for email in ('sam.tarly@castleblack.com', 'gilly@castleblack.com', 'tarly@hornhill.com')
+        ]
+        cls.orders[1].items.add(OrderItem.objects.create(product=cls.product, quantity=1, price=500))
+        cls.other_order = Order.objects.create(shop=cls.other_shop, total=500, email='sam.tarly@castleblack.com')
+
+        cls.customers = [
+            Customer.objects.create(user=User.objects.create(**user_fields), shop=cls.shop)
+            for user_fields in (
+                {'email': 'sam@castleblack.com', 'username': 'sam', 'first_name': 'Samwell', 'last_name': 'Tarly'},
+                {'email': 'gilly@castleblack.com', 'username': 'gilly', 'first_name': 'Gilly'},
+            )
+        ]
+
+    def search(self, text):
+        return list(search_orders(text, shop=self.shop))
+
+    def test_orders_match_email_words(self):
+        self.assertEqual(set(self.search('tarly')), {self.orders[0], self.orders[2]})
+        self.assertEqual(self.search('sam.tarly@castleblack.com'), [self.orders[0]])
+        self.assertEqual(self.search('castleb'), [self.orders[1], self.orders[0]])
+
+    def test_only_the_start_of_words_is_matched(self):
+        # the old icontains search found text anywhere in a field
+        self.assertEqual(self.search('arly'), [])
+        self.assertEqual(self.search('leblack'), [])
+        self.assertEqual(list(search_customers(Customer.objects.filter(shop=self.shop), 'amwell')), [])
+
+    def test_short_last_word_is_left_out(self):
+        self.assertEqual(set(self.search('tarly ho')), {self.orders[0], self.orders[2]})
+
+    def test_orders_match_products(self):
+        self.assertEqual(self.search('longcl'), [self.orders[1]])
+
+    def test_ref_id_matches_come_first(self):
+        ref_id = str(self.orders[0].ref_id)
+
+        self.assertEqual(self.search(ref_id[:8]), [self.orders[0]])
+        self.assertEqual(self.search(ref_id), [self.orders[0]])
+        self.assertEqual(self.search('zzz'), [])
+
+    def test_other_shops_are_not_searched(self):
+        self.assertNotIn(self.other_order, self.search('sam'))
+        self.assertEqual(self.search(str(self.other_order.ref_id)), [])
+
+    def test_customers_match_names_and_emails(self):
+        customers = Customer.objects.filter(shop=self.shop)
+
+        self.assertEqual(list(search_customers(customers, 'samwell tar')), [self.customers[0]])
+        self.assertEqual(list(search_customers(customers, 'gilly@')), [self.customers[1]])
+        self.assertEqual(list(search_customers(customers.filter(shop=self.other_shop), 'gilly')), [])
+        self.assertEqual(list(search_customers(customers, '@')), [])
@@ -1,9 +1,8 @@
 from django.utils import timezone
 from django.http import HttpResponseRedirect
-from django.db.models.functions import ExtractDay
 from django.template.loader import render_to_string
 from django.conf import settings
-from django.db.models import Q, Count
+from django.db.models import Q
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
@@ -11,33 +10,35 @@ from rest_framework.response import Response
 
 from ipware import get_client_ip
 from device_detector import SoftwareDetector
-from datetime import timedelta
 
 import decimal
-import requests
 import os
 
 from .serializers import (
     OrderSerializer,
     OrderUserDataSerializer,
-    OrderStatusSerializer,
-    OrderItemStatusSerializer,
     OrderCommentSerializer,
     PublicOrderCheckoutSerializer,
     PublicOrderOwnerSerializer,
+    PublicOrderListSerializer,
+    get_order_list_queryset,
 )
 
+from .geolocation import find_location
 from .models import Order, OrderComment
+from .search import search_orders
+from .stats import BEST_SELLER_WINDOWS, get_best_sellers, get_shop_stats
 
 from shops.models import Shop
-from carts.views import get_users_cart, get_users_cart_items
+from carts.views import get_users_cart, get_cart_details
 from shared.exceptions import CustomException
 from shared.recaptcha_validation import RecaptchaValidation
-from shared.services import send_mailgun_email, get_url
+from shared.outbox import queue_email
+from shared.services import get_url
 from shared.pagination import PaginationMixin, CustomPagination
 from payments.paypal.paypal import PayPalClient
 from products.models import Product
-from products.serializers import PublicProductSerializer
+from products.serializers import PublicProductSerializer, get_images_prefetch
 from blacklists.models import Blacklist
 from customers.models import Customer
 from customers.serializers import PublicCustomerInfoSerializer
@@ -49,37 +50,35 @@ class OrderView(APIView, PaginationMixin):
     pagination_class = CustomPagination
     serializer_class = OrderSerializer
 
-    def get_geo_location(self, ip_address):
-        request = requests.get(
-            'https://ipgeolocation.abstractapi.com/v1/?api_key'
-            '=ec4afaec214d4ab295cbd07430d136f8&ip_address=' + ip_address
-        )
+    def get_unknown_geo_location(self, ip_address):
+        return {
+            'ip_address': ip_address,
+            'security': {'is_vpn': False},
+            'longitude': None,
+            'latitude': None,
+            'city': None,
+            'region': None,
+            'postal_code': None,
+            'country': None,
+        }
 
-        response = request.json()
-        return response
+    def get_geo_location(self, ip_address):
+        return find_location(ip_address) or self.get_unknown_geo_location(ip_address)
 
     def get_software_info(self, user_agent):
         return SoftwareDetector(user_agent).parse()
 
-    def check_order_expiration(self):
-        orders = Order.objects.filter(Q(current_status=-2) | Q(current_status=0), expires_at__lt=timezone.now())
-
-        if orders.exists():
-            for order in orders:
-                instance = OrderStatusSerializer()
-                OrderStatusSerializer.create(instance, {'order': order, 'status': -1})
-
-                for order_item in order.items.all():
-                    item_instance = OrderItemStatusSerializer()
-                    OrderItemStatusSerializer.create(item_instance, {'item': order_item, 'status': -1})
-
     def send_order_email(self, order):
         if not order.email_sent:
             order_link = os.environ['SITE_SCHEME'] + os.environ['SITE_URL'] + '/checkout/' + str(order.shop.ref_id) + \
                          '/' + str(order.ref_id)
 
             order_values = []
-            for order_item in order.items.all():
+            order_items = order.items.select_related('product').prefetch_related(
+                get_images_prefetch('product__itemimage_set')
+            )
+
+            for order_item in order_items:
                 order_item_data = PublicProductSerializer(order_item.product).data
                 order_values.append(order_item_data)
 
@@ -96,15 +95,12 @@ class OrderView(APIView, PaginationMixin):
                 context
             )
 
-            send_mailgun_email(order.email, email_subject, email_body, 'order')
+            queue_email(order.email, email_subject, email_body, 'order')
 
     def check_seach_query(self, requester, shop_ref, query):
-        order = (
-            Order.objects.filter(shop__owner=requester, shop_id__ref_id=shop_ref, email__contains=query)
-            .order_by('-created_at')
-        )
+        order = search_orders(query, shop__owner=requester, shop__ref_id=shop_ref)
 
-        if not order:
+        if not order.exists():
             data = {
                 'success': False,
                 'message': 'Order(s) that match your criteria were not found.',
@@ -118,10 +114,16 @@ class OrderView(APIView, PaginationMixin):
         return order
 
     def check_blacklist(self, shop_ref, user_ref, geo_data):
-        return Blacklist.objects.filter(
-            Q(shop_id__ref_id=shop_ref), Q(user__ref_id=user_ref) |
-            Q(ip_address=geo_data['ip_address']) | Q(country=geo_data['country'])
-        ).exists()
+        blacklist_filter = Q(user__ref_id=user_ref)
+
+        # an unknown location must not match the entries that were added without one
+        if geo_data['ip_address'] is not None:
+            blacklist_filter |= Q(ip_address=geo_data['ip_address'])
+
+        if geo_data['country'] is not None:
+            blacklist_filter |= Q(country=geo_data['country'])
+
+        return Blacklist.objects.filter(Q(shop_id__ref_id=shop_ref), blacklist_filter).exists()
 
     def create_customer(self, email, shop):
         try:
@@ -139,8 +141,6 @@ class OrderView(APIView, PaginationMixin):
         paypal_client = PayPalClient()
         context = {'paypal_client': paypal_client}
 
-        self.check_order_expiration()
-
         if order_ref is not None:
             try:
                 if 'checkout' in request.path:
@@ -159,6 +159,9 @@ class OrderView(APIView, PaginationMixin):
             seach_query = request.query_params.get('q')
             if seach_query:
                 order = self.check_seach_query(request.user, shop_ref, seach_query)
+
+                if isinstance(order, Response):
+                    return order
             else:
                 order = (
                     Order.objects.filter(shop_id__ref_id=shop_ref, shop__owner=request.user)
@@ -166,18 +169,18 @@ class OrderView(APIView, PaginationMixin):
                     .order_by('-created_at')
                 )
 
-            if not order:
+            if not order.exists():
                 raise CustomException(
                     'Orders from shop with id ' + str(shop_ref) + ' were not found.',
                     status.HTTP_204_NO_CONTENT,
                 )
 
-            page = self.paginate_queryset(order)
+            page = self.paginate_queryset(get_order_list_queryset(order))
             if page is not None:
-                orders_data = PublicOrderOwnerSerializer(page, context=context, many=True).data
+                orders_data = PublicOrderListSerializer(page, many=True).data
                 orders = self.get_paginated_response(orders_data).data
             else:
-                orders = PublicOrderOwnerSerializer(order, context=context, many=True).data
+                orders = PublicOrderListSerializer(get_order_list_queryset(order), many=True).data
 
         data = {
             'success': True,
@@ -198,7 +201,7 @@ class OrderView(APIView, PaginationMixin):
         if cart is None or reacptcha_token is None:
             return HttpResponseRedirect(get_url('/404'))
 
-        cart_items = get_users_cart_items(cart)
+        cart_items = get_cart_details(cart)['items']
 
         for item in cart_items:
             if item['quantity'] < item['min_order_quantity'] or item['quantity'] > item['max_order_quantity']:
@@ -217,13 +220,14 @@ class OrderView(APIView, PaginationMixin):
 
         serialized_data = self.serializer_class(data=order_data, context=context)
         is_valid = serialized_data.is_valid(raise_exception=False)
-        is_captcha_valid = RecaptchaValidation(order_data['recaptcha'])
+
+        client_ip = get_client_ip(request)
+        is_captcha_valid = RecaptchaValidation(order_data['recaptcha'], settings.CHECKOUT_CHECK_TIMEOUT).is_valid
+        geo_data = self.get_geo_location(client_ip[0])
 
         if not is_valid or not is_captcha_valid or serialized_data.data['total'] < decimal.Decimal(0.50):
             return HttpResponseRedirect(get_url('/404'))
 
-        client_ip = get_client_ip(request)
-        geo_data = self.get_geo_location(client_ip[0])
         device_data = self.get_software_info(request.META['HTTP_USER_AGENT'])
         blacklist = self.check_blacklist(order_data['shop'], user_cookie, geo_data)
 
@@ -373,72 +377,41 @@ class OrderCommentView(APIView):
 
 
 class OrderStatView(APIView):
-    def daterange(self, start_date, end_date):
-        for n in range(int((end_date - start_date).days)):
-            yield start_date + timedelta(n)
-
-    def get_all_orders(self, shop):
-        all_orders = Order.objects.filter(shop=shop, current_status__gte=1)
-
-        return all_orders
-
-    def get_all_orders_profit(self, all_orders):
-        total_profit = 0
-        for order in all_orders:
-            total_profit += order.total
-
-        return total_profit
-
-    def get_past_orders(self, shop):
-        past_orders = Order.objects.filter(
-            created_at__gte=timezone.now() - timedelta(days=7),
-            shop=shop,
-            current_status__gte=1
-        ).values(
-            'created_at'
-        ).annotate(
-            days=ExtractDay('created_at'),
-        )
-
-        stats = [0] * 7
-        for order in past_orders:
-            for idx, date in enumerate(self.daterange(timezone.now() - timedelta(days=7), timezone.now())):
-                if order['created_at'].day == date.day + 1:
-                    stats[idx] += 1
-
-        return stats
-
-    def get_past_orders_profit(self, shop):
-        past_orders = Order.objects.filter(
-            created_at__gte=timezone.now() - timedelta(days=7),
-            shop=shop,
-            current_status__gte=1
-        )
-
-        past_profit = decimal.Decimal('0.0')
-        if past_orders.count() > 0:
-            for past_order in past_orders:
-                past_profit += past_order.total
-
-        return past_profit
-
     def get_new_customers(self, shop):
         new_customers = Customer.objects.filter(shop=shop).order_by('-id')[:5]
         return PublicCustomerInfoSerializer(new_customers, many=True).data
 
     def get_new_orders(self, shop):
-        new_orders = Order.objects.filter(shop=shop).order_by('-id')[:5]
-        return PublicOrderOwnerSerializer(new_orders, many=True).data
+        new_orders = get_order_list_queryset(Order.objects.filter(shop=shop).order_by('-id'))[:5]
+        return PublicOrderListSerializer(new_orders, many=True).data
+
+    def get_top_window(self, request):
+        window = request.query_params.get('window')
+
+        if window is None or window == 'all':
+            return None
 
-    def get_top_products(self, shop):
-        top_products = Product.objects.filter(shop=shop).annotate(
-            num_orders=Count('orderitem__quantity')
-        ).order_by('-num_orders')[:5]
+        if window not in [str(days) for days in BEST_SELLER_WINDOWS]:
+            raise CustomException(
+                'The window must be one of ' + ', '.join(str(days) for days in BEST_SELLER_WINDOWS) + ' or all.',
+                status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+
+        return int(window)
+
+    def get_top_products(self, shop, window=None):
+        best_sellers = get_best_sellers(shop.id, window)
+        products = Product.objects.prefetch_related(get_images_prefetch()).in_bulk(
+            [product_id for product_id, _, _, _ in best_sellers]
+        )
 
         top_products_data = []
-        for product in top_products:
-            product_object_data = PublicProductSerializer(product).data
-            product_object_data['orders'] = product.num_orders
+        for product_id, _, units, revenue in best_sellers:
+            product_object_data = PublicProductSerializer(products[product_id]).data
+            # the dashboard reads the units sold as `orders`
+            product_object_data['orders'] = units
+            product_object_data['units'] = units
+            product_object_data['revenue'] = revenue
             top_products_data.append(product_object_data)
 
         return top_products_data
@@ -451,19 +424,19 @@ class OrderStatView(APIView):
             )
 
         shop = Shop.objects.get(ref_id=shop_ref)
-        all_orders = self.get_all_orders(shop)
+        shop_stats = get_shop_stats(shop)
 
         data = {
             'success': True,
             'message': 'Orders have been been found.',
             "data": {
-                'all_orders': all_orders.count(),
-                'past_orders': self.get_past_orders(shop),
-                'total_profit': self.get_all_orders_profit(all_orders),
-                'past_profit': self.get_past_orders_profit(shop),
+                'all_orders': shop_stats['all_orders'],
+                'past_orders': shop_stats['past_orders'],
+                'total_profit': shop_stats['total_profit'],
+                'past_profit': decimal.Decimal(shop_stats['past_profit']),
                 'new_customers': self.get_new_customers(shop),
                 'new_orders': self.get_new_orders(shop),
-                'top_products': self.get_top_products(shop)
+                'top_products': self.get_top_products(shop, self.get_top_window(request))
             },
         }
 
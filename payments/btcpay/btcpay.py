@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -7,14 +8,16 @@ import os
 import hmac
 import hashlib
 import decimal
+import logging
 import btcpay
 
+from .invoices import INVOICE_REFRESH_ERRORS, save_invoice, refresh_invoice, get_invoice_state
+
 from payments.models import Payment, PaymentSession, PaymentProvider
 from payments.serializers import PaymentSessionSerializer
 from payments.views import save_payment, save_payment_session, send_virtual_product_email
-from products.views import change_stock
 from orders.models import Order
-from orders.serializers import OrderStatusSerializer
+from orders.reservations import commit_reservations
 from shared.exceptions import CustomException
 from shared.services import get_order_fees
 
@@ -52,13 +55,24 @@ class PaymentCryptoView(APIView):
 
                 return Response(data, status.HTTP_204_NO_CONTENT)
 
-            payment_methods = btcpay.Invoices.get_invoice_payment_methods(crypto_session.provider_data['invoiceId'])
-            payment_methods[0]['status'] = crypto_session.provider_data['type']
+            payment_method = get_invoice_state(crypto_session.provider_data['invoiceId'], order)
+
+            # BTCPay lists the payment methods of an invoice a moment after creating it
+            if payment_method is None:
+                data = {
+                    'success': False,
+                    'message': 'A crypto session has not been found.',
+                    'data': {},
+                }
+
+                return Response(data, status.HTTP_204_NO_CONTENT)
+
+            payment_method['status'] = crypto_session.provider_data['type']
 
             data = {
                 'success': True,
                 'message': 'A crypto session has been found.',
-                'data': payment_methods[0]
+                'data': payment_method
             }
 
             return Response(data, status.HTTP_200_OK)
@@ -115,6 +129,8 @@ class PaymentCryptoView(APIView):
 
         new_invoice = btcpay.Invoices.create_invoice(**invoice_data)
         payment_methods = btcpay.Invoices.get_invoice_payment_methods(new_invoice['id'])
+        save_invoice(new_invoice, payment_methods, order)
+
         payment_methods[0]['status'] = new_invoice['status']
 
         data = {
@@ -179,32 +195,36 @@ class PaymentCryptoIpnView(APIView):
         )
 
         if webhook_data['type'] in accepted_webhooks:
-            instance = OrderStatusSerializer()
-
             invoice = btcpay.Invoices.get_invoice(webhook_data['invoiceId'])
             order = Order.objects.get(ref_id=invoice['metadata']['orderId'])
 
+            # keeps the copy checkout polls current, the webhook is still handled when the copy cannot be refreshed
+            try:
+                refresh_invoice(invoice['id'], order, invoice)
+            except INVOICE_REFRESH_ERRORS as error:
+                logging.warning('Could not refresh invoice %s: %s', invoice['id'], error)
+
             match webhook_data['type']:
                 case 'InvoiceInvalid':
                     save_payment(2, webhook_data, order, True)
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': -2})
+                    order.transition(-2)
 
                 case 'InvoiceExpired':
                     save_payment(2, webhook_data, order, True)
 
                 case 'InvoiceSettled':
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 1})
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 2})
-
-                    save_payment(2, webhook_data, order, False)
-                    self.increase_crypto_balance(invoice['id'], order.shop)
-
-                    for order_item in order.items.all():
-                        change_stock(order_item.product_id, order_item.quantity, 'SUB')
-
-                    send_virtual_product_email(invoice['metadata']['email'], order)
-
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 3})
+                    # a repeated delivery finds the order already confirmed and does nothing, and a failure rolls the
+                    # confirmation back so the provider's retry can run it again
+                    with transaction.atomic():
+                        if order.transition(1, 2):
+                            save_payment(2, webhook_data, order, False)
+                            self.increase_crypto_balance(invoice['id'], order.shop)
+
+                            # an order paid after it expired and its stock ran out is left needing a refund
+                            if commit_reservations(order):
+                                send_virtual_product_email(invoice['metadata']['email'], order)
+
+                                order.transition(3)
 
                 case _:
                     save_payment_session(2, webhook_data, webhook_data['type'], order)
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.utils import timezone
+
+from datetime import datetime, timedelta
+
+import decimal
+import logging
+import btcpay
+import requests
+
+from payments.models import CryptoInvoice
+from orders.models import Order
+
+# the client only raises for HTTP errors, a response without the expected fields fails while it is read
+INVOICE_REFRESH_ERRORS = (requests.RequestException, KeyError, TypeError, ValueError, decimal.InvalidOperation)
+
+
+def save_invoice(invoice, payment_methods, order=None):
+    """
+    Stores the state of a BTCPay invoice as returned by its API, checkout reads this copy instead of the node.
+    """
+    if order is None:
+        order = Order.objects.get(ref_id=invoice['metadata']['orderId'])
+
+    expiration_time = invoice.get('expirationTime')
+
+    crypto_invoice, _ = CryptoInvoice.objects.update_or_create(
+        invoice_id=invoice['id'],
+        defaults={
+            'order': order,
+            'status': invoice['status'],
+            'amount': decimal.Decimal(str(invoice['amount'])),
+            'currency': invoice['currency'],
+            'payment_methods': payment_methods,
+            'expires_at': datetime.fromtimestamp(expiration_time, timezone.utc) if expiration_time else None,
+            'refreshed_at': timezone.now(),
+        }
+    )
+
+    return crypto_invoice
+
+
+def refresh_invoice(invoice_id, order=None, invoice=None):
+    if invoice is None:
+        invoice = btcpay.Invoices.get_invoice(invoice_id)
+
+    payment_methods = btcpay.Invoices.get_invoice_payment_methods(invoice_id)
+
+    # the client returns None instead of raising when a response is not JSON
+    if invoice is None or payment_methods is None:
+        raise ValueError('BTCPay did not return invoice ' + invoice_id + '.')
+
+    return save_invoice(invoice, payment_methods, order)
+
+
+def get_invoice_state(invoice_id, order=None):
+    """
+    Returns the first payment method of an invoice with the invoice status added, the shape the checkout page polls
+    for. Only invoices created before the local copy existed are fetched from BTCPay, once, and None is returned
+    when that fails.
+    """
+    crypto_invoice = CryptoInvoice.objects.filter(invoice_id=invoice_id).first()
+
+    if crypto_invoice is None:
+        try:
+            crypto_invoice = refresh_invoice(invoice_id, order)
+        except INVOICE_REFRESH_ERRORS as error:
+            logging.warning('Could not fetch invoice %s: %s', invoice_id, error)
+            return None
+
+    if not crypto_invoice.payment_methods:
+        return None
+
+    payment_method = dict(crypto_invoice.payment_methods[0])
+    payment_method['status'] = crypto_invoice.status
+
+    return payment_method
+
+
+def refresh_open_invoices(batch_size):
+    """
+    Refreshes the invoices that can still change and were not refreshed within CRYPTO_INVOICE_REFRESH_TTL, the
+    webhooks keep them current but a missed delivery would otherwise leave a checkout page stale. Returns the number
+    of invoices refreshed.
+    """
+    stale_invoices = (
+        CryptoInvoice.objects.filter(
+            status__in=CryptoInvoice.OPEN_STATUSES,
+            refreshed_at__lt=timezone.now() - timedelta(seconds=settings.CRYPTO_INVOICE_REFRESH_TTL),
+        )
+        .select_related('order')
+        .order_by('refreshed_at')[:batch_size]
+    )
+
+    refreshed = 0
+    for crypto_invoice in stale_invoices:
+        try:
+            refresh_invoice(crypto_invoice.invoice_id, crypto_invoice.order)
+            refreshed += 1
+        except INVOICE_REFRESH_ERRORS as error:
+            logging.warning('Could not refresh invoice %s: %s', crypto_invoice.invoice_id, error)
+
+    return refreshed
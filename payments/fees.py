@@ -0,0 +1,111 @@
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, TruncMonth
+
+from datetime import timezone as dt_timezone
+
+from .models import Payment, FeeLedgerEntry, ShopMonthlyFees
+
+from orders.models import get_paid_filter
+
+
+def get_fee_month(date_time):
+    return date_time.astimezone(dt_timezone.utc).date().replace(day=1)
+
+
+def add_to_monthly_fees(shop_id, month, amount, payments=1):
+    """
+    Adds a fee to a shop's monthly total with a single UPDATE, the row is created on the month's first fee.
+    """
+    updates = {'total': models.F('total') + amount, 'payments': models.F('payments') + payments}
+
+    if not ShopMonthlyFees.objects.filter(shop_id=shop_id, month=month).update(**updates):
+        ShopMonthlyFees.objects.get_or_create(shop_id=shop_id, month=month)
+        ShopMonthlyFees.objects.filter(shop_id=shop_id, month=month).update(**updates)
+
+
+def record_payment_fee(payment, order):
+    """
+    Appends the fee of a payment captured for a paid order to the ledger and to the shop's total for the month the
+    order was placed in.
+    """
+    month = get_fee_month(order.created_at)
+
+    with transaction.atomic():
+        FeeLedgerEntry.objects.create(payment=payment, shop_id=order.shop_id, month=month, amount=payment.fee)
+        add_to_monthly_fees(order.shop_id, month, payment.fee)
+
+
+def add_order_fees(order, sign):
+    """
+    Appends the fees of an order's captured payments to the ledger and the monthly total once the order counts as
+    paid again, or takes them out with a `sign` of -1 when it is refunded or charged back. Called by
+    Order.transition in the transaction that moves the order.
+    """
+    payments = list(order.payment_set.filter(canceled_at=None).values_list('id', 'fee'))
+
+    if not payments:
+        return
+
+    month = get_fee_month(order.created_at)
+
+    FeeLedgerEntry.objects.bulk_create([
+        FeeLedgerEntry(payment_id=payment_id, shop_id=order.shop_id, month=month, amount=sign * fee)
+        for payment_id, fee in payments
+    ])
+    add_to_monthly_fees(order.shop_id, month, sign * sum(fee for _, fee in payments), sign * len(payments))
+
+
+def reconcile_monthly_fees(shop_id=None):
+    """
+    Rebuilds the monthly fee totals of one shop, or of every shop, from the payments of paid orders, and appends a
+    correcting ledger entry to every captured payment whose entries do not add up to its fee while its order is paid,
+    or to nothing while it is not. Returns the number of months whose total was wrong.
+    """
+    payments = Payment.objects.filter(canceled_at=None)
+    monthly_fees = ShopMonthlyFees.objects.all()
+
+    if shop_id is not None:
+        payments = payments.filter(order__shop_id=shop_id)
+        monthly_fees = monthly_fees.filter(shop_id=shop_id)
+
+    paid_payments = payments.filter(get_paid_filter('order__current_status'))
+
+    corrections = [
+        FeeLedgerEntry(payment_id=payment_id, shop_id=payment_shop, month=get_fee_month(created_at),
+                       amount=expected - ledger_total)
+        for payment_id, payment_shop, created_at, expected, ledger_total in payments.annotate(
+            expected=models.Case(
+                models.When(get_paid_filter('order__current_status'), then=models.F('fee')),
+                default=models.Value(0),
+            ),
+            ledger_total=Coalesce(models.Sum('fee_entries__amount'), 0),
+        ).exclude(ledger_total=models.F('expected')).values_list(
+            'id', 'order__shop_id', 'order__created_at', 'expected', 'ledger_total'
+        )
+    ]
+
+    totals = {
+        (row['fees_shop'], row['fees_month']): (row['total'], row['payments'])
+        for row in paid_payments.order_by().values(
+            fees_shop=models.F('order__shop_id'),
+            fees_month=TruncMonth('order__created_at', output_field=models.DateField(), tzinfo=dt_timezone.utc),
+        ).annotate(total=models.Sum('fee'), payments=models.Count('id'))
+    }
+
+    previous_totals = {
+        (shop, month): (total, count)
+        for shop, month, total, count in monthly_fees.values_list('shop_id', 'month', 'total', 'payments')
+    }
+    wrong_months = sum(
+        1 for key in totals.keys() | previous_totals.keys() if totals.get(key) != previous_totals.get(key)
+    )
+
+    with transaction.atomic():
+        FeeLedgerEntry.objects.bulk_create(corrections, batch_size=1000)
+        monthly_fees.delete()
+        ShopMonthlyFees.objects.bulk_create([
+            ShopMonthlyFees(shop_id=shop, month=month, total=total, payments=count)
+            for (shop, month), (total, count) in totals.items()
+        ], batch_size=1000)
+
+    return wrong_months
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payments.fees import reconcile_monthly_fees
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the monthly shop fee totals from the payments and fills in missing fee ledger entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop-id', type=int, default=None, help='Only reconcile the fees of this shop.')
+
+    def handle(self, *args, **options):
+        wrong_months = reconcile_monthly_fees(options['shop_id'])
+        self.stdout.write('Corrected ' + str(wrong_months) + ' months of fees.')
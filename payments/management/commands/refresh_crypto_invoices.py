@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+import time
+
+from payments.btcpay.invoices import refresh_open_invoices
+
+
+class Command(BaseCommand):
+    help = 'Refreshes the local copy of open BTCPay invoices that were not updated recently.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Keep running and refresh again every given number of seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed = refresh_open_invoices(options['batch_size'])
+            self.stdout.write('Refreshed ' + str(refreshed) + ' invoices.')
+
+            if options['interval'] is None:
+                return
+
+            time.sleep(options['interval'])
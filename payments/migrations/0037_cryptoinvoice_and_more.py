@@ -0,0 +1,38 @@
+# Generated by Django 4.1.1 on 2026-10-18 04:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0023_alter_order_total'),
+        ('payments', '0036_alter_paymentprovider_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CryptoInvoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('invoice_id', models.CharField(max_length=64, unique=True)),
+                ('status', models.CharField(max_length=20)),
+                ('amount', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('currency', models.CharField(max_length=10)),
+                ('payment_methods', models.JSONField(default=list)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='orders.order')),
+            ],
+            options={
+                'db_table': 'payment_crypto_invoice',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cryptoinvoice',
+            index=models.Index(fields=['status', 'refreshed_at'], name='crypto_invoice_refresh_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.1 on 2026-10-18 04:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0011_shop_description'),
+        ('payments', '0037_cryptoinvoice_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopMonthlyFees',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField()),
+                ('total', models.BigIntegerField(default=0)),
+                ('payments', models.IntegerField(default=0)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shops.shop')),
+            ],
+            options={
+                'db_table': 'shop_monthly_fees',
+            },
+        ),
+        migrations.CreateModel(
+            name='FeeLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField()),
+                ('amount', models.BigIntegerField()),
+                ('payment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fee_entry', to='payments.payment')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shops.shop')),
+            ],
+            options={
+                'db_table': 'payment_fee_ledger',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shopmonthlyfees',
+            constraint=models.UniqueConstraint(fields=('shop', 'month'), name='shop_monthly_fees_unique_month'),
+        ),
+    ]
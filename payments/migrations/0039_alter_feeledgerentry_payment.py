@@ -0,0 +1,19 @@
+# Generated by Django 4.1.1 on 2026-10-18 05:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0038_shopmonthlyfees_feeledgerentry_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='feeledgerentry',
+            name='payment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fee_entries', to='payments.payment'),
+        ),
+    ]
@@ -91,3 +91,44 @@ class PaymentProvider(TimestampedModel):
 
     class Meta:
         db_table = 'payment_provider'
+
+
+class CryptoInvoice(TimestampedModel):
+    # BTCPay invoice statuses that can still change
+    OPEN_STATUSES = ('New', 'Processing')
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    invoice_id = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=20)
+    amount = models.DecimalField(decimal_places=8, max_digits=20)
+    currency = models.CharField(max_length=10)
+    payment_methods = models.JSONField(default=list)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'payment_crypto_invoice'
+        indexes = [models.Index(fields=['status', 'refreshed_at'], name='crypto_invoice_refresh_idx')]
+
+
+class FeeLedgerEntry(TimestampedModel):
+    # a payment gets a negative entry when its order is refunded or charged back, and a new one if it counts again
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='fee_entries')
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    # the UTC month the order was placed in, the month its fee is billed in
+    month = models.DateField()
+    amount = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'payment_fee_ledger'
+
+
+class ShopMonthlyFees(TimestampedModel):
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
+    month = models.DateField()
+    total = models.BigIntegerField(default=0)
+    payments = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'shop_monthly_fees'
+        constraints = [models.UniqueConstraint(fields=['shop', 'month'], name='shop_monthly_fees_unique_month')]
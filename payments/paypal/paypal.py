@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -13,9 +14,8 @@ import os
 from payments.models import PaymentProvider
 from payments.serializers import PaymentSessionSerializer
 from payments.views import check_banned_email, save_payment_session, save_payment, send_virtual_product_email
-from products.views import change_stock
 from orders.models import Order
-from orders.serializers import OrderStatusSerializer
+from orders.reservations import commit_reservations
 from shared.exceptions import CustomException
 from shops.models import Shop
 
@@ -304,29 +304,28 @@ class PaymentPayPalIpnView(PayPalClient, APIView):
             return Response(data, status=status.HTTP_403_FORBIDDEN)
 
         if request.data['event_type'] in accepted_webhooks:
-            instance = OrderStatusSerializer()
             order = Order.objects.get(ref_id=webhook_data['resource']['invoice_id'])
 
             match webhook_data['event_type']:
                 case 'PAYMENT.CAPTURE.DENIED':
                     save_payment(0, webhook_data, order, True)
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': -2})
+                    order.transition(-2)
 
                 case 'PAYMENT.AUTHORIZATION.VOIDED':
                     save_payment(0, webhook_data, order, True)
 
                 case 'PAYMENT.CAPTURE.COMPLETED':
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 1})
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 2})
+                    # a repeated delivery finds the order already confirmed and does nothing, and a failure rolls the
+                    # confirmation back so the provider's retry can run it again
+                    with transaction.atomic():
+                        if order.transition(1, 2):
+                            save_payment(0, webhook_data, order, False)
 
-                    save_payment(0, webhook_data, order, False)
+                            # an order paid after it expired and its stock ran out is left needing a refund
+                            if commit_reservations(order):
+                                send_virtual_product_email(webhook_data['resource']['custom_id'], order)
 
-                    for order_item in order.items.all():
-                        change_stock(order_item.product_id, order_item.quantity, 'SUB')
-
-                    send_virtual_product_email(webhook_data['resource']['custom_id'], order)
-
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 3})
+                                order.transition(3)
 
                 case _:
                     save_payment_session(0, webhook_data, webhook_data['event_type'], order)
@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -7,11 +8,10 @@ import os
 import stripe
 
 from orders.models import Order
-from orders.serializers import OrderStatusSerializer
+from orders.reservations import commit_reservations
 from payments.models import PaymentProvider
 from payments.serializers import PaymentSessionSerializer
 from payments.views import save_payment, save_payment_session, send_virtual_product_email
-from products.views import change_stock
 from shared.exceptions import CustomException
 from shared.services import get_order_fees
 
@@ -132,14 +132,13 @@ class PaymentStripeIpnView(APIView):
             return Response(data, status=status.HTTP_403_FORBIDDEN)
 
         if event['type'] in accepted_webhooks:
-            instance = OrderStatusSerializer()
             webhook_data = event['data']['object']
             order = Order.objects.get(ref_id=webhook_data['metadata']['order_ref'])
 
             match event['type']:
                 case 'payment_intent.payment_failed':
                     save_payment(1, webhook_data, order, True)
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': -2})
+                    order.transition(-2)
 
                 case 'payment_intent.canceled':
                     save_payment(1, webhook_data, order, True)
@@ -153,17 +152,17 @@ class PaymentStripeIpnView(APIView):
                     )
 
                 case 'payment_intent.succeeded':
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 1})
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 2})
+                    # a repeated delivery finds the order already confirmed and does nothing, and a failure rolls the
+                    # confirmation back so the provider's retry can run it again
+                    with transaction.atomic():
+                        if order.transition(1, 2):
+                            save_payment(1, webhook_data, order, False)
 
-                    save_payment(1, webhook_data, order, False)
+                            # an order paid after it expired and its stock ran out is left needing a refund
+                            if commit_reservations(order):
+                                send_virtual_product_email(webhook_data['metadata']['email'], order)
 
-                    for order_item in order.items.all():
-                        change_stock(order_item.product_id, order_item.quantity, 'SUB')
-
-                    send_virtual_product_email(webhook_data['metadata']['email'], order)
-
-                    OrderStatusSerializer.create(instance, {'order': order, 'status': 3})
+                                order.transition(3)
 
                 case _:
                     save_payment_session(1, webhook_data, event['type'], order)
@@ -1,3 +1,177 @@
+from django.db.models import Sum
 from django.test import TestCase
+from django.utils import timezone
 
-# Create your tests here.
+from unittest.mock import patch
+
+from datetime import timedelta
+
+import requests
+
+from orders.models import Order
+from payments.btcpay.invoices import save_invoice, get_invoice_state, refresh_open_invoices
+from payments.fees import record_payment_fee, reconcile_monthly_fees
+from payments.models import CryptoInvoice, FeeLedgerEntry, Payment, PaymentSession, ShopMonthlyFees
+from shared.services import get_total_fees
+from shared.testing import create_test_shop
+
+
+def get_invoice_payload(invoice_id, order, invoice_status='New'):
+    return {
+        'id': invoice_id,
+        'status': invoice_status,
+        'amount': '5.00',
+        'currency': 'USD',
+        'expirationTime': int((timezone.now() + timedelta(hours=1)).timestamp()),
+        'metadata': {'email': 'snow@castleblack.com', 'orderId': str(order.ref_id)},
+    }
+
+
+PAYMENT_METHODS = [{'paymentMethod': 'BTC', 'destination': 'bc1q', 'amount': '0.0002', 'due': '0.0002'}]
+
+
+class TestCryptoInvoices(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = create_test_shop()
+        cls.order = Order.objects.create(shop=shop, total=500)
+
+    def test_polling_reads_the_local_copy(self):
+        save_invoice(get_invoice_payload('inv-1', self.order), PAYMENT_METHODS)
+
+        with patch('btcpay.Invoices.get_invoice') as get_invoice, self.assertNumQueries(1):
+            state = get_invoice_state('inv-1')
+
+        get_invoice.assert_not_called()
+        self.assertEqual(state['status'], 'New')
+        self.assertEqual(state['destination'], 'bc1q')
+
+    def test_unknown_invoice_is_fetched_once(self):
+        with patch('btcpay.Invoices.get_invoice', return_value=get_invoice_payload('inv-2', self.order)), \
+                patch('btcpay.Invoices.get_invoice_payment_methods', return_value=PAYMENT_METHODS) as get_methods:
+            get_invoice_state('inv-2', self.order)
+            get_invoice_state('inv-2', self.order)
+
+        self.assertEqual(get_methods.call_count, 1)
+
+    def test_only_stale_open_invoices_are_refreshed(self):
+        save_invoice(get_invoice_payload('inv-stale', self.order), PAYMENT_METHODS)
+        save_invoice(get_invoice_payload('inv-fresh', self.order), PAYMENT_METHODS)
+        save_invoice(get_invoice_payload('inv-settled', self.order, 'Settled'), PAYMENT_METHODS)
+
+        CryptoInvoice.objects.exclude(invoice_id='inv-fresh').update(
+            refreshed_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        invoice = get_invoice_payload('inv-stale', self.order, 'Processing')
+
+        with patch('btcpay.Invoices.get_invoice', return_value=invoice), \
+                patch('btcpay.Invoices.get_invoice_payment_methods', return_value=PAYMENT_METHODS):
+            self.assertEqual(refresh_open_invoices(batch_size=10), 1)
+
+        self.assertEqual(CryptoInvoice.objects.get(invoice_id='inv-stale').status, 'Processing')
+
+    def test_one_malformed_invoice_does_not_stop_the_refresh(self):
+        save_invoice(get_invoice_payload('inv-broken', self.order), PAYMENT_METHODS)
+        save_invoice(get_invoice_payload('inv-stale', self.order), PAYMENT_METHODS)
+
+        CryptoInvoice.objects.update(refreshed_at=timezone.now() - timedelta(minutes=5))
+
+        invoices = [None, get_invoice_payload('inv-stale', self.order, 'Processing')]
+
+        with patch('btcpay.Invoices.get_invoice', side_effect=invoices), \
+                patch('btcpay.Invoices.get_invoice_payment_methods', return_value=PAYMENT_METHODS):
+            self.assertEqual(refresh_open_invoices(batch_size=10), 1)
+
+        self.assertEqual(CryptoInvoice.objects.get(invoice_id='inv-stale').status, 'Processing')
+
+    def test_invoice_without_payment_methods_is_not_found_yet(self):
+        save_invoice(get_invoice_payload('inv-new', self.order), [])
+        PaymentSession.objects.create(order=self.order, provider=PaymentSession.CRYPTO,
+                                      provider_data={'invoiceId': 'inv-new', 'type': 'InvoiceCreated'})
+
+        response = self.client.get('/api/v1/payments/crypto/' + str(self.order.ref_id))
+
+        self.assertEqual(response.status_code, 204)
+
+    def test_unknown_invoice_that_cannot_be_fetched_is_not_found(self):
+        PaymentSession.objects.create(order=self.order, provider=PaymentSession.CRYPTO,
+                                      provider_data={'invoiceId': 'inv-gone', 'type': 'InvoiceCreated'})
+
+        with patch('btcpay.Invoices.get_invoice', side_effect=requests.ConnectionError):
+            response = self.client.get('/api/v1/payments/crypto/' + str(self.order.ref_id))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(CryptoInvoice.objects.filter(invoice_id='inv-gone').exists())
+
+    def test_webhook_is_handled_when_the_copy_cannot_be_refreshed(self):
+        webhook = {'type': 'InvoiceCreated', 'invoiceId': 'inv-3'}
+
+        with patch('payments.btcpay.btcpay.PaymentCryptoIpnView.verify_webhook', return_value=True), \
+                patch('btcpay.Invoices.get_invoice', return_value=get_invoice_payload('inv-3', self.order)), \
+                patch('btcpay.Invoices.get_invoice_payment_methods', side_effect=requests.ConnectionError):
+            response = self.client.post('/api/v1/payments/crypto/ipn', webhook, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(PaymentSession.objects.filter(order=self.order, provider=PaymentSession.CRYPTO).exists())
+        self.assertFalse(CryptoInvoice.objects.filter(invoice_id='inv-3').exists())
+
+
+class TestFeeLedger(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+
+    def capture_payment(self, fee):
+        order = Order.objects.create(shop=self.shop, total=500, current_status=3)
+        payment = Payment.objects.create(order=order, provider=Payment.STRIPE, fee=fee, captured_at=timezone.now())
+        record_payment_fee(payment, order)
+
+        return payment
+
+    def test_total_fees_are_read_from_the_monthly_total(self):
+        self.capture_payment(15)
+        self.capture_payment(25)
+
+        with self.assertNumQueries(1):
+            total_fees = get_total_fees(self.shop.ref_id)
+
+        self.assertEqual(total_fees, 40)
+        self.assertEqual(FeeLedgerEntry.objects.filter(shop=self.shop).count(), 2)
+
+    def test_reconcile_rebuilds_the_monthly_total(self):
+        self.capture_payment(15)
+        payment = self.capture_payment(25)
+
+        payment.fee_entries.all().delete()
+        ShopMonthlyFees.objects.filter(shop=self.shop).update(total=0)
+
+        self.assertEqual(reconcile_monthly_fees(self.shop.id), 1)
+        self.assertEqual(reconcile_monthly_fees(self.shop.id), 0)
+        self.assertEqual(get_total_fees(self.shop.ref_id), 40)
+        self.assertEqual(FeeLedgerEntry.objects.filter(shop=self.shop).count(), 2)
+
+    def get_ledger_total(self):
+        return FeeLedgerEntry.objects.filter(shop=self.shop).aggregate(total=Sum('amount'))['total']
+
+    def test_refund_takes_the_fee_out_of_the_ledger(self):
+        payment = self.capture_payment(15)
+        self.capture_payment(25)
+
+        self.assertTrue(payment.order.transition(-3))
+
+        self.assertEqual(get_total_fees(self.shop.ref_id), 25)
+        self.assertEqual(self.get_ledger_total(), 25)
+        self.assertEqual(reconcile_monthly_fees(self.shop.id), 0)
+        self.assertEqual(self.get_ledger_total(), 25)
+
+    def test_won_chargeback_counts_the_fee_again(self):
+        order = self.capture_payment(15).order
+
+        order.transition(-4)
+        self.assertEqual(get_total_fees(self.shop.ref_id), 0)
+
+        order.transition(-6)
+        self.assertEqual(get_total_fees(self.shop.ref_id), 15)
+        self.assertEqual(self.get_ledger_total(), 15)
+        self.assertEqual(reconcile_monthly_fees(self.shop.id), 0)
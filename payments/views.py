@@ -11,15 +11,17 @@ from uuid import uuid4
 import os
 import stripe
 
+from .fees import record_payment_fee
 from .models import PaymentProvider
 from .serializers import PublicPaymentProviderSerializer, PaymentSessionSerializer, PaymentSerializer
 
 from blacklists.models import Blacklist
-from orders.serializers import OrderItemStatusSerializer
-from products.models import DigitalProduct
+from orders.keys import allocate_keys
+from orders.models import is_paid_status, add_to_daily_stats, get_stats_day
 from products.serializers import PublicProductSerializer
 from shared.exceptions import CustomException
-from shared.services import send_mailgun_email, get_url
+from shared.outbox import queue_email
+from shared.services import get_url
 from shops.models import Shop
 from users.models import User
 from users.serializers import PublicUserInfoSerializer
@@ -96,7 +98,13 @@ def save_payment(provider, provider_data, order, canceled=False):
             status.HTTP_400_BAD_REQUEST
         )
 
-    serialized_data.create(serialized_data.data)
+    payment = serialized_data.create(serialized_data.data)
+
+    # an order counted before its payment was saved is missing the fee, the fees of unpaid orders are added by
+    # Order.transition once they are paid
+    if not canceled and is_paid_status(order.current_status):
+        record_payment_fee(payment, order)
+        add_to_daily_stats(order.shop_id, get_stats_day(order.created_at), fees=payment.fee)
 
 
 def save_payment_session(provider, provider_data, provider_status, order):
@@ -136,23 +144,12 @@ def send_virtual_product_email(email_address, order):
     total = 0
     order_items_detailed = []
 
-    for order_item in order.items.all():
-        keys = []
-
-        for _ in range(0, order_item.quantity):
-            key = DigitalProduct.objects.filter(product=order_item.product, status=0).first()
-            key.status = 1
-            key.recipient_email = email_address
-            key.save()
-
-            order_item.purchased_keys.add(key)
-            keys.append(key.key)
+    order_items = list(order.items.select_related('product'))
+    allocated_keys = allocate_keys(order_items, email_address)
 
-            total += order_item.price
-
-        instance = OrderItemStatusSerializer()
-        OrderItemStatusSerializer.create(instance, {'item': order_item, 'status': 1})
-        OrderItemStatusSerializer.create(instance, {'item': order_item, 'status': 2})
+    for order_item in order_items:
+        keys = allocated_keys[order_item.id]
+        total += order_item.price * len(keys)
 
         product_data = PublicProductSerializer(order_item.product).data
 
@@ -166,6 +163,8 @@ def send_virtual_product_email(email_address, order):
 
         order_items_detailed.append(product)
 
+    order.items.transition(1, 2)
+
     full_name = 'Anonymous'
     buyer = User.objects.filter(id=order.customer.id).first()
 
@@ -190,7 +189,8 @@ def send_virtual_product_email(email_address, order):
         context
     )
 
-    send_mailgun_email(email_address, email_subject, email_body, 'order')
+    # queued in the webhook's transaction, so the keys email is stored together with the claimed keys
+    queue_email(email_address, email_subject, email_body, 'order')
 
 
 class PaymentProviderView(APIView):
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from uuid import uuid4
+
+from .models import Product
+from .serializers import CatalogProductSerializer, get_images_prefetch
+
+from themes.storefront import get_storefront_version
+
+
+def get_catalog_index_key(shop_id, version):
+    return 'catalog:index:' + str(shop_id) + ':' + version
+
+
+def get_catalog_version_key(product_id):
+    return 'catalog:version:' + str(product_id)
+
+
+def get_catalog_entry_key(product_id):
+    return 'catalog:product:' + str(product_id)
+
+
+def get_catalog_queryset(**filters):
+    # lower statuses first so a listed product wins a slug that is shared with a deleted one
+    return Product.objects.filter(**filters).order_by('status', 'name')
+
+
+def build_catalog_index(shop_id):
+    """
+    Maps the ref ids and slugs of a shop's products to their ids and lists the listed ones, without serializing any
+    product, so rebuilding it after a change is one small query.
+    """
+    catalog_index = {'products': {}, 'slugs': {}, 'listed': []}
+    listed_products = []
+
+    for product_id, ref_id, slug, product_status, name in get_catalog_queryset(shop_id=shop_id).values_list(
+        'id', 'ref_id', 'slug', 'status', 'name'
+    ):
+        catalog_index['products'][str(ref_id)] = product_id
+        catalog_index['slugs'][slug] = str(ref_id)
+
+        if product_status == Product.LISTED:
+            listed_products.append((name, str(ref_id)))
+
+    catalog_index['listed'] = [ref_id for _, ref_id in sorted(listed_products)]
+
+    return catalog_index
+
+
+def get_catalog_index(shop_id):
+    # keyed by the storefront version, which every committed change to a shop's products bumps
+    index_key = get_catalog_index_key(shop_id, get_storefront_version(shop_id))
+    catalog_index = cache.get(index_key)
+
+    if catalog_index is None:
+        catalog_index = build_catalog_index(shop_id)
+        cache.set(index_key, catalog_index, settings.CATALOG_SNAPSHOT_TTL)
+
+    return catalog_index
+
+
+def invalidate_catalog_products(product_ids):
+    cache.set_many({get_catalog_version_key(product_id): uuid4().hex for product_id in product_ids}, None)
+
+
+def invalidate_catalog_products_on_commit(product_ids):
+    transaction.on_commit(lambda: invalidate_catalog_products(product_ids))
+
+
+def get_catalog_entries(product_ids):
+    """
+    Returns the serialized products of `product_ids` by id. Every product is cached on its own together with the
+    version it was built for, so a change only rebuilds the products it touched and a page only reads the products
+    it shows. Versions are read before the products are queried and bumped after a change commits, so an entry built
+    from data a change has since replaced never matches the current version.
+    """
+    version_keys = {product_id: get_catalog_version_key(product_id) for product_id in product_ids}
+    entry_keys = {product_id: get_catalog_entry_key(product_id) for product_id in product_ids}
+    cached = cache.get_many([*version_keys.values(), *entry_keys.values()])
+
+    versions = {}
+    for product_id, version_key in version_keys.items():
+        if version_key not in cached:
+            cache.add(version_key, uuid4().hex, None)
+            cached[version_key] = cache.get(version_key)
+
+        versions[product_id] = cached[version_key]
+
+    entries = {}
+    for product_id, entry_key in entry_keys.items():
+        version, product_data = cached.get(entry_key, (None, None))
+
+        if version is not None and version == versions[product_id]:
+            entries[product_id] = product_data
+
+    missing_ids = [product_id for product_id in product_ids if product_id not in entries]
+
+    if missing_ids:
+        products = list(get_catalog_queryset(id__in=missing_ids).prefetch_related(get_images_prefetch()))
+        new_entries = {}
+
+        for product, product_data in zip(products, CatalogProductSerializer(products, many=True).data):
+            entries[product.id] = dict(product_data)
+            new_entries[entry_keys[product.id]] = (versions[product.id], entries[product.id])
+
+        cache.set_many(new_entries, settings.CATALOG_SNAPSHOT_TTL)
+
+    return entries
+
+
+def get_catalog_products(shop_id, ref_ids):
+    product_ids = get_catalog_index(shop_id)['products']
+    ids = [product_ids[ref_id] for ref_id in ref_ids if ref_id in product_ids]
+    entries = get_catalog_entries(ids)
+
+    return [entries[product_id] for product_id in ids if product_id in entries]
+
+
+def get_catalog_product(shop_id, slug=None, ref_id=None):
+    if slug is not None:
+        ref_id = get_catalog_index(shop_id)['slugs'].get(slug)
+
+    products = get_catalog_products(shop_id, [str(ref_id)])
+
+    # callers adjust quantities per visitor, keep the cached entry untouched
+    return dict(products[0]) if products else None
+
+
+def get_listed_catalog_products(shop_id):
+    return get_catalog_products(shop_id, get_catalog_index(shop_id)['listed'])
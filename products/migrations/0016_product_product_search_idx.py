@@ -0,0 +1,19 @@
+# Generated by Django 4.1.1 on 2026-10-18 04:31
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_alter_product_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector(models.Func(models.F('name'), models.Value('@.-_+'), models.Value('     '), function='TRANSLATE'), config='simple'), name='product_search_idx'),
+        ),
+    ]
@@ -1,9 +1,11 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from uuid import uuid4
 
 from shared.models import TimestampedModel
+from shared.search import get_search_document
 from shops.models import Shop
 
 
@@ -42,6 +44,7 @@ class Product(TimestampedModel):
 
     class Meta:
         db_table = 'product'
+        indexes = [GinIndex(get_search_document('name'), name='product_search_idx')]
 
 
 class DigitalProduct(TimestampedModel):
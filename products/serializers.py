@@ -1,13 +1,30 @@
+from django.db.models import Prefetch
 from django.utils.text import slugify
 from rest_framework import serializers
 
 from .models import Product, DigitalProduct
 
 from shops.models import Shop
-from file_uploads.models import FileData
+from file_uploads.models import FileData, ItemImage
 from file_uploads.serializers import PublicImageSerializer
 
 
+def get_images_prefetch(lookup='itemimage_set'):
+    return Prefetch(lookup, queryset=ItemImage.objects.exclude(status=-1), to_attr='listed_images')
+
+
+def get_keys_prefetch(lookup='digitalproduct_set'):
+    return Prefetch(lookup, queryset=DigitalProduct.objects.filter(status=0), to_attr='listed_keys')
+
+
+def get_product_images(product):
+    # querysets built with get_images_prefetch already carry the images
+    if hasattr(product, 'listed_images'):
+        return product.listed_images
+
+    return FileData.objects.filter(itemimage__item_id=product.id).exclude(status=-1)
+
+
 class ProductSerializer(serializers.ModelSerializer):
     shop = serializers.UUIDField()
     slug = serializers.SerializerMethodField()
@@ -34,7 +51,11 @@ class ProductSerializer(serializers.ModelSerializer):
         instance.price = validated_data.get('price')
         instance.min_order_quantity = validated_data.get('min_order_quantity')
         instance.max_order_quantity = validated_data.get('max_order_quantity')
-        instance.save()
+        # stock is only changed by conditional UPDATEs, saving the value read with the instance would undo them
+        instance.save(update_fields=[
+            'name', 'description', 'status', 'slug', 'shop', 'price', 'min_order_quantity', 'max_order_quantity',
+            'updated_at',
+        ])
 
         return instance
 
@@ -56,8 +77,7 @@ class PublicProductSerializer(serializers.ModelSerializer):
     max_order_quantity = serializers.SerializerMethodField()
 
     def get_images(self, request):
-        images = FileData.objects.filter(itemimage__item_id=request.id).exclude(status=-1)
-        image_data = PublicImageSerializer(instance=images, many=True).data
+        image_data = PublicImageSerializer(instance=get_product_images(request), many=True).data
 
         return image_data
 
@@ -82,18 +102,27 @@ class PublicProductSerializer(serializers.ModelSerializer):
                   'max_order_quantity', 'ref_id', 'stock']
 
 
+class CatalogProductSerializer(PublicProductSerializer):
+    class Meta:
+        model = Product
+        fields = PublicProductSerializer.Meta.fields + ['status']
+
+
 class PublicProductOwnerSerializer(serializers.ModelSerializer):
     images = serializers.SerializerMethodField()
     keys = serializers.SerializerMethodField()
 
     def get_images(self, request):
-        images = FileData.objects.filter(itemimage__item_id=request.id).exclude(status=-1)
-        image_data = PublicImageSerializer(instance=images, many=True).data
+        image_data = PublicImageSerializer(instance=get_product_images(request), many=True).data
 
         return image_data
 
     def get_keys(self, request):
-        keys = DigitalProduct.objects.filter(product=request.id, status=0)
+        if hasattr(request, 'listed_keys'):
+            keys = request.listed_keys
+        else:
+            keys = DigitalProduct.objects.filter(product=request.id, status=0)
+
         key_data = PublicDigitalProductSerializer(instance=keys, many=True).data
 
         return key_data
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+
+# sent with `product_ids` once stock changed by an UPDATE statement, which skips post_save, is committed
+stock_changed = Signal()
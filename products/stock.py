@@ -0,0 +1,86 @@
+from django.db import connection, models, transaction
+from django.db.models import Case, When, Value, F
+from django.utils import timezone
+
+from .models import Product
+from .signals import stock_changed
+
+
+def send_stock_changed(product_ids):
+    # the catalog and storefront are only refreshed once the new stock is visible to other requests
+    transaction.on_commit(lambda: stock_changed.send(sender=Product, product_ids=product_ids))
+
+
+def reserve_stocks(quantities):
+    """
+    Takes stock for several products with one UPDATE, `quantities` maps product ids to units, and returns the ids of
+    the products that had enough. Listed products left with less than their minimum order quantity are unlisted as
+    out of stock in the same statement, so concurrent checkouts can never oversell or leave them listed.
+    """
+    if not quantities:
+        return set()
+
+    product_ids = sorted(quantities)
+
+    # the rows are locked in id order first so a reservation never deadlocks with another one of the same products
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            WITH locked AS (
+                SELECT id FROM product WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+            )
+            UPDATE product
+            SET stock = product.stock - requested.quantity,
+                status = CASE
+                    WHEN product.status = %s AND (
+                        product.stock = requested.quantity
+                        OR product.stock < product.min_order_quantity + requested.quantity
+                    ) THEN %s
+                    ELSE product.status
+                END,
+                updated_at = %s
+            FROM unnest(%s::bigint[], %s::integer[]) AS requested (id, quantity)
+            WHERE product.id = requested.id AND product.id IN (SELECT id FROM locked)
+                AND product.stock >= requested.quantity
+            RETURNING product.id
+            ''',
+            [
+                product_ids, Product.LISTED, Product.UNLISTED_OOS, timezone.now(),
+                product_ids, [quantities[product_id] for product_id in product_ids],
+            ]
+        )
+        reserved_ids = {product_id for product_id, in cursor.fetchall()}
+
+    if reserved_ids:
+        send_stock_changed(sorted(reserved_ids))
+
+    return reserved_ids
+
+
+def reserve_stock(product_id, quantity):
+    return product_id in reserve_stocks({product_id: quantity})
+
+
+def release_stock(quantities):
+    """
+    Gives reserved stock back, `quantities` maps product ids to units. Products that were unlisted for running out
+    are listed again once they have enough stock for their minimum order quantity.
+    """
+    # products are always locked in id order so a release never deadlocks with a reservation of the same products
+    for product_id, quantity in sorted(quantities.items()):
+        Product.objects.filter(id=product_id).update(
+            stock=F('stock') + quantity,
+            status=Case(
+                When(
+                    status=Product.UNLISTED_OOS,
+                    stock__gte=F('min_order_quantity') - quantity,
+                    then=Value(Product.LISTED),
+                ),
+                default=F('status'),
+                output_field=models.SmallIntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+
+    if quantities:
+        send_stock_changed(list(quantities))
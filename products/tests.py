@@ -1,3 +1,191 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from unittest.mock import patch
+
+from file_uploads.models import ItemImage
+from products.catalog import get_catalog_product, get_listed_catalog_products
+from products.models import Product, DigitalProduct
+from products.stock import reserve_stock, release_stock
+from products.views import ProductView
+from products.serializers import (
+    CatalogProductSerializer,
+    ProductSerializer,
+    PublicProductOwnerSerializer,
+    PublicProductSerializer,
+    get_images_prefetch,
+    get_keys_prefetch,
+)
+from shared.testing import create_test_shop
+
+
+class TestProductSerializers(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+
+    def create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(shop=self.shop, name='Sword ' + str(i), price=500, status=1)
+            ItemImage.objects.create(name='sword.png', original_name='sword.png', path='/media/items/sword.png',
+                                     size=1, item=product)
+            DigitalProduct.objects.create(key='key-' + str(i), product=product)
+
+    def test_public_list_queries_do_not_grow_with_products(self):
+        self.create_products(5)
+
+        with self.assertNumQueries(2):
+            products = Product.objects.filter(shop=self.shop).prefetch_related(get_images_prefetch())
+            data = PublicProductSerializer(products, many=True).data
+
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[0]['images'][0]['path'], '/media/items/sword.png')
+
+    def test_owner_list_queries_do_not_grow_with_products(self):
+        self.create_products(5)
+
+        with self.assertNumQueries(3):
+            products = Product.objects.filter(shop=self.shop).prefetch_related(
+                get_images_prefetch(), get_keys_prefetch()
+            )
+            data = PublicProductOwnerSerializer(products, many=True).data
+
+        self.assertEqual([len(product['keys']) for product in data], [1] * 5)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestCatalog(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+
+    def setUp(self):
+        cache.clear()
+
+    def create_product(self, name, **kwargs):
+        return Product.objects.create(shop=self.shop, name=name, slug=name.lower(), price=500, **kwargs)
+
+    def test_storefront_reads_do_not_query_after_build(self):
+        longclaw = self.create_product('Longclaw', status=1, stock=3, max_order_quantity=5)
+        self.create_product('Ice', status=0)
+
+        get_listed_catalog_products(self.shop.id)
+
+        with self.assertNumQueries(0):
+            products = get_listed_catalog_products(self.shop.id)
+            product = get_catalog_product(self.shop.id, slug='longclaw')
+
+        self.assertEqual([product['name'] for product in products], ['Longclaw'])
+        self.assertEqual(product['ref_id'], str(longclaw.ref_id))
+        self.assertEqual(product['max_order_quantity'], 3)
+        self.assertTrue(product['available'])
+
+    def test_committed_product_changes_rebuild_snapshot(self):
+        longclaw = self.create_product('Longclaw', status=1, stock=3)
+        get_listed_catalog_products(self.shop.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            longclaw.stock = 0
+            longclaw.save()
+            ItemImage.objects.create(name='wolf.png', original_name='wolf.png', path='/media/items/wolf.png', size=1,
+                                     item=longclaw)
+            self.create_product('Needle', status=1, stock=1)
+
+        product = get_catalog_product(self.shop.id, ref_id=longclaw.ref_id)
+        self.assertFalse(product['available'])
+        self.assertEqual([image['path'] for image in product['images']], ['/media/items/wolf.png'])
+        self.assertEqual([p['name'] for p in get_listed_catalog_products(self.shop.id)], ['Longclaw', 'Needle'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            longclaw.delete()
+
+        self.assertIsNone(get_catalog_product(self.shop.id, slug='longclaw'))
+
+    def test_only_changed_products_are_serialized_again(self):
+        longclaw = self.create_product('Longclaw', status=1, stock=3)
+        self.create_product('Needle', status=1, stock=1)
+        get_listed_catalog_products(self.shop.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            longclaw.price = 900
+            longclaw.save()
+
+        with patch('products.catalog.CatalogProductSerializer', wraps=CatalogProductSerializer) as serializer:
+            products = get_listed_catalog_products(self.shop.id)
+
+        self.assertEqual([product['price'] for product in products], [900, 500])
+        self.assertEqual(serializer.call_args.args[0], [longclaw])
+
+    def test_rolled_back_changes_do_not_reach_snapshot(self):
+        longclaw = self.create_product('Longclaw', status=1, stock=3)
+        get_listed_catalog_products(self.shop.id)
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            Product.objects.filter(id=longclaw.id).update(price=900)
+            Product.objects.get(id=longclaw.id).save()
+            get_listed_catalog_products(self.shop.id)
+            transaction.set_rollback(True)
+
+        self.assertEqual(get_catalog_product(self.shop.id, slug='longclaw')['price'], 500)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestStockReservation(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = create_test_shop()
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(shop=self.shop, name='Longclaw', slug='longclaw', price=500, stock=5,
+                                              status=1, min_order_quantity=2)
+
+    def test_reservation_is_one_conditional_update(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(reserve_stock(self.product.id, 2))
+
+        self.assertFalse(reserve_stock(self.product.id, 4))
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.status), (3, 1))
+
+    def test_product_is_unlisted_below_minimum_and_listed_again_on_release(self):
+        self.assertTrue(reserve_stock(self.product.id, 4))
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.status), (1, -2))
+
+        release_stock({self.product.id: 4})
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.status), (5, 1))
+
+    def test_unlisted_products_stay_unlisted(self):
+        Product.objects.filter(id=self.product.id).update(status=0)
+
+        self.assertTrue(reserve_stock(self.product.id, 5))
+        release_stock({self.product.id: 5})
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.status, 0)
+
+    def test_keys_are_added_without_overwriting_reservations(self):
+        stale_product = Product.objects.get(id=self.product.id)
+        self.assertTrue(reserve_stock(self.product.id, 2))
+
+        ProductView().add_keys_to_product(stale_product, 'winter\nis\ncoming')
+        ProductSerializer().update(stale_product, {
+            'name': 'Longclaw', 'status': 1, 'shop': self.shop.ref_id, 'price': 500, 'min_order_quantity': 2,
+            'max_order_quantity': 10,
+        })
+
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 6)
+
+    def test_catalog_is_refreshed_after_commit(self):
+        self.assertTrue(get_catalog_product(self.shop.id, slug='longclaw')['available'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(self.product.id, 5)
+
+        self.assertFalse(get_catalog_product(self.shop.id, slug='longclaw')['available'])
@@ -9,39 +9,13 @@ import os
 import boto3
 
 from .models import Product, DigitalProduct
-from .serializers import ProductSerializer, PublicProductOwnerSerializer
+from .serializers import ProductSerializer, PublicProductOwnerSerializer, get_images_prefetch, get_keys_prefetch
+from .stock import release_stock, reserve_stock
 
 from shared.exceptions import CustomException
 from file_uploads.models import ItemImage
 
 
-def change_stock(product, quantity, operation):
-    try:
-        product = Product.objects.get(id=product)
-    except Product.DoesNotExist:
-        raise CustomException(
-            'Product with ref id ' + ' does not exist.',
-            status.HTTP_404_NOT_FOUND
-        )
-
-    if operation == 'SUB':
-        if product.stock < quantity:
-            raise CustomException(
-                'The quantity of ' + product.name + ' exceeds stock levels.',
-                status.HTTP_409_CONFLICT
-            )
-
-        if (product.stock - quantity) == 0 or (product.stock - quantity) < product.min_order_quantity:
-            product.status = -2
-            product.save()
-
-        product.stock -= quantity
-    else:
-        product.stock += quantity
-
-    product.save()
-    
-
 class ProductView(APIView):
     serializer_class = ProductSerializer
 
@@ -59,11 +33,6 @@ class ProductView(APIView):
     def check_existing_product(self, shop, name):
         return Product.objects.filter(shop__ref_id=shop, name=name).exclude(status=-1).exists()
 
-    def check_stock(self, product):
-        stock = DigitalProduct.objects.filter(product=product).exclude(status=1).exclude(status=-1).count()
-        product.stock = stock
-        product.save()
-
     def add_keys_to_product(self, product, keys):
         delimiter = detect(
             keys,
@@ -72,17 +41,17 @@ class ProductView(APIView):
         )
 
         if delimiter is None:
-            if keys.strip():
-                DigitalProduct.objects.create(key=keys, product=product)
+            key_lines = [keys] if keys.strip() else []
         else:
-            keys_lines = keys.split(delimiter)
-            for key_line in keys_lines:
-                key_line.replace(' ', '')
+            key_lines = [key_line for key_line in keys.split(delimiter) if key_line.strip()]
 
-                if key_line.strip():
-                    DigitalProduct.objects.create(key=key_line, product=product)
+        for key_line in key_lines:
+            DigitalProduct.objects.create(key=key_line, product=product)
 
-        self.check_stock(product)
+        # new keys are added to the stock in one UPDATE like released reservations, so a concurrent checkout's
+        # reservation is never overwritten
+        if key_lines:
+            release_stock({product.id: len(key_lines)})
 
     def add_images_to_product(self, product, images):
         valid_extensions = ['jpg', 'jpeg', 'png', 'gif', 'webp']
@@ -119,6 +88,7 @@ class ProductView(APIView):
                 products = (
                     Product.objects.filter(shop__ref_id=shop_ref, shop__owner=request.user)
                     .exclude(status=-1)
+                    .prefetch_related(get_images_prefetch(), get_keys_prefetch())
                     .order_by("name")
                 )
 
@@ -131,7 +101,11 @@ class ProductView(APIView):
 
         elif product_ref is not None:
             try:
-                products = Product.objects.exclude(status=-1).get(ref_id=product_ref, shop__owner=request.user)
+                products = (
+                    Product.objects.exclude(status=-1)
+                    .prefetch_related(get_images_prefetch(), get_keys_prefetch())
+                    .get(ref_id=product_ref, shop__owner=request.user)
+                )
             except Product.DoesNotExist:
                 raise CustomException(
                     'A product with id ' + str(product_ref) + ' was not found.',
@@ -298,10 +272,13 @@ class ProductView(APIView):
         if digital_ref is not None:
             try:
                 key = DigitalProduct.objects.get(ref_id=digital_ref, product__shop__owner=request.user)
+                is_available = key.status not in (-1, 1)
                 key.status = -1
                 key.save()
 
-                self.check_stock(key.product)
+                # an unsold key is taken out of the stock the way a reservation is, when it is not all reserved
+                if is_available:
+                    reserve_stock(key.product_id, 1)
             except Product.DoesNotExist:
                 raise CustomException(
                     'There was an issue deleting key ' + str(digital_ref) + '.',
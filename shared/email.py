@@ -8,7 +8,7 @@ from smtplib import SMTPException
 from trench.backends.base import AbstractMessageDispatcher
 from trench.responses import DispatchResponse, FailedDispatchResponse, SuccessfulDispatchResponse
 
-from .services import send_mailgun_email
+from .outbox import queue_email
 
 
 class SendMailMessageDispatcher(AbstractMessageDispatcher):
@@ -22,7 +22,7 @@ class SendMailMessageDispatcher(AbstractMessageDispatcher):
                 context
             )
 
-            send_mailgun_email(self._to, email_subject, email_body, 'auth')
+            queue_email(self._to, email_subject, email_body, 'auth')
 
             return SuccessfulDispatchResponse(details='Email message with MFA code has been sent.')
 
@@ -0,0 +1,56 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import threading
+
+
+class MailSinkHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        message = parse_qs(self.rfile.read(length).decode())
+
+        with self.server.lock:
+            status_code = self.server.responses.pop(0) if self.server.responses else 200
+
+            if status_code == 200:
+                self.server.messages.append({'path': self.path, **message})
+
+                if self.server.echo:
+                    print(', '.join(message.get('to', [])) + ': ' + message.get('subject', [''])[0])
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{"message": "Queued. Thank you."}' if status_code == 200 else b'{"message": "Rejected."}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MailSink(ThreadingHTTPServer):
+    """
+    Stand-in for the Mailgun messages API that keeps what it receives, for running the outbox worker offline. Point
+    MAILGUN_API_URL at `url`; status codes queued in `responses` are answered in order before accepting again.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, echo=False):
+        super().__init__(('127.0.0.1', port), MailSinkHandler)
+
+        self.echo = echo
+        self.lock = threading.Lock()
+        self.messages = []
+        self.responses = []
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:' + str(self.server_address[1]) + '/'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
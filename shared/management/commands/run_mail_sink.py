@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from shared.mail_sink import MailSink
+
+
+class Command(BaseCommand):
+    help = 'Runs a local stand-in for the Mailgun API that prints the emails it receives.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8025)
+
+    def handle(self, *args, **options):
+        sink = MailSink(options['port'], echo=True)
+        self.stdout.write('Set MAILGUN_API_URL=' + sink.url + ' for the send_emails worker.')
+
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            sink.server_close()
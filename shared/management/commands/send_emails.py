@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+import time
+
+from shared.outbox import deliver_emails
+
+
+class Command(BaseCommand):
+    help = 'Delivers the emails waiting in the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Keep running and drain the outbox again every given number of seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            metrics = deliver_emails(options['batch_size'])
+            self.stdout.write(
+                'Sent ' + str(metrics['sent']) + ', retrying ' + str(metrics['retried']) + ', failed '
+                + str(metrics['failed']) + ' emails in ' + str(metrics['requests']) + ' requests.'
+            )
+
+            if options['interval'] is None:
+                return
+
+            time.sleep(options['interval'])
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 # Create your models here.
@@ -14,3 +15,38 @@ class TimestampedModel(models.Model):
         # per-model basis as needed, but reverse-chronological is a good
         # default ordering for most models.
         ordering = ['-created_at', '-updated_at']
+
+
+class OutboundEmail(TimestampedModel):
+    FAILED = -1
+    PENDING = 0
+    SENT = 1
+
+    STATUS_CHOICES = (
+        (FAILED, 'failed'),
+        (PENDING, 'pending'),
+        (SENT, 'sent'),
+    )
+
+    AUTH = 'auth'
+    ORDER = 'order'
+
+    PURPOSE_CHOICES = (
+        (AUTH, 'auth'),
+        (ORDER, 'order'),
+    )
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    purpose = models.CharField(max_length=5, choices=PURPOSE_CHOICES)
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'email_outbox'
+        ordering = ['id']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx')]
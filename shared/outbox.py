@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from datetime import timedelta
+from requests.adapters import HTTPAdapter
+
+import os
+import json
+import logging
+import requests
+import threading
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+MAILGUN_SENDERS = {
+    OutboundEmail.AUTH: ('MG_API_SECRET', 'Enfront <notice@enfront.io>', 'mg.enfront.io'),
+    OutboundEmail.ORDER: ('MG_ORDER_API_SECRET', 'Enfront <notice@orders.enfront.io>', 'orders.enfront.io'),
+}
+
+
+def queue_email(recipient, subject, body, purpose):
+    """
+    Stores an email for the outbox worker to deliver. It is written in the caller's transaction, so an email about
+    something that is rolled back is never sent.
+    """
+    return OutboundEmail.objects.create(recipient=recipient, subject=subject, body=body, purpose=purpose)
+
+
+mailgun_session = None
+mailgun_session_lock = threading.Lock()
+
+
+def get_mailgun_session():
+    global mailgun_session
+
+    if mailgun_session is None:
+        with mailgun_session_lock:
+            if mailgun_session is None:
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=4))
+                session.mount('http://', HTTPAdapter(pool_connections=2, pool_maxsize=4))
+                mailgun_session = session
+
+    return mailgun_session
+
+
+def group_emails(emails):
+    # emails with the same content go out as one batch message, Mailgun still addresses each recipient separately
+    groups = {}
+
+    for email in emails:
+        groups.setdefault((email.purpose, email.subject, email.body), []).append(email)
+
+    for group in groups.values():
+        for start in range(0, len(group), settings.MAILGUN_BATCH_SIZE):
+            yield group[start:start + settings.MAILGUN_BATCH_SIZE]
+
+
+def post_emails(emails):
+    """
+    Sends one message to every recipient of `emails` and returns None when Mailgun accepted it, otherwise the error
+    and whether trying again later can help.
+    """
+    if settings.MAILGUN_API_URL is None:
+        logger.info('Mailgun is not configured, not sending %s emails: %s', len(emails), emails[0].subject)
+        return None
+
+    secret_name, email_address, domain_name = MAILGUN_SENDERS[emails[0].purpose]
+    recipients = list(dict.fromkeys(email.recipient for email in emails))
+
+    data = {
+        'from': email_address,
+        'to': recipients,
+        'subject': emails[0].subject,
+        'html': emails[0].body,
+    }
+
+    if len(recipients) > 1:
+        data['recipient-variables'] = json.dumps({recipient: {} for recipient in recipients})
+
+    try:
+        response = get_mailgun_session().post(
+            settings.MAILGUN_API_URL + domain_name + '/messages',
+            auth=('api', os.environ.get(secret_name, '')),
+            data=data,
+            timeout=settings.MAILGUN_TIMEOUT
+        )
+    except requests.RequestException as error:
+        return str(error), True
+
+    if response.status_code == 200:
+        return None
+
+    is_retryable = response.status_code == 429 or response.status_code >= 500
+    return 'Mailgun responded with ' + str(response.status_code) + ': ' + response.text[:500], is_retryable
+
+
+def get_retry_time(now, attempts):
+    return now + timedelta(seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_emails(batch_size, now):
+    """
+    Claims up to `batch_size` due emails by counting their attempt and moving their next attempt past
+    EMAIL_OUTBOX_CLAIM_TIMEOUT. Other workers skip them from the moment this commits, and an email whose worker died
+    while sending it is picked up again once its claim times out.
+    """
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt_at = now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+            email.updated_at = now
+
+        OutboundEmail.objects.bulk_update(emails, ['attempts', 'next_attempt_at', 'updated_at'])
+
+    return emails
+
+
+def deliver_email_batch(batch_size, metrics):
+    """
+    Delivers up to `batch_size` due emails and adds the outcome to `metrics`. Returns the number of emails handled.
+
+    Mailgun is called outside of any transaction, so the result of every request it answered is saved even when a
+    later one raises, and several workers can drain the outbox side by side.
+    """
+    now = timezone.now()
+    emails = claim_emails(batch_size, now)
+    handled_emails = []
+
+    try:
+        for group in group_emails(emails):
+            error = post_emails(group)
+            metrics['requests'] += 1
+
+            for email in group:
+                email.updated_at = timezone.now()
+
+                if error is None:
+                    email.status = OutboundEmail.SENT
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    metrics['sent'] += 1
+                elif error[1] and email.attempts < settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                    email.next_attempt_at = get_retry_time(now, email.attempts)
+                    email.last_error = error[0]
+                    metrics['retried'] += 1
+                else:
+                    email.status = OutboundEmail.FAILED
+                    email.last_error = error[0]
+                    metrics['failed'] += 1
+
+            handled_emails.extend(group)
+
+            if error is not None:
+                logger.warning('Could not deliver %s emails: %s', len(group), error[0])
+    finally:
+        OutboundEmail.objects.bulk_update(
+            handled_emails, ['status', 'next_attempt_at', 'sent_at', 'last_error', 'updated_at']
+        )
+
+    return len(emails)
+
+
+def deliver_emails(batch_size):
+    """
+    Drains every email that is due and returns the delivery counts: emails sent, scheduled for a retry and given up
+    on, and the number of requests made to Mailgun.
+    """
+    metrics = {'sent': 0, 'retried': 0, 'failed': 0, 'requests': 0}
+
+    while deliver_email_batch(batch_size, metrics) == batch_size:
+        pass
+
+    return metrics
@@ -3,17 +3,21 @@ import os
 
 
 class RecaptchaValidation:
-    def __init__(self, token=None):
+    def __init__(self, token=None, timeout=None):
         data = {
             'secret': os.environ['RECAPTCHA_PRIVATE_KEY'],
             'response': token,
         }
 
-        self.test_token(data)
+        self.is_valid = self.test_token(data, timeout)
 
-    def test_token(self, data):
-        request = requests.post('https://www.google.com/recaptcha/api/siteverify', data=data)
-        result = request.json()
+    def test_token(self, data, timeout=None):
+        try:
+            request = requests.post('https://www.google.com/recaptcha/api/siteverify', data=data, timeout=timeout)
+            result = request.json()
+        except (requests.RequestException, ValueError):
+            # a token that cannot be verified is treated as invalid
+            return False
 
         if result['success'] and result['score'] >= 0.5:
             return True
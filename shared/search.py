@@ -0,0 +1,56 @@
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db.models import F, Func, Value
+
+import re
+import uuid
+
+
+# characters that join the words of emails and names, they are read as spaces so every part can be searched for
+WORD_SEPARATORS = '@.-_+'
+
+# a prefix matches every word that starts with it and shorter ones match too many (think "com") to be worth the scan
+MIN_PREFIX_LENGTH = 4
+
+
+def split_words(field):
+    return Func(F(field), Value(WORD_SEPARATORS), Value(' ' * len(WORD_SEPARATORS)), function='TRANSLATE')
+
+
+def get_search_document(*fields):
+    """
+    Full text document of `fields`. The search indexes are built on this expression and postgres only uses them for
+    queries that compare against the same one, so models and searches both get it from here.
+    """
+    return SearchVector(*[split_words(field) for field in fields], config='simple')
+
+
+def get_search_query(text):
+    """
+    Matches documents that have every word of `text`, the last one may still be being typed and matches the words
+    it starts. A short last word after others is left out, and text inside a word (e.g. "arly" in "tarly") does
+    not match. Returns None when `text` has no words.
+    """
+    words = re.findall(r'[^\W_]+', text.lower())
+
+    if not words:
+        return None
+
+    if len(words) == 1 or len(words[-1]) >= MIN_PREFIX_LENGTH:
+        words[-1] += ':*'
+    else:
+        words.pop()
+
+    return SearchQuery(' & '.join(words), config='simple', search_type='raw')
+
+
+def get_uuid_range(text):
+    """
+    Returns the lowest and highest UUID starting with the hex digits of `text`, which the unique index on a ref id
+    can look up directly, or None when `text` cannot be the start of a UUID.
+    """
+    hex_digits = text.strip().replace('-', '').lower()
+
+    if not 4 <= len(hex_digits) <= 32 or not re.fullmatch('[0-9a-f]+', hex_digits):
+        return None
+
+    return uuid.UUID(hex_digits.ljust(32, '0')), uuid.UUID(hex_digits.ljust(32, 'f'))
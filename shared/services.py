@@ -1,16 +1,15 @@
+from django.utils import timezone
 from django.utils.text import slugify
 from rest_framework import status
 
-import datetime
-import requests
 import decimal
 import math
 import os
 
 from users.models import User
 from shops.models import Shop
-from orders.models import Order
-from payments.models import Payment
+from payments.fees import get_fee_month
+from payments.models import ShopMonthlyFees
 from shared.exceptions import CustomException
 
 
@@ -71,23 +70,13 @@ def get_subscription(user_pk=None, user_ref=None, shop_ref=None):
 
 
 def get_total_fees(shop_ref):
-    today = datetime.date.today()
-    orders = Order.objects.filter(
-        shop__ref_id=shop_ref,
-        created_at__year=today.year,
-        created_at__month=today.month
+    total = (
+        ShopMonthlyFees.objects.filter(shop__ref_id=shop_ref, month=get_fee_month(timezone.now()))
+        .values_list('total', flat=True)
+        .first()
     )
 
-    total_fees = decimal.Decimal(0.0)
-    for order in orders:
-        if order.current_status >= 1:
-            try:
-                payment = Payment.objects.get(order=order, canceled_at=None)
-                total_fees += payment.fee
-            except Payment.DoesNotExist:
-                continue
-
-    return total_fees
+    return decimal.Decimal(total or 0)
 
 
 def get_order_fees(order_total, shop_ref, provider, round_up=True):
@@ -124,31 +113,6 @@ def get_url(path, subpath=''):
     return os.environ['SITE_SCHEME'] + os.environ['SITE_URL'] + path
 
 
-def send_mailgun_email(recipient, subject, body, purpose):
-    if purpose == 'auth':
-        mg_secret = os.environ['MG_API_SECRET']
-        email_address = 'Enfront <notice@enfront.io>'
-        domain_name = 'mg.enfront.io'
-    else:
-        mg_secret = os.environ['MG_ORDER_API_SECRET']
-        email_address = 'Enfront <notice@orders.enfront.io>'
-        domain_name = 'orders.enfront.io'
-
-    if os.environ['PAYPAL_ENVIRONMENT'] == 'LiveEnvironment':
-        requests.post(
-            'https://api.mailgun.net/v3/' + domain_name + '/messages',
-            auth=('api', mg_secret),
-            data={
-                'from': email_address,
-                'to': [recipient],
-                'subject': subject,
-                'html': body
-            }
-        )
-    else:
-        print(subject)
-
-
 form_errors = {}
 
 
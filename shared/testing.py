@@ -0,0 +1,37 @@
+from countries.models import Country
+from shops.models import Shop
+from users.models import User
+
+
+def create_test_shop(**shop_fields):
+    """
+    Creates the shop most tests run against. Its owner and country are created too unless they are passed in
+    `shop_fields`, which override any field of the shop.
+    """
+    if 'owner' not in shop_fields:
+        shop_fields['owner'] = User.objects.create_user(**{
+            'email': 'snow@castleblack.com',
+            'username': 'YouKnowNothing',
+            'first_name': 'John',
+            'last_name': 'Snow',
+            'password': 'ghost!123',
+            'shop': True,
+        })
+
+    if 'country' not in shop_fields:
+        shop_fields['country'] = Country.objects.create(**{
+            'num_code': 122,
+            'iso_2': 'US',
+            'iso_3': 'USA',
+            'name': 'United States',
+            'continent': 'North America',
+            'stripe_available': True,
+            'paypal_available': True
+        })
+
+    return Shop.objects.create(**{
+        'name': 'The Wall',
+        'domain': 'https://castleblack.com',
+        'email': 'snow@castleblack.com',
+        **shop_fields,
+    })
@@ -1,3 +1,86 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
-# Create your tests here.
+from unittest.mock import patch
+
+from shared.mail_sink import MailSink
+from shared.models import OutboundEmail
+from shared.outbox import queue_email, deliver_emails
+
+
+class TestEmailOutbox(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sink = MailSink().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.sink.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.sink.messages.clear()
+        self.sink.responses.clear()
+
+        settings_override = override_settings(MAILGUN_API_URL=self.sink.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_emails_with_same_content_are_batched(self):
+        for recipient in ['snow@castleblack.com', 'sam@castleblack.com']:
+            queue_email(recipient, 'Winter is coming', '<p>Brace yourselves</p>', 'order')
+
+        queue_email('snow@castleblack.com', 'Your code is 123456', '<p>123456</p>', 'auth')
+
+        metrics = deliver_emails(batch_size=10)
+
+        self.assertEqual(metrics, {'sent': 3, 'retried': 0, 'failed': 0, 'requests': 2})
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.SENT).count(), 3)
+
+        batch = next(message for message in self.sink.messages if message['subject'] == ['Winter is coming'])
+        self.assertEqual(batch['path'], '/orders.enfront.io/messages')
+        self.assertEqual(sorted(batch['to']), ['sam@castleblack.com', 'snow@castleblack.com'])
+        self.assertIn('recipient-variables', batch)
+
+    def test_temporary_errors_are_retried_later(self):
+        email = queue_email('snow@castleblack.com', 'Activate Your Account', '<p>Hi</p>', 'auth')
+        self.sink.responses.append(503)
+
+        self.assertEqual(deliver_emails(batch_size=10)['retried'], 1)
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(deliver_emails(batch_size=10)['requests'], 0)
+
+        OutboundEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+
+        self.assertEqual(deliver_emails(batch_size=10)['sent'], 1)
+        self.assertEqual(len(self.sink.messages), 1)
+
+    def test_rejected_emails_are_not_retried(self):
+        email = queue_email('snow@castleblack.com', 'Activate Your Account', '<p>Hi</p>', 'auth')
+        self.sink.responses.append(400)
+
+        self.assertEqual(deliver_emails(batch_size=10)['failed'], 1)
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.FAILED)
+        self.assertIn('400', email.last_error)
+
+    def test_sent_emails_are_kept_when_a_later_request_raises(self):
+        sent_email = queue_email('snow@castleblack.com', 'Activate Your Account', '<p>Hi</p>', 'auth')
+        claimed_email = queue_email('snow@castleblack.com', 'Winter is coming', '<p>Brace yourselves</p>', 'order')
+
+        with patch('shared.outbox.post_emails', side_effect=[None, RuntimeError]), self.assertRaises(RuntimeError):
+            deliver_emails(batch_size=10)
+
+        sent_email.refresh_from_db()
+        self.assertEqual(sent_email.status, OutboundEmail.SENT)
+
+        # the other email is retried once its claim times out
+        claimed_email.refresh_from_db()
+        self.assertEqual((claimed_email.status, claimed_email.attempts), (OutboundEmail.PENDING, 1))
+        self.assertGreater(claimed_email.next_attempt_at, timezone.now())
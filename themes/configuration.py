@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.text import slugify
+
+from botocore.exceptions import ClientError
+
+import os
+import json
+import boto3
+
+from .loaders.mirror import theme_mirror
+
+from products.catalog import get_catalog_product
+
+
+def get_theme_settings(theme):
+    settings_path = theme_mirror.get_path(slugify(theme.name), os.path.join('config', 'settings.json'))
+
+    with open(settings_path, 'r', encoding='utf_8') as settings_file:
+        return json.load(settings_file)
+
+
+def get_default_config(theme):
+    default_config = {}
+
+    for key in get_theme_settings(theme):
+        if isinstance(key, dict):
+            for k in key:
+                if k == 'settings':
+                    for s in key[k]:
+                        default_config[s['id']] = s['default']
+
+    return default_config
+
+
+def get_config_file(shop_id, version, file_name):
+    """
+    Returns the configuration a shop saved for a theme, or None when it was never uploaded. Entries are keyed by the
+    shop's storefront version, which is bumped whenever a configuration is saved.
+    """
+    config_key = ':'.join(['storefront', 'config-file', str(shop_id), version, file_name])
+    config_file = cache.get(config_key)
+
+    if config_file is None:
+        try:
+            s3 = boto3.client('s3')
+            config_object = s3.get_object(Bucket='jkpay', Key=os.path.join('themes', 'configurations', file_name))
+            config_file = {'config': json.load(config_object['Body'])}
+        except ClientError as error:
+            if error.response['Error']['Code'] != 'NoSuchKey':
+                raise
+
+            config_file = {'config': None}
+
+        cache.set(config_key, config_file, settings.THEME_CONFIG_CACHE_TTL)
+
+    return config_file['config']
+
+
+def add_item_details_to_config(config, shop):
+    for key in config:
+        if isinstance(config[key], dict) and 'item' in config[key]:
+            product_data = get_catalog_product(shop.id, ref_id=config[key]['id'])
+
+            if product_data is None:
+                return None
+
+            config[key]['name'] = product_data['name']
+            config[key]['price'] = product_data['price']
+            config[key]['slug'] = product_data['slug']
+            config[key]['images'] = product_data['images']
+            config[key]['available'] = product_data['available']
+
+
+def get_theme_config(shop, theme, theme_configuration, version):
+    """
+    Returns the theme's default settings overlaid with the shop's saved configuration, with featured items filled in
+    from the catalog. The result is cached per storefront version, so saving a configuration, product or theme drops
+    it along with the rendered pages.
+    """
+    config_key = ':'.join(['storefront', 'config', str(shop.id), version, str(theme.ref_id)])
+    config = cache.get(config_key)
+
+    if config is not None:
+        return config
+
+    config = get_default_config(theme)
+    is_complete = True
+
+    if theme_configuration.file_name != '':
+        try:
+            config.update(get_config_file(shop.id, version, theme_configuration.file_name) or {})
+        except ClientError:
+            # render with the defaults but try S3 again on the next request
+            is_complete = False
+
+    add_item_details_to_config(config, shop)
+
+    if is_complete:
+        cache.set(config_key, config, settings.THEME_CONFIG_CACHE_TTL)
+
+    return config
@@ -0,0 +1,50 @@
+from collections import abc
+
+
+class LazyDrop:
+    """
+    Template global that is only computed when a template dereferences it. The value is loaded at most once, so
+    every use within a request shares it.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._loaded = False
+        self._value = None
+
+    @property
+    def value(self):
+        if not self._loaded:
+            self._value = self._loader()
+            self._loaded = True
+
+        return self._value
+
+    def __liquid__(self):
+        # truthiness, comparisons and the default filter see the loaded value, so a missing product is still nil
+        return self.value
+
+    def __str__(self):
+        return str(self.value)
+
+
+class MappingDrop(LazyDrop, abc.Mapping):
+    def __getitem__(self, key):
+        if self.value is None:
+            raise KeyError(key)
+
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value or {})
+
+    def __len__(self):
+        return len(self.value or {})
+
+
+class SequenceDrop(LazyDrop, abc.Sequence):
+    def __getitem__(self, index):
+        return self.value[index]
+
+    def __len__(self):
+        return len(self.value)
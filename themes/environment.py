@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.utils.text import slugify
+
+from liquid import Environment
+from liquid_extra import filters
+
+import os
+import threading
+
+from .loaders.loader import CustomFileSystemLoader, FragmentTag
+from .filters.cdn_url import cdn_url
+from .filters.collection_url import collection_url
+from .filters.media_url import media_url
+from .filters.money import money
+from .filters.product_url import product_url
+from .filters.script_url import script_url
+from .filters.style_url import style_url
+from .tags.form_tag import FormTag
+
+
+theme_environments = {}
+theme_environments_lock = threading.Lock()
+
+
+def create_theme_environment():
+    env = Environment(loader=CustomFileSystemLoader(os.path.join(settings.BASE_DIR, 'themes')))
+
+    env.add_filter('cdn_url', cdn_url)
+    env.add_filter('collection_url', collection_url)
+    env.add_filter('media_url', media_url)
+    env.add_filter('money', money)
+    env.add_filter('product_url', product_url)
+    env.add_filter('script_tag', filters.script_tag)
+    env.add_filter('script_url', script_url)
+    env.add_filter('slugify', slugify)
+    env.add_filter('style_url', style_url)
+    env.add_filter('stylesheet_tag', filters.stylesheet_tag)
+
+    env.add_tag(FragmentTag)
+    env.add_tag(FormTag)
+
+    return env
+
+
+def get_theme_environment(theme):
+    """
+    Returns the Liquid environment for a theme, building it the first time the theme is rendered by this worker.
+    Nothing request specific lives on the environment; per request data is passed in when rendering.
+    """
+    env = theme_environments.get(theme.ref_id)
+
+    if env is None:
+        with theme_environments_lock:
+            env = theme_environments.get(theme.ref_id)
+
+            if env is None:
+                env = create_theme_environment()
+                theme_environments[theme.ref_id] = env
+
+    return env
@@ -1,7 +1,7 @@
-from liquid.filter import string_filter, with_environment
+from liquid.filter import string_filter, with_context
 
 
 @string_filter
-@with_environment
-def money(amount, environment):
-    return str(environment.globals['currency']) + str(format(int(amount) / 100, '.02f'))
+@with_context
+def money(amount, context):
+    return str(context.resolve('currency')) + str(format(int(amount) / 100, '.02f'))
@@ -1,17 +1,17 @@
 import os
 
-from liquid.filter import string_filter, with_environment
+from liquid.filter import string_filter, with_context
 from slugify import slugify
 
 
 @string_filter
-@with_environment
-def script_url(asset_name, environment):
+@with_context
+def script_url(asset_name, context):
     theme_template_path = os.path.join(
         'themes',
         'templates',
         'official',
-        slugify(environment.globals['theme'].name),
+        slugify(context.resolve('theme').name),
         'assets',
         'js'
     )
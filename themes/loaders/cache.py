@@ -0,0 +1,113 @@
+import os
+import time
+import logging
+import threading
+
+import boto3
+
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.utils.text import slugify
+from liquid.exceptions import TemplateNotFound
+
+
+class CachedTemplate:
+    __slots__ = ('etag', 'tree', 'checked_at')
+
+    def __init__(self, etag, tree, checked_at):
+        self.etag = etag
+        self.tree = tree
+        self.checked_at = checked_at
+
+
+class ThemeTemplateCache:
+    """
+    Process level cache of parsed theme templates.
+
+    Entries are keyed by theme and template path and remember the S3 ETag they were parsed from. Within the TTL an
+    entry is served without touching S3, after that it is revalidated with a conditional GET that only downloads and
+    re-parses the file when the ETag has changed. The least recently used entries are evicted once `max_size` is hit.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._s3 = None
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            self._s3 = boto3.client('s3')
+
+        return self._s3
+
+    def get_template_path(self, theme, template_name):
+        return os.path.join('themes', 'templates', 'official', slugify(theme.name), template_name)
+
+    def get_template(self, env, theme, template_name):
+        cache_key = (str(theme.ref_id), template_name)
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+
+        if entry is None or time.monotonic() - entry.checked_at > self.ttl:
+            entry = self.revalidate(env, theme, template_name, cache_key, entry)
+
+        return env.template_class(env=env, parse_tree=entry.tree, name=template_name, globals=env.make_globals())
+
+    def revalidate(self, env, theme, template_name, cache_key, entry):
+        template_path = self.get_template_path(theme, template_name)
+        request = {'Bucket': 'jkpay', 'Key': template_path}
+
+        if entry is not None:
+            request['IfNoneMatch'] = entry.etag
+
+        try:
+            template_file = self.s3.get_object(**request)
+        except ClientError as error:
+            error_code = error.response['Error']['Code']
+
+            if error_code in ('NoSuchKey', '404'):
+                self.invalidate(cache_key)
+                raise TemplateNotFound(template_name)
+
+            if entry is None:
+                raise
+
+            # 304 means the cached copy is still current, anything else is an S3 hiccup where a stale template
+            # is better than a failed page
+            if error_code != '304':
+                logging.warning('Serving stale theme template %s: %s', template_path, error)
+
+            entry.checked_at = time.monotonic()
+            return entry
+
+        source = template_file['Body'].read().decode('utf_8')
+        entry = CachedTemplate(template_file['ETag'], env.parse(source), time.monotonic())
+
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return entry
+
+    def invalidate(self, cache_key=None):
+        with self._lock:
+            if cache_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(cache_key, None)
+
+
+template_cache = ThemeTemplateCache(
+    max_size=settings.THEME_TEMPLATE_CACHE_SIZE,
+    ttl=settings.THEME_TEMPLATE_CACHE_TTL,
+)
@@ -1,11 +1,15 @@
 import os
-import boto3
+import threading
 
+from pathlib import Path
+from django.utils.text import slugify
 from liquid import Context
 from liquid.exceptions import TemplateNotFound
 from liquid.loaders import TemplateSource, FileExtensionLoader
 from liquid.builtin.tags.include_tag import IncludeNode, IncludeTag
 
+from .mirror import theme_mirror
+
 
 class FragmentNode(IncludeNode):
     tag = 'fragment'
@@ -17,25 +21,60 @@ class FragmentTag(IncludeTag):
 
 
 class CustomFileSystemLoader(FileExtensionLoader):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fragments = {}
+        self.fragments_lock = threading.Lock()
+
+    def get_fragment_uptodate(self, theme_slug, template_name, mtime):
+        def uptodate():
+            try:
+                path = theme_mirror.get_path(theme_slug, os.path.join('fragments', template_name + '.liquid'))
+                return os.path.getmtime(path) == mtime
+            except FileNotFoundError:
+                return False
+
+        return uptodate
+
+    def load_with_context(self, context: Context, name: str, **kwargs: str):
+        if kwargs.get('tag') != 'fragment':
+            return super().load_with_context(context, name, **kwargs)
+
+        # Liquid does not cache templates loaded with a context, so parsed fragments are kept here per theme and
+        # reused for as long as the mirrored file is unchanged
+        cache_key = (slugify(context.resolve('theme').name), name)
+        template = self.fragments.get(cache_key)
+
+        if template is not None and template.is_up_to_date:
+            return template
+
+        try:
+            source, filename, uptodate, matter = self.get_source_with_context(context, name, **kwargs)
+        except Exception as err:
+            raise TemplateNotFound(name) from err
+
+        template = context.env.from_string(source, name=name, path=Path(filename), matter=matter)
+        template.uptodate = uptodate
+
+        with self.fragments_lock:
+            self.fragments[cache_key] = template
+
+        return template
+
     def get_source_with_context(self, context: Context, template_name: str, **kwargs: str) -> TemplateSource:
         if kwargs.get('tag') == 'fragment':
-            s3 = boto3.client('s3')
+            theme_slug = slugify(context.resolve('theme').name)
 
             try:
-                theme_template_path = os.path.join(
-                    'themes',
-                    'templates',
-                    'official',
-                    'portrait',
-                    'fragments',
-                    template_name + '.liquid'
-                )
-
-                section = s3.get_object(Bucket='jkpay', Key=theme_template_path)
-                section_decoded = section['Body'].read().decode('utf_8')
-            except s3.exceptions.NoSuchKey:
+                path = theme_mirror.get_path(theme_slug, os.path.join('fragments', template_name + '.liquid'))
+                mtime = os.path.getmtime(path)
+
+                with open(path, 'r', encoding='utf_8') as section:
+                    section_decoded = section.read()
+            except FileNotFoundError:
                 raise TemplateNotFound(template_name)
 
-            return TemplateSource(section_decoded, template_name, super()._uptodate)
+            uptodate = self.get_fragment_uptodate(theme_slug, template_name, mtime)
+            return TemplateSource(section_decoded, path, uptodate, None)
 
         return super().get_source(context.env, template_name)
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+
+import boto3
+
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+
+
+class ThemeMirror:
+    """
+    Keeps a local copy of each official theme's template tree so fragments can be read from disk.
+
+    Only template sources (`.liquid` and `.json` files) are mirrored, assets are still served from S3. A theme is
+    revalidated at most once per TTL with a single listing of its S3 prefix; files whose ETag differs from the local
+    manifest are downloaded again and files that were removed upstream are deleted. Workers share the mirror and
+    serialize syncs with a lock file.
+    """
+
+    manifest_name = '.manifest.json'
+    mirrored_extensions = ('.liquid', '.json')
+
+    def __init__(self, root, ttl):
+        self.root = root
+        self.ttl = ttl
+        self._synced_at = {}
+        self._lock = threading.Lock()
+        self._s3 = None
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            self._s3 = boto3.client('s3')
+
+        return self._s3
+
+    def get_prefix(self, theme_slug):
+        return '/'.join(['themes', 'templates', 'official', theme_slug, ''])
+
+    def get_theme_dir(self, theme_slug):
+        return os.path.join(self.root, theme_slug)
+
+    def get_path(self, theme_slug, relative_path):
+        self.sync(theme_slug)
+
+        theme_dir = self.get_theme_dir(theme_slug)
+        path = os.path.normpath(os.path.join(theme_dir, relative_path))
+
+        if not path.startswith(theme_dir + os.sep):
+            raise FileNotFoundError(relative_path)
+
+        return path
+
+    def is_fresh(self, theme_slug):
+        synced_at = self._synced_at.get(theme_slug)
+        return synced_at is not None and time.monotonic() - synced_at < self.ttl
+
+    def sync(self, theme_slug):
+        if self.is_fresh(theme_slug):
+            return
+
+        with self._lock:
+            if self.is_fresh(theme_slug):
+                return
+
+            theme_dir = self.get_theme_dir(theme_slug)
+            os.makedirs(theme_dir, exist_ok=True)
+
+            with open(os.path.join(self.root, '.' + theme_slug + '.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                try:
+                    self.sync_theme_dir(theme_slug, theme_dir)
+                except (BotoCoreError, ClientError) as error:
+                    if not os.path.exists(os.path.join(theme_dir, self.manifest_name)):
+                        raise
+
+                    logging.warning('Serving stale mirror of theme %s: %s', theme_slug, error)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            self._synced_at[theme_slug] = time.monotonic()
+
+    def get_remote_manifest(self, theme_slug):
+        prefix = self.get_prefix(theme_slug)
+        manifest = {}
+
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket='jkpay', Prefix=prefix):
+            for theme_object in page.get('Contents', []):
+                relative_path = theme_object['Key'][len(prefix):]
+
+                if relative_path.endswith(self.mirrored_extensions):
+                    manifest[relative_path] = theme_object['ETag']
+
+        return manifest
+
+    def get_local_manifest(self, theme_dir):
+        try:
+            with open(os.path.join(theme_dir, self.manifest_name), 'r') as manifest_file:
+                return json.load(manifest_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def sync_theme_dir(self, theme_slug, theme_dir):
+        remote_manifest = self.get_remote_manifest(theme_slug)
+        local_manifest = self.get_local_manifest(theme_dir)
+
+        for relative_path, etag in remote_manifest.items():
+            local_path = os.path.join(theme_dir, relative_path)
+
+            if local_manifest.get(relative_path) == etag and os.path.exists(local_path):
+                continue
+
+            theme_file = self.s3.get_object(Bucket='jkpay', Key=self.get_prefix(theme_slug) + relative_path)
+            self.write_file(local_path, theme_file['Body'].read())
+
+        for relative_path in local_manifest.keys() - remote_manifest.keys():
+            try:
+                os.remove(os.path.join(theme_dir, relative_path))
+            except FileNotFoundError:
+                pass
+
+        self.write_file(os.path.join(theme_dir, self.manifest_name), json.dumps(remote_manifest).encode())
+
+    def write_file(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write next to the target and swap it in so readers never see a partial file
+        temp_path = path + '.tmp' + str(os.getpid())
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write(content)
+
+        os.replace(temp_path, path)
+
+
+theme_mirror = ThemeMirror(
+    root=settings.THEME_MIRROR_DIR,
+    ttl=settings.THEME_MIRROR_TTL,
+)
@@ -0,0 +1,63 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Theme, ThemeConfiguration
+from .storefront import invalidate_storefront, invalidate_storefront_on_commit, delete_storefront_shop_id
+
+from file_uploads.models import ItemImage
+from groups.models import Collection
+from products.catalog import invalidate_catalog_products, invalidate_catalog_products_on_commit
+from products.models import Product
+from products.signals import stock_changed
+from shops.models import Shop
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=ThemeConfiguration)
+@receiver(post_delete, sender=ThemeConfiguration)
+def invalidate_shop_storefront(sender, instance, **kwargs):
+    invalidate_storefront_on_commit(instance.shop_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_product(sender, instance, **kwargs):
+    invalidate_catalog_products_on_commit([instance.id])
+
+
+@receiver(post_save, sender=ItemImage)
+@receiver(post_delete, sender=ItemImage)
+def invalidate_image_storefront(sender, instance, **kwargs):
+    invalidate_catalog_products_on_commit([instance.item_id])
+    invalidate_storefront_on_commit(
+        Product.objects.filter(id=instance.item_id).values_list('shop_id', flat=True).first()
+    )
+
+
+@receiver(stock_changed, sender=Product)
+def invalidate_stock_storefront(sender, product_ids, **kwargs):
+    invalidate_catalog_products(product_ids)
+
+    for shop_id in Product.objects.filter(id__in=product_ids).values_list('shop_id', flat=True).distinct():
+        invalidate_storefront(shop_id)
+
+
+@receiver(m2m_changed, sender=Collection.products.through)
+def invalidate_collection_storefront(sender, instance, **kwargs):
+    if kwargs.get('action', '').startswith('post_'):
+        invalidate_storefront_on_commit(instance.shop_id)
+
+
+@receiver(post_save, sender=Shop)
+def invalidate_shop(sender, instance, **kwargs):
+    delete_storefront_shop_id(instance.domain)
+    invalidate_storefront_on_commit(instance.id)
+
+
+@receiver(post_save, sender=Theme)
+def invalidate_theme_storefronts(sender, instance, **kwargs):
+    for shop_id in ThemeConfiguration.objects.filter(theme=instance).values_list('shop_id', flat=True):
+        invalidate_storefront_on_commit(shop_id)
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from uuid import uuid4
+
+from carts.views import has_cart_items
+from shared.services import get_form_errors
+
+
+# Per visitor values are rendered as these markers and swapped in after a cached page is read.
+CSRF_TOKEN_PLACEHOLDER = '__enfront_csrf_token__'
+USER_ID_PLACEHOLDER = '__enfront_user_id__'
+
+
+def get_storefront_version(shop_id):
+    """
+    Every cached storefront entry of a shop is keyed by the shop's current version, so bumping the version drops
+    all of them at once for every worker.
+    """
+    version_key = 'storefront:version:' + str(shop_id)
+    version = cache.get(version_key)
+
+    if version is None:
+        cache.add(version_key, uuid4().hex, None)
+        version = cache.get(version_key)
+
+    return version
+
+
+def invalidate_storefront(shop_id):
+    if shop_id is not None:
+        cache.set('storefront:version:' + str(shop_id), uuid4().hex, None)
+
+
+def invalidate_storefront_on_commit(shop_id):
+    # a request between the change and its commit would cache what it still sees under the new version, and a
+    # rolled back change needs no invalidation at all
+    transaction.on_commit(lambda: invalidate_storefront(shop_id))
+
+
+def get_storefront_shop_id(host):
+    return cache.get('storefront:host:' + host)
+
+
+def set_storefront_shop_id(host, shop_id):
+    cache.set('storefront:host:' + host, shop_id, settings.STOREFRONT_PAGE_CACHE_TTL)
+
+
+def delete_storefront_shop_id(host):
+    cache.delete('storefront:host:' + host)
+
+
+def get_page_cache_key(shop_id, version, page, item_slug):
+    return ':'.join(['storefront', 'page', str(shop_id), version, str(page), str(item_slug)])
+
+
+def is_page_cacheable(request, cart_ref):
+    """
+    Only pages that look the same for every anonymous visitor are cached: no query params (editor previews,
+    password reset links), no logged in customer, nothing in the cart and no pending form errors. Themes render the
+    cart wherever they like, so a page with items in its cart has no hole to fill and is never cached, the cart
+    itself is only loaded for those.
+    """
+    if request.query_params or request.user.is_authenticated:
+        return False
+
+    return not get_form_errors() and not has_cart_items(cart_ref)
+
+
+def get_host_page_cache_key(host, page, item_slug):
+    # None until a page of the host's shop has been rendered and stored the shop id of the host
+    shop_id = get_storefront_shop_id(host)
+
+    if shop_id is None:
+        return None
+
+    return get_page_cache_key(shop_id, get_storefront_version(shop_id), page, item_slug)
+
+
+def get_cached_page(page_cache_key):
+    return cache.get(page_cache_key)
+
+
+def set_cached_page(page_cache_key, rendered_template):
+    cache.set(page_cache_key, rendered_template, settings.STOREFRONT_PAGE_CACHE_TTL)
+
+
+def fill_page_holes(rendered_template, csrf_token, user_id):
+    return rendered_template.replace(CSRF_TOKEN_PLACEHOLDER, csrf_token).replace(USER_ID_PLACEHOLDER, str(user_id))
@@ -130,7 +130,9 @@ class FormNode(Node):
                     ctx, buffer, partial=True, block_scope=True
                 )
         else:
-            buffer.write(template.render(**args))
+            # Request data is passed to the page at render time rather than living on the environment, so the
+            # form template is rendered with the page globals for things like the csrf token.
+            buffer.write(template.render(context.globals, **args))
             self.block.render(context, buffer)
             buffer.write("\n</form>")
 
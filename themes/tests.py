@@ -1,3 +1,359 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory
 
-# Create your tests here.
+from botocore.exceptions import ClientError
+from liquid import Environment
+from liquid.exceptions import TemplateNotFound
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+import io
+import os
+import tempfile
+
+from carts.models import Cart, CartItem
+from products.models import Product
+from shared.testing import create_test_shop
+from themes.configuration import get_theme_config
+from themes.drops import MappingDrop, SequenceDrop
+from themes.environment import get_theme_environment
+from themes.loaders.cache import ThemeTemplateCache
+from themes.loaders.mirror import ThemeMirror
+from themes.models import Theme, ThemeConfiguration
+from themes.storefront import (
+    CSRF_TOKEN_PLACEHOLDER,
+    USER_ID_PLACEHOLDER,
+    fill_page_holes,
+    get_cached_page,
+    get_host_page_cache_key,
+    get_page_cache_key,
+    get_storefront_version,
+    invalidate_storefront,
+    set_cached_page,
+    set_storefront_shop_id,
+)
+from themes.views import ThemeTemplateView
+
+
+class FakeTheme:
+    def __init__(self, name):
+        self.name = name
+        self.ref_id = uuid4()
+
+
+def s3_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'GetObject')
+
+
+def s3_object(source, etag):
+    return {'Body': io.BytesIO(source.encode()), 'ETag': etag}
+
+
+class TestThemeTemplateCache(SimpleTestCase):
+    def setUp(self):
+        self.env = Environment()
+        self.theme = FakeTheme('Winterfell')
+        self.cache = ThemeTemplateCache(max_size=2, ttl=0)
+        self.cache._s3 = MagicMock()
+
+    def test_template_is_parsed_once_while_etag_matches(self):
+        self.cache._s3.get_object.side_effect = [s3_object('Hello {{ name }}', '"a"'), s3_error('304')]
+
+        first = self.cache.get_template(self.env, self.theme, 'templates/base.liquid')
+        second = self.cache.get_template(self.env, self.theme, 'templates/base.liquid')
+
+        self.assertEqual(first.render(name='Jon'), 'Hello Jon')
+        self.assertIs(first.tree, second.tree)
+        self.assertEqual(self.cache._s3.get_object.call_args.kwargs['IfNoneMatch'], '"a"')
+
+    def test_changed_etag_reparses_template(self):
+        self.cache._s3.get_object.side_effect = [s3_object('old', '"a"'), s3_object('new', '"b"')]
+
+        self.cache.get_template(self.env, self.theme, 'templates/base.liquid')
+        template = self.cache.get_template(self.env, self.theme, 'templates/base.liquid')
+
+        self.assertEqual(template.render(), 'new')
+
+    def test_missing_template_raises_not_found(self):
+        self.cache._s3.get_object.side_effect = s3_error('NoSuchKey')
+
+        with self.assertRaises(TemplateNotFound):
+            self.cache.get_template(self.env, self.theme, 'layouts/missing.liquid')
+
+    def test_least_recently_used_template_is_evicted(self):
+        self.cache.ttl = 60
+        self.cache._s3.get_object.side_effect = [s3_object(name, '"' + name + '"') for name in ('a', 'b', 'c')]
+
+        for name in ('a', 'b', 'c'):
+            self.cache.get_template(self.env, self.theme, name)
+
+        self.assertEqual([key[1] for key in self.cache._entries], ['b', 'c'])
+
+
+class TestThemeEnvironment(SimpleTestCase):
+    def test_environment_is_reused_per_theme(self):
+        theme = FakeTheme('Winterfell')
+
+        self.assertIs(get_theme_environment(theme), get_theme_environment(theme))
+        self.assertIsNot(get_theme_environment(theme), get_theme_environment(FakeTheme('Winterfell')))
+
+    def test_request_data_is_read_from_render_context(self):
+        env = get_theme_environment(FakeTheme('Winterfell'))
+        template = env.from_string("{{ 1250 | money }} {% form 'login' %}{% endform %}")
+
+        first = template.render(currency='$', csrf_token='first', shop={'name': 'The Wall'})
+        second = template.render(currency='€', csrf_token='second', shop={'name': 'The Wall'})
+
+        self.assertTrue(first.startswith('$12.50'))
+        self.assertIn('value="first"', first)
+        self.assertTrue(second.startswith('€12.50'))
+        self.assertIn('value="second"', second)
+
+
+class FakeBucket:
+    def __init__(self, files):
+        self.files = files
+        self.downloads = []
+
+    def get_paginator(self, _):
+        bucket = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                contents = [
+                    {'Key': key, 'ETag': '"' + str(hash(body)) + '"'}
+                    for key, body in bucket.files.items() if key.startswith(Prefix)
+                ]
+
+                return [{'Contents': contents}]
+
+        return Paginator()
+
+    def get_object(self, Bucket, Key):
+        self.downloads.append(Key)
+        return {'Body': io.BytesIO(self.files[Key].encode())}
+
+
+class TestThemeMirror(SimpleTestCase):
+    prefix = 'themes/templates/official/winterfell/'
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.bucket = FakeBucket({
+            self.prefix + 'fragments/header.liquid': 'Winter is coming',
+            self.prefix + 'assets/images/wolf.png': 'binary',
+        })
+
+        self.mirror = ThemeMirror(root=self.root.name, ttl=0)
+        self.mirror._s3 = self.bucket
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_only_changed_sources_are_downloaded(self):
+        path = self.mirror.get_path('winterfell', 'fragments/header.liquid')
+        self.mirror.sync('winterfell')
+
+        with open(path) as fragment:
+            self.assertEqual(fragment.read(), 'Winter is coming')
+
+        self.assertEqual(self.bucket.downloads, [self.prefix + 'fragments/header.liquid'])
+        self.assertFalse(os.path.exists(os.path.join(self.root.name, 'winterfell', 'assets')))
+
+        self.bucket.files[self.prefix + 'fragments/header.liquid'] = 'Winter is here'
+        self.mirror.sync('winterfell')
+
+        with open(path) as fragment:
+            self.assertEqual(fragment.read(), 'Winter is here')
+
+    def test_removed_sources_are_deleted(self):
+        path = self.mirror.get_path('winterfell', 'fragments/header.liquid')
+
+        del self.bucket.files[self.prefix + 'fragments/header.liquid']
+        self.mirror.sync('winterfell')
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_paths_outside_theme_are_rejected(self):
+        with self.assertRaises(FileNotFoundError):
+            self.mirror.get_path('winterfell', '../../etc/passwd')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestStorefrontCache(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        set_storefront_shop_id('winterfell.enfront.io', 1)
+        set_cached_page(get_page_cache_key(1, get_storefront_version(1), 'products', None),
+                        'page ' + CSRF_TOKEN_PLACEHOLDER)
+
+    def get_page(self, host, page):
+        page_cache_key = get_host_page_cache_key(host, page, None)
+        return None if page_cache_key is None else get_cached_page(page_cache_key)
+
+    def test_cached_page_is_found_by_host(self):
+        self.assertEqual(self.get_page('winterfell.enfront.io', 'products'), 'page ' + CSRF_TOKEN_PLACEHOLDER)
+        self.assertIsNone(self.get_page('winterfell.enfront.io', 'collections'))
+        self.assertIsNone(self.get_page('kingslanding.enfront.io', 'products'))
+
+    def test_invalidation_drops_cached_pages(self):
+        invalidate_storefront(1)
+
+        self.assertIsNone(self.get_page('winterfell.enfront.io', 'products'))
+
+    def test_holes_are_filled_per_visitor(self):
+        rendered_template = CSRF_TOKEN_PLACEHOLDER + ' ' + USER_ID_PLACEHOLDER
+
+        self.assertEqual(fill_page_holes(rendered_template, 'token', 'visitor'), 'token visitor')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestStorefrontPages(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shop = create_test_shop(domain='winterfell.enfront.io', status=1)
+        theme = Theme.objects.create(name='Winter', developer=shop.owner)
+        ThemeConfiguration.objects.create(shop=shop, theme=theme, status=1)
+        product = Product.objects.create(shop=shop, name='Longclaw', slug='longclaw', price=500, stock=10, status=1)
+
+        cls.empty_cart = Cart.objects.create(shop=shop, user=uuid4())
+        cls.full_cart = Cart.objects.create(shop=shop, user=uuid4())
+        CartItem.objects.create(cart=cls.full_cart, product=product, quantity=1)
+
+    def setUp(self):
+        cache.clear()
+
+        templates = {
+            os.path.join('templates', 'base.liquid'): Environment().from_string('{{ layout_content }}'),
+            os.path.join('layouts', 'product.liquid'): Environment().from_string('{{ product.name }}'),
+        }
+
+        patches = [
+            patch('themes.views.template_cache.get_template', side_effect=lambda env, theme, name: templates[name]),
+            patch('themes.views.get_theme_environment'),
+            patch('themes.views.get_theme_config', return_value={}),
+        ]
+
+        self.get_template = patches[0].start()
+        for other_patch in patches[1:]:
+            other_patch.start()
+
+        for started_patch in patches:
+            self.addCleanup(started_patch.stop)
+
+    def get_page(self, page, item_slug, cart=None):
+        request = APIRequestFactory().get('/' + page + '/' + item_slug, HTTP_HOST='winterfell.enfront.io')
+
+        if cart is not None:
+            request.COOKIES['_enfront_cid'] = str(cart.ref_id)
+
+        return ThemeTemplateView.as_view()(request, page=page, item_slug=item_slug)
+
+    def test_product_page_is_served_from_the_cache(self):
+        first_response = self.get_page('products', 'longclaw')
+        second_response = self.get_page('products', 'longclaw')
+
+        self.assertEqual(first_response.content, b'Longclaw')
+        self.assertEqual(second_response.content, b'Longclaw')
+        self.assertEqual(self.get_template.call_count, 2)
+
+    def test_empty_cart_is_checked_without_loading_it(self):
+        self.get_page('products', 'longclaw')
+
+        with self.assertNumQueries(1):
+            response = self.get_page('products', 'longclaw', self.empty_cart)
+
+        self.assertEqual(response.content, b'Longclaw')
+
+    def test_pages_with_cart_items_are_not_cached(self):
+        self.get_page('products', 'longclaw', self.full_cart)
+        self.get_page('products', 'longclaw', self.full_cart)
+
+        self.assertEqual(self.get_template.call_count, 4)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestThemeConfig(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+        self.shop = MagicMock(id=1)
+        self.theme = FakeTheme('Winterfell')
+        self.theme_configuration = MagicMock(file_name='config.json')
+
+        settings_patcher = patch('themes.configuration.get_theme_settings', return_value=[
+            {'name': 'Colors', 'settings': [{'id': 'color', 'default': 'grey'}, {'id': 'font', 'default': 'serif'}]},
+        ])
+        s3_patcher = patch('themes.configuration.boto3')
+
+        settings_patcher.start()
+        self.s3 = s3_patcher.start().client.return_value
+        self.s3.get_object.return_value = s3_object('{"color": "white"}', '"a"')
+
+        self.addCleanup(settings_patcher.stop)
+        self.addCleanup(s3_patcher.stop)
+
+    def test_shop_config_overlays_defaults_and_is_cached(self):
+        version = get_storefront_version(self.shop.id)
+
+        first = get_theme_config(self.shop, self.theme, self.theme_configuration, version)
+        second = get_theme_config(self.shop, self.theme, self.theme_configuration, version)
+
+        self.assertEqual(first, {'color': 'white', 'font': 'serif'})
+        self.assertEqual(first, second)
+        self.assertEqual(self.s3.get_object.call_count, 1)
+
+    def test_invalidation_reloads_config(self):
+        get_theme_config(self.shop, self.theme, self.theme_configuration, get_storefront_version(self.shop.id))
+
+        invalidate_storefront(self.shop.id)
+        self.s3.get_object.return_value = s3_object('{"color": "black"}', '"b"')
+        config = get_theme_config(self.shop, self.theme, self.theme_configuration, get_storefront_version(self.shop.id))
+
+        self.assertEqual(config['color'], 'black')
+
+    def test_s3_errors_fall_back_to_defaults_without_caching(self):
+        self.s3.get_object.side_effect = [s3_error('SlowDown'), s3_object('{"color": "white"}', '"a"')]
+        version = get_storefront_version(self.shop.id)
+
+        self.assertEqual(get_theme_config(self.shop, self.theme, self.theme_configuration, version)['color'], 'grey')
+        self.assertEqual(get_theme_config(self.shop, self.theme, self.theme_configuration, version)['color'], 'white')
+
+
+class TestDrops(SimpleTestCase):
+    def setUp(self):
+        self.env = Environment()
+        self.loads = []
+
+    def loader(self, name, value):
+        def load():
+            self.loads.append(name)
+            return value
+
+        return load
+
+    def test_unused_drops_are_not_loaded(self):
+        template = self.env.from_string('{{ user.id }}')
+        output = template.render(
+            user=MappingDrop(self.loader('user', {'id': 7})),
+            products=SequenceDrop(self.loader('products', [])),
+        )
+
+        self.assertEqual(output, '7')
+        self.assertEqual(self.loads, ['user'])
+
+    def test_drops_are_loaded_once(self):
+        template = self.env.from_string(
+            '{% for p in products %}{{ p.name }}{% endfor %} {{ products | size }} {{ products[0].name }}'
+        )
+        output = template.render(products=SequenceDrop(self.loader('products', [{'name': 'Ice'}])))
+
+        self.assertEqual(output, 'Ice 1 Ice')
+        self.assertEqual(self.loads, ['products'])
+
+    def test_missing_value_is_nil(self):
+        template = self.env.from_string('{% if product %}found{% else %}missing{% endif %}{{ product.name }}')
+
+        self.assertEqual(template.render(product=MappingDrop(lambda: None)), 'missing')
+        self.assertEqual(template.render(product=MappingDrop(lambda: {'name': 'Ice'})), 'foundIce')
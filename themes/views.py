@@ -1,9 +1,8 @@
-import botocore
-from django.utils.text import slugify
+from django.conf import settings
+from django.core.paginator import Paginator
 from django.middleware.csrf import get_token
 from django.http import HttpResponse, HttpResponseRedirect
 from django.db.models import Q
-from django.conf import settings
 
 from rest_framework import status
 from rest_framework.views import APIView
@@ -11,39 +10,45 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 
 from uuid import uuid4
-from liquid import Environment
-from liquid_extra import filters
+from liquid.exceptions import TemplateNotFound
 from babel.numbers import get_currency_symbol
 from botocore.exceptions import ClientError
 
 import os
 import boto3
-import json
 import html
 
-from .loaders.loader import CustomFileSystemLoader, FragmentTag
+from .configuration import get_config_file, get_theme_config, get_theme_settings
+from .drops import MappingDrop, SequenceDrop
+from .environment import get_theme_environment
+from .loaders.cache import template_cache
 from .models import Theme, ThemeConfiguration
 from .serializers import PublicThemeSerializer, ThemeConfigurationSerializer
-from .filters.cdn_url import cdn_url
-from .filters.collection_url import collection_url
-from .filters.media_url import media_url
-from .filters.money import money
-from .filters.product_url import product_url
-from .filters.script_url import script_url
-from .filters.style_url import style_url
-from .tags.form_tag import FormTag
+from .storefront import (
+    CSRF_TOKEN_PLACEHOLDER,
+    USER_ID_PLACEHOLDER,
+    fill_page_holes,
+    get_cached_page,
+    get_host_page_cache_key,
+    get_page_cache_key,
+    get_storefront_version,
+    invalidate_storefront,
+    is_page_cacheable,
+    set_cached_page,
+    set_storefront_shop_id,
+)
 
 from shops.models import Shop
 from shops.serializers import PublicShopSerializer
+from products.catalog import get_catalog_product, get_catalog_products, get_listed_catalog_products
 from products.models import Product
-from products.serializers import PublicProductSerializer
 from customers.models import Customer
 from customers.serializers import PublicCustomerInfoSerializer
 from shared.exceptions import CustomException
 from shared.services import get_form_errors, reset_form_errors, get_url
-from carts.views import get_users_cart, get_users_cart_items, get_cart_total
-from groups.models import Collection
-from groups.serializers import PublicCollectionSerializer
+from carts.views import get_users_cart, get_cart_details
+from groups.index import get_collection_index, get_indexed_collection
+from orders.stats import get_best_sellers
 
 
 class ThemeView(APIView):
@@ -106,25 +111,17 @@ class ThemeConfigurationView(APIView):
                 config_status=1, shop__owner=request.user, theme__ref_id=theme_ref, shop__ref_id=shop_ref
             )
 
-            save_path = os.path.join('themes', 'configurations', theme_config.file_name)
-
-            s3 = boto3.client('s3')
-            config = s3.get_object(Bucket='jkpay', Key=save_path)
-            contents = config['Body'].read().decode()
-
-            json_content = json.loads(contents)
+            storefront_version = get_storefront_version(theme_config.shop_id)
+            json_content = get_config_file(theme_config.shop_id, storefront_version, theme_config.file_name)
 
         except ThemeConfiguration.DoesNotExist:
             json_content = None
 
-        except ClientError as error:
-            if error.response['Error']['Code'] == 'NoSuchKey':
-                json_content = None
-            else:
-                raise CustomException(
-                    'An error occurred while retrieving the theme configuration.',
-                    status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        except ClientError:
+            raise CustomException(
+                'An error occurred while retrieving the theme configuration.',
+                status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
         data = {
             'success': True,
@@ -187,6 +184,9 @@ class ThemeConfigurationView(APIView):
             s3 = boto3.resource('s3')
             s3.Bucket('jkpay').put_object(Key=save_path, Body=html.escape(config_data.get('config'), quote=False))
 
+            # the configuration row was saved before the new file landed on S3, drop anything rendered in between
+            invalidate_storefront(Shop.objects.get(ref_id=config_data.get('shop')).id)
+
         data = {
             'success': True,
             'message': 'Theme configuration successfully applied.',
@@ -204,17 +204,9 @@ class ThemeSettingsView(APIView):
                 status.HTTP_422_UNPROCESSABLE_ENTITY
             )
 
-        s3 = boto3.client('s3')
-
         try:
             theme = Theme.objects.get(ref_id=theme_ref)
-            slugged_theme_name = slugify(theme.name)
-            settings_path = os.path.join(
-                'themes', 'templates', 'official', slugged_theme_name, 'config', 'settings.json'
-            )
-
-            theme_settings = s3.get_object(Bucket='jkpay', Key=settings_path)
-            settings_content = theme_settings['Body'].read().decode()
+            theme_settings = get_theme_settings(theme)
         except Theme.DoesNotExist:
             raise CustomException(
                 'Settings for theme ' + str(theme_ref) + ' were not found.',
@@ -224,7 +216,7 @@ class ThemeSettingsView(APIView):
         data = {
             'success': True,
             'message': 'Theme settings successfully found.',
-            'data': json.loads(settings_content),
+            'data': theme_settings,
         }
 
         return Response(data, status=status.HTTP_200_OK)
@@ -243,26 +235,51 @@ class ThemeTemplateView(APIView):
 
         return editor_file.read()
 
-    def get_collections(self, shop_ref):
-        collections = Collection.objects.filter(shop__ref_id=shop_ref)
-        collections_data = PublicCollectionSerializer(collections, many=True).data
-        return collections_data
+    def get_collections(self, shop, version):
+        collections = []
 
-    def get_products(self, shop_ref, collection_slug=None):
-        if collection_slug is not None:
-            try:
-                collection = Collection.objects.get(slug=collection_slug)
-            except Collection.DoesNotExist:
-                return []
+        for collection in get_collection_index(shop.id, version)['collections']:
+            collection_data = dict(collection)
+            collection_data['products'] = SequenceDrop(
+                lambda product_refs=collection['products']: get_catalog_products(shop.id, product_refs)
+            )
 
-            products = collection.products.all()
-        else:
-            products = Product.objects.filter(shop__ref_id=shop_ref, status=1).order_by('name')
+            collections.append(collection_data)
 
-        products_data = PublicProductSerializer(products, many=True).data
-        return products_data
+        return collections
 
-    def get_product(self, shop_ref, item_slug, cart=None):
+    def get_best_sellers(self, shop):
+        best_sellers = get_best_sellers(
+            shop.id,
+            settings.STOREFRONT_BEST_SELLERS_WINDOW,
+            limit=settings.STOREFRONT_BEST_SELLERS_COUNT,
+            product__status=Product.LISTED,
+        )
+
+        return get_catalog_products(shop.id, [str(ref_id) for _, ref_id, _, _ in best_sellers])
+
+    def get_products(self, shop, version, collection_slug=None, page_number=None):
+        if collection_slug is None:
+            return {'products': get_listed_catalog_products(shop.id), 'pagination': None}
+
+        collection = get_indexed_collection(shop.id, version, collection_slug)
+
+        if collection is None:
+            return {'products': [], 'pagination': None}
+
+        paginator = Paginator(collection['products'], settings.STOREFRONT_COLLECTION_PAGE_SIZE)
+        products_page = paginator.get_page(page_number)
+
+        pagination = {
+            'page': products_page.number,
+            'pages': paginator.num_pages,
+            'previous_page': products_page.previous_page_number() if products_page.has_previous() else None,
+            'next_page': products_page.next_page_number() if products_page.has_next() else None,
+        }
+
+        return {'products': get_catalog_products(shop.id, products_page.object_list), 'pagination': pagination}
+
+    def get_product(self, shop, item_slug, cart=None):
         if item_slug is None:
             return None
 
@@ -279,7 +296,7 @@ class ThemeTemplateView(APIView):
                     'nulla pariatur. Excepteur sint occaecat cupidatat non proident, '
                     'sunt in culpa qui officia deserunt mollit anim id est laborum.',
                 'price': '250',
-                'shop_id': str(shop_ref),
+                'shop_id': str(shop.ref_id),
                 'images': [{'id': 3, 'path': '/media/items/0b5458bc-5c33-45f5-85c7-74b229c820c9.jpeg'}],
                 'min_order_quantity': 1,
                 'max_order_quantity': 20,
@@ -287,19 +304,17 @@ class ThemeTemplateView(APIView):
 
             return product
 
-        try:
-            product = Product.objects.get(shop__ref_id=shop_ref, slug=item_slug)
-            product = PublicProductSerializer(product).data
-
-            # change min order quantity if a user already has the item in their cart
-            if cart is not None:
-                for cart_item in cart['items']:
-                    if product['min_order_quantity'] - cart_item['quantity'] <= 0:
-                        product['min_order_quantity'] = 1
+        product = get_catalog_product(shop.id, slug=item_slug)
 
-        except Product.DoesNotExist:
+        if product is None:
             return None
 
+        # change min order quantity if a user already has the item in their cart
+        if cart is not None:
+            for cart_item in cart['items']:
+                if product['min_order_quantity'] - cart_item['quantity'] <= 0:
+                    product['min_order_quantity'] = 1
+
         return product
 
     def get_customer(self, user, user_cookie):
@@ -335,35 +350,10 @@ class ThemeTemplateView(APIView):
         return user
 
     def get_cart(self, cart_cookie):
-        cart = get_users_cart(cart_cookie)
-        cart_items = get_users_cart_items(cart)
-        total = get_cart_total(cart_items)
-
-        cart_quantity = 0
-        for cart_item in cart_items:
-            cart_quantity += 1 * cart_item['quantity']
-
-        all_cart = {
-            "items": cart_items,
-            "items_amount": cart_quantity,
-            "total": total
-        }
-
-        return all_cart
+        if cart_cookie is None:
+            return get_cart_details(None)
 
-    def get_custom_filters(self, liquid_env):
-        liquid_env.add_filter('cdn_url', cdn_url)
-        liquid_env.add_filter('collection_url', collection_url)
-        liquid_env.add_filter('media_url', media_url)
-        liquid_env.add_filter('money', money)
-        liquid_env.add_filter('product_url', product_url)
-        liquid_env.add_filter('script_tag', filters.script_tag)
-        liquid_env.add_filter('script_url', script_url)
-        liquid_env.add_filter('slugify', slugify)
-        liquid_env.add_filter('style_url', style_url)
-        liquid_env.add_filter('stylesheet_tag', filters.stylesheet_tag)
-
-        return liquid_env
+        return get_cart_details(get_users_cart(cart_cookie))
 
     def get_reset_password_data(self, request):
         reset_data = {
@@ -373,49 +363,45 @@ class ThemeTemplateView(APIView):
 
         return reset_data
 
-    def add_item_details_to_config(self, config):
-        for key in config:
-            if isinstance(config[key], dict) and 'item' in config[key]:
-                try:
-                    product = Product.objects.get(ref_id=config[key]['id'])
-                    product_data = PublicProductSerializer(product).data
-
-                    config[key]['name'] = product_data['name']
-                    config[key]['price'] = product_data['price']
-                    config[key]['slug'] = product_data['slug']
-                    config[key]['images'] = product_data['images']
-                    config[key]['available'] = product_data['available']
-                except Product.DoesNotExist:
-                    return None
-
-    def get_default_config(self, s3, theme_name):
-        default_config = {}
-        config_template_path = os.path.join(
-            'themes',
-            'templates',
-            'official',
-            slugify(theme_name),
-            'config',
-            'settings.json'
-        )
+    def get_page_response(self, rendered_template, user_cookie, user_id):
+        response = HttpResponse(rendered_template)
 
-        config_file = s3.get_object(Bucket='jkpay', Key=config_template_path)
-        for key in json.loads(config_file['Body'].read()):
-            if isinstance(key, dict):
-                for k in key:
-                    if k == 'settings':
-                        for s in key[k]:
-                            default_config[s['id']] = s['default']
+        if user_cookie is None:
+            response.set_cookie('_enfront_uid', user_id, 604800)
 
-        return default_config
+        return response
 
     def get(self, request, page=None, item_slug=None):
+        user_cookie = request.COOKIES.get('_enfront_uid')
+        cart_cookie = request.COOKIES.get('_enfront_cid')
+
+        # anonymous visitors with an empty cart all see the same page, so it can be served from the page cache
+        # with only the csrf token and visitor id filled in
+        is_cacheable = is_page_cacheable(request, cart_cookie)
+        page_cache_key = get_host_page_cache_key(request.get_host(), page, item_slug) if is_cacheable else None
+
+        if page_cache_key is not None:
+            cached_page = get_cached_page(page_cache_key)
+
+            if cached_page is not None:
+                user_id = uuid4() if user_cookie is None else user_cookie
+                rendered_template = fill_page_holes(cached_page, get_token(request), user_id)
+
+                return self.get_page_response(rendered_template, user_cookie, user_id)
+
         try:
             shop = Shop.objects.get(domain=request.get_host())
             shop_data = PublicShopSerializer(shop).data
         except Shop.DoesNotExist:
             return HttpResponseRedirect(get_url('/404'))
 
+        storefront_version = get_storefront_version(shop.id)
+        cart = get_cart_details(None) if is_cacheable else self.get_cart(cart_cookie)
+
+        # the key is built from the page as requested, before it is turned into the name of its layout below
+        if is_cacheable and page_cache_key is None:
+            page_cache_key = get_page_cache_key(shop.id, storefront_version, page, item_slug)
+
         if request.query_params.get('themeId') is None:
             try:
                 theme = Theme.objects.get(ref_id=shop_data['current_theme']['ref_id'])
@@ -436,16 +422,19 @@ class ThemeTemplateView(APIView):
         if shop.status == 0 and request.query_params.get('editor') is None:
             return HttpResponseRedirect(get_url('/closed'))
 
-        if page == 'product' and self.get_product(shop.ref_id, item_slug) is None:
-            return HttpResponseRedirect(get_url('/404'))
+        # request data that needs queries is only loaded if the page's templates use it
+        product = MappingDrop(lambda: self.get_product(shop, item_slug, cart))
+        products = MappingDrop(
+            lambda: self.get_products(shop, storefront_version, item_slug, request.query_params.get('page'))
+        )
 
-        user_cookie = request.COOKIES.get('_enfront_uid')
-        cart_cookie = request.COOKIES.get('_enfront_cid')
-        cart = self.get_cart(cart_cookie)
+        if page == 'product' and product.value is None:
+            return HttpResponseRedirect(get_url('/404'))
 
         template_data = {
+            'best_sellers': SequenceDrop(lambda: self.get_best_sellers(shop)),
             'cart': cart,
-            'collections': self.get_collections(shop.ref_id),
+            'collections': SequenceDrop(lambda: self.get_collections(shop, storefront_version)),
             'csrf_token': get_token(request),
             'currency': get_currency_symbol(shop.currency),
             'form_errors': get_form_errors(),
@@ -456,55 +445,33 @@ class ThemeTemplateView(APIView):
                     1: item_slug
                 }
             },
-            'product': self.get_product(shop.ref_id, item_slug, cart),
-            'products': self.get_products(shop.ref_id, item_slug),
+            'product': product,
+            'pagination': MappingDrop(lambda: products['pagination']),
+            'products': SequenceDrop(lambda: products['products']),
             'reset_data': self.get_reset_password_data(request),
             'shop': shop_data,
             'theme': theme,
-            'user': self.get_customer(request.user, user_cookie),
+            'user': MappingDrop(lambda: self.get_customer(request.user, user_cookie)),
         }
 
-        env = Environment(
-            loader=CustomFileSystemLoader(os.path.join(settings.BASE_DIR, 'themes')),
-            globals=template_data
-        )
-
-        self.get_custom_filters(env)
-        env.add_tag(FragmentTag)
-        env.add_tag(FormTag)
+        if is_cacheable:
+            user_id = template_data['user']['id']
+            template_data['csrf_token'] = CSRF_TOKEN_PLACEHOLDER
+            template_data['user'] = {**template_data['user'], 'id': USER_ID_PLACEHOLDER}
 
-        s3 = boto3.client('s3')
+        env = get_theme_environment(theme)
 
         if page == 'products' and item_slug is not None:
             page = 'product'
         elif page == 'collections' and item_slug is not None:
             page = 'collection'
 
-        try:
-            theme_template_path = os.path.join(
-                'themes',
-                'templates',
-                'official',
-                slugify(theme.name),
-                'templates',
-                'base.liquid'
-            )
-
-            layout_template_path = os.path.join(
-                'themes',
-                'templates',
-                'official',
-                slugify(theme.name),
-                'layouts',
-                ('index' if page is None else page) + '.liquid',
-            )
-
-            liquid_file = s3.get_object(Bucket='jkpay', Key=theme_template_path)
-            liquid_file_decoded = env.from_string(liquid_file['Body'].read().decode('utf_8'))
+        layout_name = os.path.join('layouts', ('index' if page is None else page) + '.liquid')
 
-            layout_liquid_file = s3.get_object(Bucket='jkpay', Key=layout_template_path)
-            layout_liquid_file_decoded = env.from_string(layout_liquid_file['Body'].read().decode('utf_8'))
-        except s3.exceptions.NoSuchKey:
+        try:
+            liquid_file_decoded = template_cache.get_template(env, theme, os.path.join('templates', 'base.liquid'))
+            layout_liquid_file_decoded = template_cache.get_template(env, theme, layout_name)
+        except TemplateNotFound:
             return HttpResponseRedirect(get_url('/404'))
 
         try:
@@ -518,33 +485,18 @@ class ThemeTemplateView(APIView):
                 status.HTTP_404_NOT_FOUND,
             )
 
-        if config.file_name != '':
-            theme_config_path = os.path.join(
-                'themes',
-                'configurations',
-                config.file_name
-            )
+        theme_config = get_theme_config(shop, theme, config, storefront_version)
 
-            try:
-                config_file = s3.get_object(Bucket='jkpay', Key=theme_config_path)
-                config_file_decoded = json.load(config_file['Body'])
-                self.add_item_details_to_config(config_file_decoded)
-
-                page_render = layout_liquid_file_decoded.render(**config_file_decoded)
-                rendered_template = liquid_file_decoded.render(layout_content=page_render)
-            except botocore.exceptions.ClientError:
-                default_config = self.get_default_config(s3, theme.name)
-                page_render = layout_liquid_file_decoded.render(**default_config)
-                rendered_template = liquid_file_decoded.render(layout_content=page_render)
-        else:
-            default_config = self.get_default_config(s3, theme.name)
-            page_render = layout_liquid_file_decoded.render(**default_config)
-            rendered_template = liquid_file_decoded.render(layout_content=page_render)
+        page_render = layout_liquid_file_decoded.render({**template_data, **theme_config})
+        rendered_template = liquid_file_decoded.render(template_data, layout_content=page_render)
 
         reset_form_errors()
-        response = HttpResponse(rendered_template)
 
-        if user_cookie is None:
-            response.set_cookie('_enfront_uid', template_data['user']['id'], 604800)
+        if is_cacheable:
+            set_storefront_shop_id(request.get_host(), shop.id)
+            set_cached_page(page_cache_key, rendered_template)
+            rendered_template = fill_page_holes(rendered_template, get_token(request), user_id)
+        else:
+            user_id = template_data['user']['id'] if user_cookie is None else user_cookie
 
-        return response
+        return self.get_page_response(rendered_template, user_cookie, user_id)
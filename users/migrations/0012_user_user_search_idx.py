@@ -0,0 +1,19 @@
+# Generated by Django 4.1.1 on 2026-10-18 04:31
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_alter_user_table'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector(models.Func(models.F('email'), models.Value('@.-_+'), models.Value('     '), function='TRANSLATE'), models.Func(models.F('first_name'), models.Value('@.-_+'), models.Value('     '), function='TRANSLATE'), models.Func(models.F('last_name'), models.Value('@.-_+'), models.Value('     '), function='TRANSLATE'), config='simple'), name='user_search_idx'),
+        ),
+    ]
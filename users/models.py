@@ -1,3 +1,4 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
@@ -7,6 +8,7 @@ from uuid import uuid4
 from .managers import CustomUserManager
 
 from shared.models import TimestampedModel
+from shared.search import get_search_document
 
 
 # Create your models here.
@@ -37,6 +39,8 @@ class User(AbstractBaseUser, PermissionsMixin, TimestampedModel):
 
     class Meta:
         db_table = 'user'
+        # customers.search matches users against this same document
+        indexes = [GinIndex(get_search_document('email', 'first_name', 'last_name'), name='user_search_idx')]
 
     def __str__(self):
         return str(self.ref_id)
@@ -30,7 +30,8 @@ from .tokens import account_activation_token, forgot_password_token
 
 from shared.exceptions import CustomException
 from shared.recaptcha_validation import RecaptchaValidation
-from shared.services import send_mailgun_email, create_form_errors, get_url
+from shared.outbox import queue_email
+from shared.services import create_form_errors, get_url
 from shops.models import Shop
 
 
@@ -96,7 +97,7 @@ class RegisterUserView(APIView):
             context
         )
 
-        send_mailgun_email(user.email, email_subject, email_body, 'auth')
+        queue_email(user.email, email_subject, email_body, 'auth')
 
     def create_email_two_factor(self, user):
         MFAMethod.objects.create(
@@ -188,7 +189,7 @@ class ForgotPasswordView(APIView):
             context
         )
 
-        send_mailgun_email(user.email, email_subject, email_body, 'auth')
+        queue_email(user.email, email_subject, email_body, 'auth')
 
     def post(self, request):
         forgot_data = request.data